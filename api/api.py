@@ -1,10 +1,15 @@
 """api.py"""
 
-from fastapi import FastAPI
-from datetime import datetime
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from email.utils import formatdate, parsedate_to_datetime
+import hashlib
+import io
 import pandas as pd
+import pyarrow as pa
 import logging
-from glob import glob
 
 logger = logging.getLogger(__name__)
 
@@ -14,10 +19,44 @@ import os
 
 # import yfinance as yf
 
-TODAY = datetime.today().strftime("%Y-%m-%d")
+import threading
+
+import catalog
+import indicators
+import metrics
+import store
+from api.cache import SnapshotCache
+from api.compression import CompressionMiddleware
+
 app = FastAPI()
+app.add_middleware(CompressionMiddleware)
 
 DATA_DIR = os.getenv("DATA_DIR", "/data")
+API_CACHE_BYTES = int(os.getenv("API_CACHE_BYTES", str(256 * 1024 * 1024)))
+SNAPSHOT_CACHE = SnapshotCache(API_CACHE_BYTES)
+
+NDJSON = "application/x-ndjson"
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+BULK_FORMATS = {"ndjson": NDJSON, "arrow": ARROW_STREAM}
+# Arrow responses are in long format, one row per (symbol, section, index, column)
+BULK_SCHEMA = pa.schema(
+    [
+        ("symbol", pa.string()),
+        ("date", pa.string()),
+        ("section", pa.string()),
+        ("index", pa.string()),
+        ("column", pa.string()),
+        ("value", pa.float64()),
+        ("text", pa.string()),
+    ]
+)
+
+
+@app.on_event("startup")
+def build_catalog():
+    """Index existing data in the background the first time the API starts."""
+    if catalog.is_empty():
+        threading.Thread(target=catalog.rebuild, daemon=True).start()
 
 
 @app.get("/")
@@ -25,23 +64,420 @@ async def root():
     return {"message": "OK"}
 
 
+@metrics.collector
+def cache_metrics():
+    """Export the snapshot cache counters on every scrape."""
+    metrics.CACHE_REQUESTS.set_total(SNAPSHOT_CACHE.hits, result="hit")
+    metrics.CACHE_REQUESTS.set_total(SNAPSHOT_CACHE.misses, result="miss")
+    metrics.CACHE_BYTES.set(SNAPSHOT_CACHE.size)
+
+
+@app.get("/metrics")
+def get_metrics():
+    """Metrics of the API process in the Prometheus text format."""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+def to_jsonable(data):
+    """Convert the DataFrame sections of a snapshot into JSON friendly dicts."""
+    out = {}
+    for section, value in data.items():
+        if isinstance(value, pd.DataFrame):
+            value = json.loads(value.to_json(date_format="iso"))
+        out[section] = value
+    return out
+
+
+def encode_snapshot(symbol, date):
+    """Read a snapshot and serialize it once to JSON bytes."""
+    data = to_jsonable(store.read_snapshot(symbol, date))
+    return json.dumps(data, default=str).encode("utf-8")
+
+
+def validators(paths, *params):
+    """
+    ETag and Last-Modified of a response built from `paths`.
+
+    The ETag changes whenever one of the files (or the request parameters)
+    changes, it is weak since the body may be served compressed.
+    """
+    stamps = [(path, os.stat(path).st_mtime_ns) for path in paths]
+    digest = hashlib.blake2b(
+        repr((stamps, params)).encode("utf-8"), digest_size=16
+    ).hexdigest()
+    newest = max((mtime for _, mtime in stamps), default=0)
+    return f'W/"{digest}"', formatdate(newest / 1e9, usegmt=True)
+
+
+def not_modified(request, etag, last_modified):
+    """Check the conditional headers of a request against our validators."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or etag.removeprefix("W/") in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+            return parsedate_to_datetime(last_modified) <= since
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+async def conditional(request, paths, *params):
+    """Validator headers, and a 304 response if the client copy is current."""
+    etag, last_modified = await run_in_threadpool(validators, paths, *params)
+    headers = {"ETag": etag, "Last-Modified": last_modified}
+    if not_modified(request, etag, last_modified):
+        return headers, Response(status_code=304, headers=headers)
+    return headers, None
+
+
 @app.get("/symbol/{symbol}")
-async def get_symbol(symbol):
-    print(f"Getting symbol data for {symbol}")
+async def get_symbol(symbol, request: Request):
+    logger.debug("Getting symbol data for %s", symbol)
     # symbol = symbol.strip().replace("/", "").upper()
     try:
-        fname = f"{DATA_DIR}/MIDAS/{TODAY}-{symbol}.json"
-        print(f"Looking for {fname}")
-        with open(fname, "r") as file:
-            data = json.load(file)
+        today = store.today()
+        path = store.snapshot_path(symbol, today)
+        logger.debug("Looking for %s", path)
+        headers, unchanged = await conditional(request, [path])
+        if unchanged is not None:
+            return unchanged
+        body = await run_in_threadpool(
+            SNAPSHOT_CACHE.get, path, lambda: encode_snapshot(symbol, today)
+        )
 
-        return data
+        return Response(content=body, media_type="application/json", headers=headers)
     except Exception as err:
         logger.info("No symbol found")
         return {"message": f"No symbol found {err}"}
 
 
+def encode_section(symbol, section, date, columns, start, end):
+    """Read only the requested part of a section and serialize it to JSON bytes."""
+    value = store.read_section(symbol, section, date, columns, start, end)
+    return json.dumps(to_jsonable({section: value})[section], default=str).encode(
+        "utf-8"
+    )
+
+
+@app.get("/symbol/{symbol}/{section}")
+async def get_symbol_section(
+    symbol: str,
+    section: str,
+    request: Request,
+    date: str | None = None,
+    start: str | None = None,
+    end: str | None = None,
+    columns: str | None = None,
+):
+    """
+    One section of a snapshot, ex. ``/symbol/AAPL/1mo_hist?start=2024-05-01``.
+
+    `date` picks the snapshot (latest by default), `start`/`end` the rows (or
+    period columns of statements) and `columns` a comma separated subset of
+    columns (or keys of ``info``).
+    """
+    date = date or await run_in_threadpool(store.latest_date, symbol)
+    if date is None:
+        raise HTTPException(status_code=404, detail=f"No symbol found {symbol}")
+    selected = columns.split(",") if columns else None
+    params = (section, columns, start, end)
+    try:
+        fname = await run_in_threadpool(store.section_file, symbol, section, date)
+        headers, unchanged = await conditional(request, [fname], *params)
+        if unchanged is not None:
+            return unchanged
+        body = await run_in_threadpool(
+            SNAPSHOT_CACHE.get,
+            fname,
+            lambda: encode_section(symbol, section, date, selected, start, end),
+            params,
+        )
+    except (FileNotFoundError, KeyError) as err:
+        raise HTTPException(status_code=404, detail=f"No section found {err}") from err
+    except (ValueError, pa.ArrowException) as err:
+        raise HTTPException(status_code=400, detail=str(err)) from err
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def read_sections(symbol, date, sections=None):
+    """The requested sections of a snapshot (all of them by default)."""
+    if sections is None:
+        return store.read_snapshot(symbol, date)
+    data = {}
+    for section in sections:
+        try:
+            data[section] = store.read_section(symbol, section, date)
+        except KeyError:
+            continue
+    return data
+
+
+def encode_bulk_line(symbol, date, sections):
+    """One NDJSON line holding the requested sections of a snapshot."""
+    line = {
+        "symbol": symbol,
+        "date": date,
+        "sections": to_jsonable(read_sections(symbol, date, sections)),
+    }
+    return (json.dumps(line, default=str) + "\n").encode("utf-8")
+
+
+def iter_ndjson(dates, sections):
+    """NDJSON body of a bulk request, one line per symbol."""
+    key = ("bulk", tuple(sections) if sections else None)
+    for symbol, date in dates.items():
+        if date is None:
+            line = {"symbol": symbol, "error": "No symbol found"}
+            yield (json.dumps(line) + "\n").encode("utf-8")
+            continue
+        try:
+            yield SNAPSHOT_CACHE.get(
+                store.snapshot_path(symbol, date),
+                lambda: encode_bulk_line(symbol, date, sections),
+                key,
+            )
+        except (FileNotFoundError, ValueError, pa.ArrowException) as err:
+            line = {"symbol": symbol, "date": date, "error": str(err)}
+            yield (json.dumps(line) + "\n").encode("utf-8")
+
+
+def _long_rows(value):
+    """(index, column, item) triples of a section value."""
+    if isinstance(value, pd.DataFrame):
+        for column in value.columns:
+            for index, item in value[column].items():
+                index = index.isoformat() if hasattr(index, "isoformat") else index
+                yield str(index), str(column), item
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            yield str(key), "value", item
+    elif isinstance(value, list):
+        for pos, item in enumerate(value):
+            yield str(pos), "value", item
+    else:
+        yield "", "value", value
+
+
+def long_batch(symbol, date, section, value):
+    """A section as an Arrow record batch in the long bulk format."""
+    columns = {name: [] for name in BULK_SCHEMA.names}
+    for index, column, item in _long_rows(value):
+        number, text = None, None
+        if pd.api.types.is_number(item) and not pd.isna(item):
+            number = float(item)
+        elif isinstance(item, str):
+            text = item
+        elif item is not None and not (pd.api.types.is_scalar(item) and pd.isna(item)):
+            text = json.dumps(item, default=str)
+        for name, cell in zip(
+            BULK_SCHEMA.names, (symbol, date, section, index, column, number, text)
+        ):
+            columns[name].append(cell)
+    return pa.RecordBatch.from_pydict(columns, schema=BULK_SCHEMA)
+
+
+def iter_arrow(dates, sections):
+    """Arrow IPC stream body of a bulk request, one batch per symbol section."""
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, BULK_SCHEMA) as writer:
+        for symbol, date in dates.items():
+            if date is None:
+                continue
+            try:
+                data = read_sections(symbol, date, sections)
+            except (FileNotFoundError, ValueError, pa.ArrowException) as err:
+                logger.info("Skipping %s in bulk response - %s", symbol, err)
+                continue
+            for section, value in data.items():
+                writer.write_batch(long_batch(symbol, date, section, value))
+                yield sink.getvalue()
+                sink.seek(0)
+                sink.truncate()
+    yield sink.getvalue()
+
+
+class BulkRequest(BaseModel):
+    """Body of a bulk request, for symbol lists too long for a query string."""
+
+    symbols: list[str]
+    sections: list[str] | None = None
+    date: str | None = None
+    format: str = "ndjson"
+
+
+def snapshot_dates(symbols, date=None):
+    """Snapshot date of each symbol, its latest by default, None when missing."""
+    if date is None:
+        return store.latest_dates(symbols)
+    return {
+        symbol: date if store.has_snapshot(symbol, date) else None for symbol in symbols
+    }
+
+
+async def bulk_response(request, symbols, sections, date, fmt):
+    """Stream the requested sections of many snapshots in one response."""
+    if fmt not in BULK_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format {fmt}")
+    dates = await run_in_threadpool(snapshot_dates, symbols, date)
+    paths = [store.snapshot_path(symbol, day) for symbol, day in dates.items() if day]
+    headers, unchanged = await conditional(request, paths, dates, sections, fmt)
+    if unchanged is not None:
+        return unchanged
+    body = (
+        iter_ndjson(dates, sections) if fmt == "ndjson" else iter_arrow(dates, sections)
+    )
+    return StreamingResponse(body, media_type=BULK_FORMATS[fmt], headers=headers)
+
+
+@app.get("/bulk")
+async def get_bulk(
+    request: Request,
+    symbols: str,
+    sections: str | None = None,
+    date: str | None = None,
+    format: str = "ndjson",  # pylint: disable=redefined-builtin
+):
+    """
+    Many snapshots in one streamed response, ex. ``/bulk?symbols=AAPL,MSFT``.
+
+    `sections` is a comma separated subset of sections (all by default), `date`
+    the snapshot date (latest per symbol by default) and `format` either
+    ``ndjson`` (one line per symbol) or ``arrow`` (Arrow IPC stream in long
+    format). Send ``If-None-Match`` with the previous ETag to get a 304 when
+    nothing changed.
+    """
+    return await bulk_response(
+        request,
+        list(dict.fromkeys(symbols.split(","))),
+        sections.split(",") if sections else None,
+        date,
+        format,
+    )
+
+
+@app.post("/bulk")
+async def post_bulk(request: Request, query: BulkRequest):
+    """Same as ``GET /bulk`` with the symbols in a JSON body."""
+    return await bulk_response(
+        request,
+        list(dict.fromkeys(query.symbols)),
+        query.sections,
+        query.date,
+        query.format,
+    )
+
+
+def encode_latest_indicators(symbols, names):
+    """Latest indicator values from the saved per-ticker states as JSON bytes."""
+    latest = indicators.latest(symbols)
+    out = {}
+    for ticker, row in latest.iterrows():
+        day = (
+            pd.Timestamp(row["date"])
+            .tz_localize(None)
+            .isoformat(timespec="milliseconds")
+        )
+        values = row.drop("date")
+        if names:
+            values = values[values.index.isin(names)]
+        out[ticker] = {
+            name: {day: None if pd.isna(value) else value}
+            for name, value in values.items()
+        }
+    return json.dumps(out).encode("utf-8")
+
+
+def encode_indicators(symbols, names, start, end):
+    """Indicators of `symbols` (all stored series if None) as JSON bytes."""
+    result = indicators.indicators(symbols)
+    out = {}
+    if result.empty:
+        return b"{}"
+    if names:
+        result = result.loc[:, result.columns.get_level_values("indicator").isin(names)]
+    result = result.loc[start:end]
+    for ticker in result.columns.unique("ticker"):
+        frame = result.xs(ticker, axis=1, level="ticker")
+        out[ticker] = json.loads(frame.to_json(date_format="iso"))
+    return json.dumps(out).encode("utf-8")
+
+
+@app.get("/indicators/{symbol}")
+async def get_symbol_indicators(
+    symbol: str,
+    names: str | None = None,
+    start: str | None = None,
+    end: str | None = None,
+):
+    """Technical indicators of one symbol, ex. ``/indicators/AAPL?names=rsi``."""
+    body = await run_in_threadpool(
+        encode_indicators,
+        [symbol],
+        names.split(",") if names else None,
+        start,
+        end,
+    )
+    return Response(content=body, media_type="application/json")
+
+
+@app.get("/indicators")
+async def get_indicators(
+    symbols: str | None = None,
+    names: str | None = None,
+    start: str | None = None,
+    end: str | None = None,
+):
+    """
+    Technical indicators of many symbols (all stored series by default).
+
+    Without `start`/`end` only the latest values are returned, straight from
+    the indicator states kept up to date by the history sync.
+    """
+    symbols = symbols.split(",") if symbols else None
+    names = names.split(",") if names else None
+    if start is None and end is None:
+        body = await run_in_threadpool(encode_latest_indicators, symbols, names)
+    else:
+        body = await run_in_threadpool(encode_indicators, symbols, names, start, end)
+    return Response(content=body, media_type="application/json")
+
+
 @app.get("/files")
-async def get_files():
-    files = glob(f"{DATA_DIR}/MIDAS/*")
-    return json.dumps(files)
+async def get_files(
+    ticker: str | None = None,
+    start: str | None = None,
+    end: str | None = None,
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+):
+    """Stored snapshots, newest first, one page at a time."""
+    return await run_in_threadpool(
+        catalog.snapshots, limit, offset, ticker=ticker, start=start, end=end
+    )
+
+
+@app.get("/catalog")
+async def get_catalog(
+    ticker: str | None = None,
+    start: str | None = None,
+    end: str | None = None,
+    kind: str | None = None,
+    section: str | None = None,
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+):
+    """Catalog entries (sections, histories, Alpha Vantage results), paginated."""
+    return await run_in_threadpool(
+        catalog.query,
+        limit,
+        offset,
+        ticker=ticker,
+        start=start,
+        end=end,
+        kind=kind,
+        section=section,
+    )
@@ -0,0 +1,53 @@
+"""Read-through cache of encoded snapshots for the API.
+
+Entries are keyed by path (and optionally the request parameters) and hold the
+response body already serialized, they are invalidated when the path's mtime
+changes and evicted least recently used first once the cache holds more than
+``max_bytes``.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+
+class SnapshotCache:
+    """Size-bounded LRU of encoded response bodies, validated by mtime."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, path, load, key=None):
+        """
+        Cached body of `path`, calling `load()` to build it on a miss.
+
+        `key` tells apart several bodies built from the same path, ex. different
+        columns of one section. Blocking (it stats the path), run it off the
+        event loop.
+        """
+        mtime = os.stat(path).st_mtime_ns
+        key = path if key is None else (path, key)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == mtime:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        body = load()
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old[1])
+            self.entries[key] = (mtime, body)
+            self.size += len(body)
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+        return body
@@ -0,0 +1,130 @@
+"""Response compression for the API.
+
+Bodies are compressed with zstd when the client accepts it and ``zstandard`` is
+installed, gzip otherwise. Streamed responses are compressed chunk by chunk and
+flushed after every chunk so clients can decode them as they arrive.
+"""
+
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # optional, gzip only without it
+    zstandard = None
+
+MIN_SIZE = 1024
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def accepted_encoding(header):
+    """Best encoding we support in an ``Accept-Encoding`` header, or None."""
+    accepted = set()
+    for item in header.split(","):
+        token, _, params = item.strip().partition(";")
+        quality = params.strip()
+        if quality.startswith("q=") and quality[2:].strip() in ("0", "0.0", "0.00"):
+            continue
+        accepted.add(token.strip().lower())
+    if zstandard is not None and "zstd" in accepted:
+        return "zstd"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+class _Compressor:
+    """Incremental compressor with the same interface for gzip and zstd."""
+
+    def __init__(self, encoding):
+        if encoding == "zstd":
+            self.obj = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+            self.sync = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        else:
+            self.obj = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+            self.sync = zlib.Z_SYNC_FLUSH
+
+    def chunk(self, data):
+        return self.obj.compress(data) + self.obj.flush(self.sync)
+
+    def finish(self, data=b""):
+        return self.obj.compress(data) + self.obj.flush()
+
+
+def _vary(headers):
+    """Response headers with ``Accept-Encoding`` added to ``Vary``."""
+    result, found = [], False
+    for key, value in headers:
+        if key.lower() == b"vary":
+            found = True
+            fields = [field.strip().lower() for field in value.split(b",")]
+            if b"accept-encoding" not in fields and b"*" not in fields:
+                value += b", Accept-Encoding"
+        result.append((key, value))
+    if not found:
+        result.append((b"vary", b"Accept-Encoding"))
+    return result
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing responses of at least `minimum_size` bytes."""
+
+    def __init__(self, app, minimum_size=MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        encoding = accepted_encoding(headers.get(b"accept-encoding", b"").decode())
+        start = None
+        compressor = None
+
+        async def compressing_send(message):
+            nonlocal start, compressor
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                if any(
+                    key.lower() == b"content-encoding" for key, _ in start["headers"]
+                ):
+                    await send(start)
+                    start = None
+                    await send(message)
+                    return
+                # the body depends on Accept-Encoding even when it goes out as is
+                response_headers = _vary(start["headers"])
+                skip = (
+                    encoding is None
+                    or start["status"] in (204, 304)
+                    or (not more_body and len(body) < self.minimum_size)
+                )
+                if skip:
+                    await send(dict(start, headers=response_headers))
+                    start = None
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding)
+                response_headers = [
+                    (key, value)
+                    for key, value in response_headers
+                    if key.lower() != b"content-length"
+                ]
+                response_headers.append((b"content-encoding", encoding.encode()))
+                await send(dict(start, headers=response_headers))
+
+            data = compressor.chunk(body) if more_body else compressor.finish(body)
+            await send(
+                {"type": "http.response.body", "body": data, "more_body": more_body}
+            )
+
+        await self.app(scope, receive, compressing_send)
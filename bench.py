@@ -0,0 +1,448 @@
+"""Offline replay benchmarks of the fetch pipeline, the store, the API and the dashboard.
+
+Provider responses (yfinance, Alpha Vantage, EDGAR, Wikipedia) are recorded
+once from the live services:
+
+    python bench.py --record --tickers AAPL,MSFT,RXT
+
+and every later run replays them from a local stand-in (``standin.py``) with
+the recorded provider latency and without rate limits, so only our own code is
+measured:
+
+    python bench.py
+
+A run measures worker throughput (tickers/min per lane), snapshot write/read
+cost, API p50/p99 latency under concurrent load and dashboard render time, in
+a scratch DATA_DIR under BENCH_DIR. Results are appended to
+``{BENCH_DIR}/results.jsonl`` with the commit they ran on and compared with the
+last run of another commit, ``--check`` exits non-zero on a regression.
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import statistics
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+BENCH_DIR = os.getenv("BENCH_DIR", "/tmp/midas-bench")
+# The modules below read their settings at import, point them at scratch data
+os.environ["DATA_DIR"] = f"{BENCH_DIR}/data"
+os.environ.setdefault("ALPHA_VANTAGE_API_KEY", "replay")
+
+# pylint: disable=wrong-import-position
+import pandas as pd
+import requests
+
+import edgar
+import engine
+import history
+import httpclient
+import metrics
+import ratelimit
+import shared
+import standin
+import store
+import universe
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.environ["DATA_DIR"]
+FIXTURES_DIR = os.getenv("BENCH_FIXTURES", f"{BENCH_DIR}/fixtures")
+RESULTS = os.getenv("BENCH_RESULTS", f"{BENCH_DIR}/results.jsonl")
+# A result this much worse than the previous commit's is a regression
+TOLERANCE = float(os.getenv("BENCH_TOLERANCE", "0.1"))
+WORKERS = int(os.getenv("WORKERS", "16"))
+DEFAULT_TICKERS = ["AAPL", "MSFT", "NVDA", "AMZN", "JPM", "XOM", "RXT", "VOO"]
+SEC_FORMS = ["10-K", "10-Q", "8-K"]
+ALPHA_FUNCTIONS = ["GLOBAL_QUOTE", "TIME_SERIES_DAILY", "EARNINGS"]
+# Snapshots written per ticker by the store benchmark, one per day
+STORE_DAYS = 5
+# Requests/sec per provider while replaying, the stand-in has no limits
+REPLAY_RATE = 1000.0
+PAGES = ("midas.py", "pages/1_get_data.py")
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _secs(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def _per_min(count, secs):
+    return round(count / secs * 60, 1) if secs > 0 else 0.0
+
+
+def _ms(secs):
+    return round(secs * 1000, 2)
+
+
+def bench_workers(tickers, workers=WORKERS):
+    """
+    Run every worker lane over the tickers once.
+
+    Returns:
+        dict: Tickers (or calls) per minute of each lane, secs of the rest.
+    """
+    results = {}
+    jobs = [(ticker, True) for ticker in tickers]
+    secs = _secs(engine.run, shared.fetch_stock_data, jobs, workers)
+    results["stocks_per_min"] = _per_min(len(tickers), secs)
+
+    secs = _secs(history.sync_history_batch, tickers)
+    results["prices_per_min"] = _per_min(len(tickers), secs)
+
+    jobs = [(ticker, tuple(SEC_FORMS), 2) for ticker in tickers]
+    secs = _secs(engine.run, edgar.sync_ticker, jobs, workers)
+    results["sec_per_min"] = _per_min(len(tickers), secs)
+
+    calls = [
+        shared.alpha_call(function, ticker)
+        for ticker in tickers
+        for function in ALPHA_FUNCTIONS
+    ]
+    secs = _secs(shared.run_alpha_schedule, calls)
+    results["alpha_calls_per_min"] = _per_min(len(calls), secs)
+
+    try:
+        results["wikipedia_secs"] = round(
+            _secs(universe.refresh_sp500) + _secs(shared.refresh_ndxt), 3
+        )
+    except Exception as err:  # a missing page only loses its result
+        logger.error("Wikipedia lane failed - %s", err)
+    return results
+
+
+def _next_day(value):
+    """A section as it could look the next day, time series get one more row."""
+    if isinstance(value, pd.DataFrame) and isinstance(value.index, pd.DatetimeIndex):
+        if len(value):
+            row = value.tail(1)
+            row.index = row.index + pd.Timedelta(days=1)
+            return pd.concat([value, row])
+    return value
+
+
+def bench_store(tickers):
+    """
+    Write STORE_DAYS more snapshots of every fetched ticker and read them back.
+
+    Returns:
+        dict: Mean write and read time and bytes written per snapshot.
+    """
+    writes, reads = [], []
+    count, written = metrics.SNAPSHOT_BYTES.totals()
+    for ticker in tickers:
+        latest = store.latest_date(ticker)
+        if latest is None:
+            continue
+        data = store.read_snapshot(ticker, latest)
+        for day in range(1, STORE_DAYS + 1):
+            data = {section: _next_day(value) for section, value in data.items()}
+            when = (date.fromisoformat(latest) + timedelta(days=day)).isoformat()
+            writes.append(_secs(store.write_snapshot, ticker, data, when))
+            reads.append(_secs(store.read_snapshot, ticker, when))
+    if not writes:
+        logger.warning("No snapshots to benchmark the store with")
+        return {}
+    after_count, after_written = metrics.SNAPSHOT_BYTES.totals()
+    return {
+        "snapshot_write_ms": _ms(statistics.mean(writes)),
+        "snapshot_read_ms": _ms(statistics.mean(reads)),
+        "snapshot_bytes": round((after_written - written) / (after_count - count)),
+    }
+
+
+def _api_paths(tickers):
+    """Request mix of the API benchmark: snapshots, sections and a bulk read."""
+    paths = []
+    for ticker in tickers:
+        latest = store.latest_date(ticker)
+        if latest is None:
+            continue
+        paths.append(f"/symbol/{ticker}")
+        paths += [
+            f"/symbol/{ticker}/{section}"
+            for section in store.list_sections(ticker, latest)[:3]
+        ]
+    if paths:
+        paths.append(f"/bulk?symbols={','.join(tickers)}")
+    return paths
+
+
+def bench_api(tickers, requests_count=2000, concurrency=32):
+    """
+    Serve the API with uvicorn and load it from `concurrency` clients.
+
+    Returns:
+        dict: Latency percentiles, throughput and cache hit rate.
+    """
+    import uvicorn  # pylint: disable=import-outside-toplevel
+
+    from api import api  # pylint: disable=import-outside-toplevel
+
+    paths = _api_paths(tickers)
+    if not paths:
+        logger.warning("No snapshots to benchmark the API with")
+        return {}
+
+    server = uvicorn.Server(
+        uvicorn.Config(api.app, host="127.0.0.1", port=0, log_level="warning")
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    base_url = f"http://127.0.0.1:{port}"
+
+    # plain sessions, httpclient would send the requests to the stand-in
+    local = threading.local()
+
+    def call(path):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        start = time.perf_counter()
+        local.session.get(f"{base_url}{path}").raise_for_status()
+        return time.perf_counter() - start
+
+    hits, misses = api.SNAPSHOT_CACHE.hits, api.SNAPSHOT_CACHE.misses
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        latencies = list(
+            pool.map(call, [paths[pos % len(paths)] for pos in range(requests_count)])
+        )
+    elapsed = time.perf_counter() - start
+    server.should_exit = True
+    thread.join()
+
+    hits = api.SNAPSHOT_CACHE.hits - hits
+    lookups = hits + api.SNAPSHOT_CACHE.misses - misses
+    percentiles = statistics.quantiles(latencies, n=100)
+    return {
+        "api_p50_ms": _ms(percentiles[49]),
+        "api_p99_ms": _ms(percentiles[98]),
+        "api_rps": round(requests_count / elapsed, 1),
+        "api_cache_hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+    }
+
+
+def bench_dashboard(pages=PAGES):
+    """
+    Render every dashboard page with Streamlit's app tester, cold then warm.
+
+    Returns:
+        dict: Render time of each page and the number of exceptions raised.
+    """
+    # pylint: disable=import-outside-toplevel
+    from streamlit.testing.v1 import AppTest
+
+    results = {"dashboard_exceptions": 0}
+    for page in pages:
+        name = os.path.splitext(os.path.basename(page))[0]
+        app = AppTest.from_file(os.path.join(REPO_DIR, page), default_timeout=120)
+        for run in ("cold", "warm"):
+            start = time.perf_counter()
+            try:
+                app.run()
+                results["dashboard_exceptions"] += len(app.exception)
+            except RuntimeError as err:  # the script run timed out
+                logger.error("Rendering %s failed - %s", page, err)
+                results["dashboard_exceptions"] += 1
+            results[f"dashboard_{name}_{run}_ms"] = _ms(time.perf_counter() - start)
+    return results
+
+
+def record(tickers):
+    """Run the worker lanes against the live services, recording the responses."""
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    httpclient.replay(record_dir=FIXTURES_DIR)
+    bench_workers(tickers)
+    with open(f"{FIXTURES_DIR}/tickers.json", "w", encoding="utf-8") as file:
+        json.dump(tickers, file)
+    logger.info("Recorded %s tickers into %s", len(tickers), FIXTURES_DIR)
+
+
+def replay(tickers, args):
+    """
+    Run every benchmark against the recorded responses.
+
+    Returns:
+        dict: Result name to value.
+    """
+    server, base_url = standin.serve(FIXTURES_DIR, delay=args.delay)
+    httpclient.replay(base_url)
+    for provider in ratelimit.LIMITS:
+        ratelimit.LIMITS[provider] = (REPLAY_RATE, REPLAY_RATE)
+
+    results = bench_workers(tickers, args.workers)
+    results.update(bench_store(tickers))
+    results.update(bench_api(tickers, args.requests, args.concurrency))
+    if not args.skip_dashboard:
+        results.update(bench_dashboard())
+    server.shutdown()
+    return results
+
+
+def _git(*args):
+    return subprocess.run(
+        ["git", *args], cwd=REPO_DIR, capture_output=True, text=True, check=False
+    ).stdout.strip()
+
+
+def save(results, tickers, args):
+    """Append a run to RESULTS, returns the entry."""
+    entry = {
+        "commit": _git("rev-parse", "--short", "HEAD"),
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "tickers": tickers,
+        "delay": args.delay,
+        "workers": args.workers,
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(RESULTS), exist_ok=True)
+    with open(RESULTS, "a", encoding="utf-8") as file:
+        file.write(json.dumps(entry) + "\n")
+    return entry
+
+
+def previous(entry):
+    """The last saved run of another commit with the same setup, or None."""
+    try:
+        with open(RESULTS, "r", encoding="utf-8") as src_file:
+            runs = [json.loads(line) for line in src_file if line.strip()]
+    except FileNotFoundError:
+        return None
+    setup = ("tickers", "delay", "workers")
+    for run in reversed(runs):
+        if run["commit"] != entry["commit"] and all(
+            run.get(key) == entry[key] for key in setup
+        ):
+            return run
+    return None
+
+
+def _higher_is_better(name):
+    return name.endswith(("_per_min", "_rps", "_rate"))
+
+
+def compare(entry, before, tolerance=TOLERANCE):
+    """
+    Log every result next to the previous run.
+
+    Returns:
+        list: Names of the results worse than before by more than `tolerance`.
+    """
+    old = before["results"] if before else {}
+    regressions = []
+    logger.info(
+        "%-32s %12s %12s %8s", "result", before["commit"] if before else "-", "now", ""
+    )
+    for name, value in entry["results"].items():
+        was = old.get(name)
+        change = ""
+        if was:
+            ratio = value / was - 1
+            change = f"{ratio:+.1%}"
+            worse = -ratio if _higher_is_better(name) else ratio
+        else:
+            # from nothing, ex. exceptions where there were none
+            grew = was == 0 and value and not _higher_is_better(name)
+            worse = float("inf") if grew else 0
+        if worse > tolerance:
+            regressions.append(name)
+            change += " !"
+        logger.info(
+            "%-32s %12s %12s %8s", name, "-" if was is None else was, value, change
+        )
+    return regressions
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--record",
+        help="Record the provider responses from the live services.",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--tickers",
+        help="Comma separated tickers, defaults to the recorded ones.",
+        default=None,
+    )
+    parser.add_argument(
+        "--delay",
+        help="Share of the recorded provider latency to replay, 0 for none.",
+        type=float,
+        default=1.0,
+    )
+    parser.add_argument(
+        "--workers", help="Concurrent jobs per lane.", type=int, default=WORKERS
+    )
+    parser.add_argument(
+        "--requests", help="Requests sent to the API.", type=int, default=2000
+    )
+    parser.add_argument(
+        "--concurrency", help="Concurrent API clients.", type=int, default=32
+    )
+    parser.add_argument(
+        "--skip-dashboard",
+        help="Don't render the dashboard pages.",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--check",
+        help="Exit with an error when a result regressed since the last commit.",
+        action="store_true",
+        default=False,
+    )
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    shutil.rmtree(DATA_DIR, ignore_errors=True)
+    os.makedirs(f"{DATA_DIR}/MIDAS")
+
+    if args.tickers:
+        tickers = args.tickers.split(",")
+    elif args.record:
+        tickers = DEFAULT_TICKERS
+    else:
+        fname = f"{FIXTURES_DIR}/tickers.json"
+        try:
+            with open(fname, "r", encoding="utf-8") as src_file:
+                tickers = json.load(src_file)
+        except FileNotFoundError:
+            logger.error(
+                "No recorded responses in %s, record them first with "
+                "`python bench.py --record` (or set BENCH_FIXTURES)",
+                FIXTURES_DIR,
+            )
+            # nothing was measured, a check can't pass
+            return 1 if args.check else 0
+
+    if args.record:
+        record(tickers)
+        return 0
+
+    entry = save(replay(tickers, args), tickers, args)
+    regressions = compare(entry, previous(entry))
+    if regressions:
+        logger.warning("Regressed: %s", ", ".join(regressions))
+    return 1 if args.check and regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,232 @@
+"""Catalog of everything stored under MIDAS_DATA_DIR.
+
+A SQLite index of (date, ticker, section, kind, size, mtime, path) rows kept up
+to date by the writers (snapshot store, history series, Alpha Vantage results),
+so listing and filtering stored data never has to walk the NAS.
+
+The size of an entry is the storage it adds: snapshot sections share
+deduplicated objects, an object is counted at the first date referencing it
+and later references are 0 bytes.
+
+Kinds:
+    table         tabular snapshot section (Parquet)
+    value         non-tabular snapshot section (info, news, ...)
+    history       per-ticker bar series
+    alphavantage  Alpha Vantage result
+"""
+
+import argparse
+import logging
+import os
+import sqlite3
+import threading
+import time
+from glob import glob
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.getenv("DATA_DIR", "/data")
+MIDAS_DATA_DIR = f"{DATA_DIR}/MIDAS"
+CATALOG_DB = os.getenv("CATALOG_DB", f"{MIDAS_DATA_DIR}/catalog.db")
+COLUMNS = ["date", "ticker", "section", "kind", "size", "mtime", "path"]
+
+_LOCK = threading.Lock()
+_CONN = None
+
+
+def connect():
+    """The process-wide catalog connection, creating the schema on first use."""
+    global _CONN
+    with _LOCK:
+        if _CONN is None:
+            os.makedirs(os.path.dirname(CATALOG_DB), exist_ok=True)
+            _CONN = sqlite3.connect(CATALOG_DB, timeout=30, check_same_thread=False)
+            _CONN.executescript(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " date TEXT NOT NULL,"
+                " ticker TEXT NOT NULL,"
+                " section TEXT NOT NULL,"
+                " kind TEXT NOT NULL,"
+                " size INTEGER,"
+                " mtime REAL,"
+                " path TEXT,"
+                " PRIMARY KEY (date, ticker, section, kind));"
+                "CREATE INDEX IF NOT EXISTS entries_ticker ON entries (ticker, date);"
+                "CREATE INDEX IF NOT EXISTS entries_kind ON entries (kind, date);"
+            )
+            _CONN.commit()
+        return _CONN
+
+
+def _execute(sql, params=()):
+    conn = connect()
+    with _LOCK:
+        rows = conn.execute(sql, params).fetchall()
+        conn.commit()
+    return rows
+
+
+def _row(date, ticker, section, kind, path, size=None):
+    try:
+        stat = os.stat(path)
+        mtime = stat.st_mtime
+        size = stat.st_size if size is None else size
+    except FileNotFoundError:
+        mtime = time.time()
+    return (date, ticker, section, kind, size, mtime, path)
+
+
+def record_many(entries, latest_only=False):
+    """
+    Add or update catalog entries in one transaction.
+
+    Parameters:
+        entries (list): (date, ticker, section, kind, path, size) tuples, a
+            None size is the file size.
+        latest_only (bool): Drop the older dates of the same entries.
+    """
+    rows = [_row(*entry) for entry in entries]
+    if not rows:
+        return
+    conn = connect()
+    try:
+        with _LOCK, conn:
+            if latest_only:
+                conn.executemany(
+                    "DELETE FROM entries WHERE ticker = ? AND section = ? AND kind = ?",
+                    [(ticker, section, kind) for _, ticker, section, kind, *_ in rows],
+                )
+            conn.executemany(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+            )
+    except sqlite3.Error as err:
+        # the catalog can always be rebuilt, never fail a write because of it
+        logger.error("Error updating catalog for %s - %s", rows[0][-1], err)
+
+
+def record(date, ticker, section, kind, path, size=None, latest_only=False):
+    """
+    Add or update one catalog entry.
+
+    Parameters:
+        date (str): Date of the data, YYYY-MM-DD.
+        ticker (str): The stock ticker.
+        section (str): Section, series or function name.
+        kind (str): One of the kinds above.
+        path (str): File holding the data.
+        size (int): Bytes the entry adds, defaults to the file size.
+        latest_only (bool): Drop the older dates of the same entry.
+    """
+    record_many([(date, ticker, section, kind, path, size)], latest_only)
+
+
+def _filters(ticker=None, start=None, end=None, kind=None, section=None):
+    where, params = [], []
+    for column, value in (("ticker", ticker), ("kind", kind), ("section", section)):
+        if value is not None:
+            where.append(f"{column} = ?")
+            params.append(value)
+    if start is not None:
+        where.append("date >= ?")
+        params.append(start)
+    if end is not None:
+        where.append("date <= ?")
+        params.append(end)
+    return (" WHERE " + " AND ".join(where)) if where else "", params
+
+
+def query(limit=100, offset=0, **filters):
+    """
+    Page through catalog entries, newest first.
+
+    Parameters:
+        limit (int): Page size.
+        offset (int): Entries to skip.
+        filters: ticker, start/end date (inclusive), kind and section.
+
+    Returns:
+        dict: The total number of matches and the page of entries.
+    """
+    where, params = _filters(**filters)
+    total = _execute(f"SELECT COUNT(*) FROM entries{where}", params)[0][0]
+    rows = _execute(
+        f"SELECT {', '.join(COLUMNS)} FROM entries{where}"
+        " ORDER BY date DESC, ticker, section LIMIT ? OFFSET ?",
+        params + [limit, offset],
+    )
+    return {"total": total, "items": [dict(zip(COLUMNS, row)) for row in rows]}
+
+
+def snapshots(limit=100, offset=0, **filters):
+    """Page through the distinct (date, ticker) snapshots, newest first."""
+    where, params = _filters(**filters)
+    total = _execute(
+        f"SELECT COUNT(*) FROM (SELECT DISTINCT date, ticker FROM entries{where})",
+        params,
+    )[0][0]
+    rows = _execute(
+        f"SELECT date, ticker, SUM(size), MAX(mtime) FROM entries{where}"
+        " GROUP BY date, ticker ORDER BY date DESC, ticker LIMIT ? OFFSET ?",
+        params + [limit, offset],
+    )
+    items = [
+        {"date": date, "ticker": ticker, "size": size, "mtime": mtime}
+        for date, ticker, size, mtime in rows
+    ]
+    return {"total": total, "items": items}
+
+
+def is_empty():
+    """Check whether the catalog was never built."""
+    return not _execute("SELECT 1 FROM entries LIMIT 1")
+
+
+def rebuild():
+    """Index everything already on disk, only needed once."""
+    # Imported here, the store records into the catalog itself
+    import store  # pylint: disable=import-outside-toplevel
+
+    logger.info("Building catalog of %s", MIDAS_DATA_DIR)
+    seen = set()
+    # oldest first, a shared object counts at its first date
+    for snap in store.list_snapshots():
+        entries = []
+        for section, kind, path in store.section_files(snap["ticker"], snap["date"]):
+            entries.append(
+                (snap["date"], snap["ticker"], section, kind, path, 0)
+                if path in seen
+                else (snap["date"], snap["ticker"], section, kind, path, None)
+            )
+            seen.add(path)
+        record_many(entries)
+
+    for path in glob(f"{MIDAS_DATA_DIR}/history/*.parquet"):
+        ticker = os.path.basename(path)[: -len(".parquet")]
+        date = time.strftime("%Y-%m-%d", time.localtime(os.path.getmtime(path)))
+        record(date, ticker, "history", "history", path, latest_only=True)
+
+    for path in glob(f"{MIDAS_DATA_DIR}/alphavantage/????-??-??-*.json"):
+        # {date}-{ticker}-{function}.json, functions have no dashes
+        base = os.path.basename(path)[: -len(".json")]
+        ticker, function = base[11:].rsplit("-", 1)
+        record(base[:10], ticker, function, "alphavantage", path)
+    logger.info("Catalog built")
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--rebuild",
+        help="Index everything already stored under MIDAS_DATA_DIR.",
+        action="store_true",
+        default=False,
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    if args.rebuild:
+        rebuild()
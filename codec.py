@@ -0,0 +1,241 @@
+"""Compressed file I/O for the data stored under MIDAS_DATA_DIR.
+
+Files are written as zstd frames, with a dictionary trained on our own
+snapshots when there is one. Every reader goes through `read_bytes` (or
+`read_json`), which recognizes a zstd frame by its magic number. File names
+don't change, and files written before compression existed are read as is.
+
+Dictionaries are kept as ``{DATA_DIR}/MIDAS/zstd/{dict_id}.dict`` and every
+frame records the id of the dictionary it needs. ``current`` names the one new
+files are written with, it is read once per process. Parquet files are already
+compressed internally and don't go through this module.
+
+Without ``zstandard`` installed, files are written uncompressed (with a warning).
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import threading
+from functools import lru_cache
+from glob import glob
+
+try:
+    import zstandard
+except ImportError:  # optional, files are written uncompressed without it
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.getenv("DATA_DIR", "/data")
+MIDAS_DATA_DIR = f"{DATA_DIR}/MIDAS"
+DICT_DIR = f"{MIDAS_DATA_DIR}/zstd"
+CURRENT_DICT = f"{DICT_DIR}/current"
+ZSTD_LEVEL = int(os.getenv("ZSTD_LEVEL", "3"))
+# Smaller payloads are written as is, the frame header would eat the gain
+MIN_SIZE = int(os.getenv("ZSTD_MIN_SIZE", "64"))
+DICT_SIZE = int(os.getenv("ZSTD_DICT_SIZE", str(112 * 1024)))
+DICT_SAMPLES = int(os.getenv("ZSTD_DICT_SAMPLES", "5000"))
+MAGIC = b"\x28\xb5\x2f\xfd"
+
+_LOCAL = threading.local()
+_LOCK = threading.Lock()
+_CURRENT = None
+_WARNED = False
+
+
+@lru_cache(maxsize=None)
+def dictionary(dict_id):
+    """A trained dictionary, by id."""
+    with open(f"{DICT_DIR}/{dict_id}.dict", "rb") as src_file:
+        return zstandard.ZstdCompressionDict(src_file.read())
+
+
+def current_dict_id():
+    """Id of the dictionary new files are written with, 0 for none."""
+    global _CURRENT
+    with _LOCK:
+        if _CURRENT is None:
+            try:
+                with open(CURRENT_DICT, "r", encoding="utf-8") as src_file:
+                    _CURRENT = int(src_file.read().strip() or 0)
+            except (FileNotFoundError, ValueError):
+                _CURRENT = 0
+        return _CURRENT
+
+
+def _compressor():
+    """Compressor of the calling thread, zstd contexts aren't thread safe."""
+    dict_id = current_dict_id()
+    cached = getattr(_LOCAL, "compressor", None)
+    if cached is None or cached[0] != dict_id:
+        kwargs = {"dict_data": dictionary(dict_id)} if dict_id else {}
+        cached = (dict_id, zstandard.ZstdCompressor(level=ZSTD_LEVEL, **kwargs))
+        _LOCAL.compressor = cached
+    return cached[1]
+
+
+def _decompressor(dict_id):
+    decompressors = getattr(_LOCAL, "decompressors", None)
+    if decompressors is None:
+        decompressors = _LOCAL.decompressors = {}
+    if dict_id not in decompressors:
+        kwargs = {"dict_data": dictionary(dict_id)} if dict_id else {}
+        decompressors[dict_id] = zstandard.ZstdDecompressor(**kwargs)
+    return decompressors[dict_id]
+
+
+def is_compressed(data):
+    """Check whether bytes are a zstd frame."""
+    return data[:4] == MAGIC
+
+
+def _warn_uncompressed():
+    global _WARNED
+    with _LOCK:
+        if _WARNED:
+            return
+        _WARNED = True
+    logger.warning("zstandard isn't installed, writing files uncompressed")
+
+
+def compress(data):
+    """Bytes as a zstd frame, as is when too small or zstandard is missing."""
+    if zstandard is None:
+        _warn_uncompressed()
+        return data
+    if len(data) < MIN_SIZE:
+        return data
+    return _compressor().compress(data)
+
+
+def decompress(data):
+    """The content of a zstd frame, any other bytes as is."""
+    if not is_compressed(data):
+        return data
+    if zstandard is None:
+        raise ValueError("zstd compressed data, zstandard isn't installed")
+    dict_id = zstandard.get_frame_parameters(data).dict_id
+    return _decompressor(dict_id).decompress(data)
+
+
+def read_bytes(path):
+    """Content of a file, decompressed when it was written compressed."""
+    with open(path, "rb") as src_file:
+        return decompress(src_file.read())
+
+
+def write_bytes(path, data):
+    """Write bytes to a file compressed."""
+    with open(path, "wb") as file:
+        file.write(compress(data))
+
+
+def read_json(path):
+    """Load a JSON file, compressed or not."""
+    return json.loads(read_bytes(path))
+
+
+def write_json(path, data):
+    """Write data to a compressed JSON file."""
+    write_bytes(path, json.dumps(data, default=str).encode("utf-8"))
+
+
+def _json_files():
+    """Every JSON file under MIDAS_DATA_DIR."""
+    return [
+        path
+        for path in glob(f"{MIDAS_DATA_DIR}/**/*.json", recursive=True)
+        if not path.startswith(DICT_DIR)
+    ]
+
+
+def train(size=DICT_SIZE, samples=DICT_SAMPLES):
+    """
+    Train a dictionary on a sample of the stored JSON files and make it current.
+
+    Files written before keep pointing at the dictionary they were written
+    with, processes pick up the new one on their next start.
+
+    Returns:
+        int: Id of the new dictionary.
+    """
+    paths = _json_files()
+    paths = random.sample(paths, min(samples, len(paths)))
+    data = [read_bytes(path) for path in paths]
+    trained = zstandard.train_dictionary(size, [item for item in data if item])
+    dict_id = trained.dict_id()
+
+    os.makedirs(DICT_DIR, exist_ok=True)
+    with open(f"{DICT_DIR}/{dict_id}.dict", "wb") as file:
+        file.write(trained.as_bytes())
+    with open(CURRENT_DICT, "w", encoding="utf-8") as file:
+        file.write(str(dict_id))
+
+    global _CURRENT
+    with _LOCK:
+        _CURRENT = dict_id
+    logger.info("Trained dictionary %s on %s files", dict_id, len(data))
+    return dict_id
+
+
+def migrate():
+    """
+    Compress every stored JSON file that isn't yet, in place.
+
+    Files keep their name and mtime (freshness checks use it), only the ones
+    that shrink are rewritten.
+
+    Returns:
+        tuple: (bytes before, bytes after).
+    """
+    if zstandard is None:
+        raise RuntimeError("zstandard is needed to compress the archive")
+    before = after = 0
+    for path in _json_files():
+        try:
+            stat = os.stat(path)
+            with open(path, "rb") as src_file:
+                data = src_file.read()
+            before += len(data)
+            packed = data if is_compressed(data) else compress(data)
+            if len(packed) < len(data):
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, "wb") as file:
+                    file.write(packed)
+                os.utime(tmp_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+                os.replace(tmp_path, path)
+            after += min(len(packed), len(data))
+        except OSError as err:
+            logger.error("Error compressing %s - %s", path, err)
+    logger.info("Compressed %s bytes into %s bytes", before, after)
+    return before, after
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--train",
+        help="Train a dictionary on the stored JSON files and make it current.",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--migrate",
+        help="Compress the stored JSON files written before compression.",
+        action="store_true",
+        default=False,
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    if args.train:
+        train()
+    if args.migrate:
+        migrate()
@@ -4,6 +4,8 @@ from io import StringIO
 import re
 from bs4 import BeautifulSoup
 
+import httpclient
+
 
 BASE = "https://cwe.mitre.org"
 URL = f"{BASE}/data/downloads.html"
@@ -22,7 +24,7 @@ def main():
     #     return
 
     # Fetch the page content
-    response = requests.get(URL, headers=headers, timeout=30)
+    response = httpclient.get(URL, headers=headers)
 
     # Use pandas to read the HTML tables
     tables = pd.read_html(response.text)
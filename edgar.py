@@ -0,0 +1,163 @@
+"""Accession-level incremental sync of SEC EDGAR filings.
+
+Instead of asking the downloader again for the last N filings of every form,
+the company's filing list is fetched once per CIK, compared with the local
+inventory (``filings``) and only the accessions we don't have are downloaded.
+Files are saved in the same layout as ``sec_edgar_downloader``. The filing
+list of a company is kept for ``EDGAR_LISTING_TTL`` secs, so the per-form jobs
+of one cycle share a single request.
+
+Point ``EDGAR_WWW_URL``/``EDGAR_DATA_URL`` at a stand-in server (``standin.py``)
+to sync against recorded responses.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import filings
+import httpclient
+import ratelimit
+
+logger = logging.getLogger(__name__)
+
+EDGAR_WWW_URL = os.getenv("EDGAR_WWW_URL", "https://www.sec.gov")
+EDGAR_DATA_URL = os.getenv("EDGAR_DATA_URL", "https://data.sec.gov")
+SEC_USER_AGENT = os.getenv("SEC_USER_AGENT", "Personal fixme@example.com")
+AMENDS_SUFFIX = "/A"
+PRIMARY_DOC = "primary-document"
+# Secs a company's filing list is reused for, and how many lists are kept
+LISTING_TTL = int(os.getenv("EDGAR_LISTING_TTL", "3600"))
+LISTING_CACHE_SIZE = int(os.getenv("EDGAR_LISTING_CACHE_SIZE", "64"))
+
+_LOCK = threading.Lock()
+_CIKS = {}
+_LISTINGS_LOCK = threading.Lock()
+_LISTINGS = OrderedDict()
+
+
+def _get(url):
+    ratelimit.limiter("sec").acquire()
+    response = httpclient.get(url, headers={"User-Agent": SEC_USER_AGENT})
+    response.raise_for_status()
+    return response
+
+
+def ticker_to_cik(ticker):
+    """Zero padded CIK of a ticker, the mapping is fetched once per process."""
+    with _LOCK:
+        if not _CIKS:
+            mapping = _get(f"{EDGAR_WWW_URL}/files/company_tickers.json").json()
+            for company in mapping.values():
+                _CIKS[company["ticker"].upper()] = str(company["cik_str"]).zfill(10)
+    return _CIKS.get(ticker.upper().replace(".", "-"))
+
+
+def recent_filings(cik, max_age=LISTING_TTL):
+    """The recent filings of a company as a list of dicts, at most `max_age` old."""
+    with _LISTINGS_LOCK:
+        cached = _LISTINGS.get(cik)
+        if cached is not None and time.monotonic() - cached[0] < max_age:
+            _LISTINGS.move_to_end(cik)
+            return cached[1]
+
+    submissions = _get(f"{EDGAR_DATA_URL}/submissions/CIK{cik}.json").json()
+    recent = submissions["filings"]["recent"]
+    listing = [
+        {"accession": acc, "form": form, "document": doc, "filing_date": f_date}
+        for acc, form, doc, f_date in zip(
+            recent["accessionNumber"],
+            recent["form"],
+            recent["primaryDocument"],
+            recent["filingDate"],
+        )
+    ]
+    with _LISTINGS_LOCK:
+        _LISTINGS[cik] = (time.monotonic(), listing)
+        _LISTINGS.move_to_end(cik)
+        while len(_LISTINGS) > LISTING_CACHE_SIZE:
+            _LISTINGS.popitem(last=False)
+    return listing
+
+
+def wanted_filings(listing, forms, limit, include_amends=True):
+    """The latest `limit` filings per form, amendments counting as their form."""
+    wanted = {form: [] for form in forms}
+    for filing in listing:
+        form = filing["form"]
+        if form.endswith(AMENDS_SUFFIX):
+            if not include_amends:
+                continue
+            form = form[: -len(AMENDS_SUFFIX)]
+        if form in wanted and len(wanted[form]) < limit:
+            wanted[form].append(dict(filing, form=form))
+    return wanted
+
+
+def download_filing(ticker, cik, filing, download_details=True):
+    """Save one filing in the `sec_edgar_downloader` layout."""
+    accession = filing["accession"]
+    folder = f"{cik.lstrip('0')}/{accession.replace('-', '')}"
+    base = f"{EDGAR_WWW_URL}/Archives/edgar/data/{folder}"
+
+    # fetch everything first, a partial accession dir would count as downloaded
+    documents = {filings.FULL_SUBMISSION: _get(f"{base}/{accession}.txt").content}
+    if download_details and filing["document"]:
+        document = filing["document"].rsplit("/")[-1]
+        suffix = Path(document).suffix.replace("htm", "html")
+        documents[f"{PRIMARY_DOC}{suffix}"] = _get(f"{base}/{document}").content
+
+    path = Path(f"{filings.FILINGS_DIR}/{ticker}/{filing['form']}/{accession}")
+    path.mkdir(parents=True, exist_ok=True)
+    for name, content in documents.items():
+        (path / name).write_bytes(content)
+
+
+def sync_ticker(ticker, forms, limit=8, include_amends=True, download_details=True):
+    """
+    Download the filings of a ticker that aren't in the inventory yet.
+
+    The filing list is fetched once for all forms of the company.
+
+    Parameters:
+        ticker (str): The stock ticker.
+        forms (list): SEC forms to keep in sync.
+        limit (int): Number of latest filings to keep per form.
+        include_amends (bool): Count amendments as filings of their form.
+        download_details (bool): Also download the primary document.
+
+    Returns:
+        dict: Form to the accession numbers downloaded.
+    """
+    cik = ticker_to_cik(ticker)
+    if cik is None:
+        logger.warning("No CIK found for %s", ticker)
+        return {}
+
+    wanted = wanted_filings(recent_filings(cik), forms, limit, include_amends)
+    have = filings.accessions(ticker)
+
+    downloaded = {}
+    for form, listing in wanted.items():
+        for filing in listing:
+            if filing["accession"] in have:
+                continue
+            try:
+                download_filing(ticker, cik, filing, download_details)
+            except Exception as err:
+                logger.error(
+                    "Error downloading %s %s for %s - %s",
+                    form,
+                    filing["accession"],
+                    ticker,
+                    err,
+                )
+                continue
+            filings.record(ticker, form, filing["accession"], filing["filing_date"])
+            downloaded.setdefault(form, []).append(filing["accession"])
+
+    logger.debug("Synced %s: %s", ticker, downloaded)
+    return downloaded
@@ -0,0 +1,46 @@
+"""Thread pool fetch engine for one-off batches (FRED series, benchmarks).
+
+The workers run on the ``scheduler``; this runs a fixed list of jobs with the
+same model, blocking provider clients on a thread pool sized to the wanted
+concurrency. Throughput is bounded by the provider rate limiters in
+``ratelimit`` rather than by sleeps between jobs.
+"""
+
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+logger = logging.getLogger(__name__)
+
+FETCH_CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", "64"))
+
+
+def run(func, jobs, concurrency=FETCH_CONCURRENCY, on_done=None):
+    """
+    Run `func(*job)` for every job with up to `concurrency` jobs in flight.
+
+    Parameters:
+        func (callable): Blocking fetch function.
+        jobs (list): Argument tuples, one per call.
+        concurrency (int): Max number of jobs in flight.
+        on_done (callable): Called with (job, result, error) as jobs finish.
+
+    Returns:
+        dict: Job to result, None for failed jobs.
+    """
+    if not jobs:
+        return {}
+    results = {}
+    with ThreadPoolExecutor(concurrency, thread_name_prefix="engine") as pool:
+        futures = {pool.submit(func, *job): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            result, err = None, future.exception()
+            if err is not None:
+                logger.error("%r generated an exception: %s", job, err)
+            else:
+                result = future.result()
+            results[job] = result
+            if on_done is not None:
+                on_done(job, result, err)
+    return results
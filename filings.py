@@ -0,0 +1,137 @@
+"""Inventory of the SEC filings downloaded under DATA_DIR.
+
+A SQLite table of the accession numbers on disk per ticker/form, built once by
+walking ``{DATA_DIR}/sec-edgar-filings`` and updated as filings are downloaded,
+so deciding whether to download is an indexed lookup instead of a directory
+scan over the NAS.
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.getenv("DATA_DIR", "/data")
+FILINGS_DIR = f"{DATA_DIR}/sec-edgar-filings"
+# Keep the database on local disk when possible, it is rebuilt from FILINGS_DIR
+FILINGS_DB = os.getenv("FILINGS_DB", f"{DATA_DIR}/sec-filings.db")
+FULL_SUBMISSION = "full-submission.txt"
+
+_FILED_RE = re.compile(rb"FILED AS OF DATE:\s*(\d{8})")
+
+_LOCK = threading.Lock()
+_CONN = None
+
+
+def connect():
+    """The process-wide inventory connection, creating the schema on first use."""
+    global _CONN
+    with _LOCK:
+        if _CONN is None:
+            _CONN = sqlite3.connect(FILINGS_DB, check_same_thread=False, timeout=30)
+            _CONN.execute(
+                "CREATE TABLE IF NOT EXISTS filings ("
+                " ticker TEXT NOT NULL,"
+                " form TEXT NOT NULL,"
+                " accession TEXT NOT NULL,"
+                " filing_date TEXT,"
+                " downloaded_at REAL,"
+                " PRIMARY KEY (ticker, form, accession))"
+            )
+            _CONN.commit()
+        return _CONN
+
+
+def _execute(sql, params=()):
+    conn = connect()
+    with _LOCK:
+        rows = conn.execute(sql, params).fetchall()
+        conn.commit()
+    return rows
+
+
+def filing_date(path):
+    """Filing date (YYYY-MM-DD) from the header of a full submission."""
+    try:
+        with open(f"{path}/{FULL_SUBMISSION}", "rb") as src_file:
+            match = _FILED_RE.search(src_file.read(4096))
+    except FileNotFoundError:
+        return None
+    if match is None:
+        return None
+    filed = match.group(1).decode()
+    return f"{filed[:4]}-{filed[4:6]}-{filed[6:]}"
+
+
+def record(ticker, form, accession, date=None):
+    """Add a downloaded filing to the inventory."""
+    _execute(
+        "INSERT OR IGNORE INTO filings VALUES (?, ?, ?, ?, ?)",
+        (ticker, form, accession, date, time.time()),
+    )
+
+
+def accessions(ticker, form=None):
+    """Accession numbers on disk for a ticker (and form)."""
+    if form is None:
+        rows = _execute("SELECT accession FROM filings WHERE ticker = ?", (ticker,))
+    else:
+        rows = _execute(
+            "SELECT accession FROM filings WHERE ticker = ? AND form = ?",
+            (ticker, form),
+        )
+    return {row[0] for row in rows}
+
+
+def count(ticker, form):
+    """Number of filings on disk for a ticker/form."""
+    return _execute(
+        "SELECT COUNT(*) FROM filings WHERE ticker = ? AND form = ?", (ticker, form)
+    )[0][0]
+
+
+def latest_filing_date(ticker, form):
+    """Most recent filing date on disk for a ticker/form, or None."""
+    return _execute(
+        "SELECT MAX(filing_date) FROM filings WHERE ticker = ? AND form = ?",
+        (ticker, form),
+    )[0][0]
+
+
+def scan(ticker, form):
+    """
+    Record the filings of one ticker/form directory that aren't indexed yet.
+
+    Returns:
+        list: The newly found accession numbers.
+    """
+    path = f"{FILINGS_DIR}/{ticker}/{form}"
+    try:
+        on_disk = set(os.listdir(path))
+    except FileNotFoundError:
+        return []
+
+    new = sorted(on_disk - accessions(ticker, form))
+    for accession in new:
+        record(ticker, form, accession, filing_date(f"{path}/{accession}"))
+    return new
+
+
+def build_inventory(force=False):
+    """Index every filing on disk, only done once unless forced."""
+    if not force and _execute("SELECT 1 FROM filings LIMIT 1"):
+        return
+
+    if not os.path.isdir(FILINGS_DIR):
+        return
+
+    logger.info("Building filing inventory from %s", FILINGS_DIR)
+    found = 0
+    for ticker in sorted(os.listdir(FILINGS_DIR)):
+        for form in os.listdir(f"{FILINGS_DIR}/{ticker}"):
+            found += len(scan(ticker, form))
+    logger.info("Indexed %s filings", found)
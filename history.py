@@ -0,0 +1,301 @@
+"""Incremental per-ticker price history.
+
+One growing bar series per ticker is kept in
+``{DATA_DIR}/MIDAS/history/{ticker}.parquet``. A sync only asks the provider for
+the bars after the last stored timestamp and merges them into the stored series,
+so a daily refresh moves a couple of bars instead of a full month.
+"""
+
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+import catalog
+import httpclient
+import indicators
+import ratelimit
+import store
+
+logger = logging.getLogger(__name__)
+
+HISTORY_DIR = f"{store.MIDAS_DATA_DIR}/history"
+# Period downloaded the first time we see a ticker
+BACKFILL_PERIOD = os.getenv("HISTORY_BACKFILL_PERIOD", "1y")
+# More business days than this between two bars is a hole, not a holiday
+GAP_BUSINESS_DAYS = 3
+# Symbols per multi-ticker download
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "100"))
+# Corporate action columns of the (adjusted) bars
+ACTIONS = ["Dividends", "Stock Splits"]
+
+
+def history_path(ticker):
+    """Parquet file of the bar series of a ticker."""
+    return f"{HISTORY_DIR}/{ticker}.parquet"
+
+
+def load_history(ticker):
+    """Stored bar series of a ticker, empty if it was never synced."""
+    try:
+        return pd.read_parquet(history_path(ticker))
+    except FileNotFoundError:
+        return pd.DataFrame()
+
+
+def save_history(ticker, bars):
+    """Persist the bar series of a ticker."""
+    os.makedirs(HISTORY_DIR, exist_ok=True)
+    store.write_table(bars, history_path(ticker))
+    try:
+        indicators.sync_state(ticker, bars)
+    except (KeyError, ValueError) as err:
+        logger.error("Error updating indicator state for %s - %s", ticker, err)
+    catalog.record(
+        store.today(),
+        ticker,
+        "history",
+        "history",
+        history_path(ticker),
+        latest_only=True,
+    )
+
+
+def _align_tz(stored, new):
+    """New bars in the timezone of the stored series."""
+    if stored.index.tz is not None:
+        if new.index.tz is None:
+            return new.tz_localize(stored.index.tz)
+        return new.tz_convert(stored.index.tz)
+    if new.index.tz is not None:
+        return new.tz_localize(None)
+    return new
+
+
+def merge_bars(stored, new):
+    """Merge new bars into a stored series, newer bars win on overlap."""
+    if new.empty:
+        return stored
+    if stored.empty:
+        return new.sort_index()
+
+    merged = pd.concat([stored, _align_tz(stored, new)])
+    merged = merged[~merged.index.duplicated(keep="last")]
+    return merged.sort_index()
+
+
+def _bar_days(index):
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    return index.normalize().values.astype("datetime64[D]")
+
+
+def find_gaps(bars, since=None):
+    """
+    Find holes in a bar series.
+
+    Parameters:
+        bars (DataFrame): Bar series indexed by timestamp.
+        since (Timestamp): Only look at bars from this timestamp on.
+
+    Returns:
+        list: (last bar before, first bar after) timestamp pairs.
+    """
+    if since is not None:
+        bars = bars[bars.index >= since]
+    if len(bars) < 2:
+        return []
+
+    days = _bar_days(bars.index)
+    missing = np.busday_count(days[:-1], days[1:]) - 1
+    return [
+        (bars.index[pos], bars.index[pos + 1])
+        for pos in np.flatnonzero(missing > GAP_BUSINESS_DAYS)
+    ]
+
+
+def next_start(bars):
+    """First date to request for a stored series, None when it needs a backfill."""
+    if bars.empty:
+        return None
+    # Ask for the last stored day again, its bar may have been taken intraday
+    return bars.index[-1].strftime("%Y-%m-%d")
+
+
+def recent_bars(bars, months=1):
+    """Tail of a bar series, ex. the month `1mo_hist` used to download."""
+    if bars.empty:
+        return bars
+    return bars[bars.index >= bars.index[-1] - pd.DateOffset(months=months)]
+
+
+def is_fresh(ticker, max_age):
+    """Check if the series of a ticker was synced in the last `max_age` secs."""
+    try:
+        return time.time() - os.path.getmtime(history_path(ticker)) < max_age
+    except FileNotFoundError:
+        return False
+
+
+def has_new_actions(stored, new):
+    """
+    Check whether new bars carry a dividend or split the stored series lacks.
+
+    Bars are stored adjusted, a new corporate action adjusts every bar before
+    it, so the stored series no longer lines up with the new bars.
+    """
+    columns = [column for column in ACTIONS if column in new.columns]
+    if stored.empty or new.empty or not columns:
+        return False
+    actions = _align_tz(stored, new)[columns].fillna(0)
+    actions = actions[(actions != 0).any(axis=1)]
+    if actions.empty:
+        return False
+    known = stored.reindex(actions.index).reindex(columns=columns).fillna(0)
+    return bool((actions.values != known.values).any())
+
+
+def _apply(ticker, stored, new, stock_ticker=None):
+    """Merge fetched bars, fill the holes they leave and persist the series."""
+    if stock_ticker is None:
+        stock_ticker = yf.Ticker(ticker, session=httpclient.yf_session())
+
+    # only look for holes after the bars already stored, even after a refetch
+    since = stored.index[-1] if not stored.empty else None
+    if has_new_actions(stored, new):
+        # the adjusted prices before the action changed, download them again
+        first = stored.index[0].strftime("%Y-%m-%d")
+        logger.info("New dividend or split for %s, refetching from %s", ticker, first)
+        ratelimit.limiter("yfinance").acquire()
+        refetched = stock_ticker.history(start=first)
+        if not refetched.empty:
+            stored = pd.DataFrame()
+            new = merge_bars(refetched, new)
+
+    bars = merge_bars(stored, new)
+
+    for before, after in find_gaps(bars, since=since):
+        logger.info("Filling history gap %s - %s for %s", before, after, ticker)
+        ratelimit.limiter("yfinance").acquire()
+        filler = stock_ticker.history(
+            start=before.strftime("%Y-%m-%d"), end=after.strftime("%Y-%m-%d")
+        )
+        bars = merge_bars(bars, filler)
+
+    if not bars.equals(stored):
+        save_history(ticker, bars)
+    elif not bars.empty:
+        # nothing new (weekend, holiday), still mark the series as synced
+        os.utime(history_path(ticker))
+    return bars
+
+
+def sync_history(ticker, stock_ticker=None, max_age=0):
+    """
+    Bring the stored bar series of a ticker up to date.
+
+    Parameters:
+        ticker (str): The stock ticker.
+        stock_ticker (yf.Ticker): Reuse an existing Ticker object.
+        max_age (int): Skip the download if synced less than this many secs ago.
+
+    Returns:
+        DataFrame: The full, merged bar series.
+    """
+    stored = load_history(ticker)
+    if max_age and is_fresh(ticker, max_age):
+        logger.debug("History for %s is fresh", ticker)
+        return stored
+
+    if stock_ticker is None:
+        stock_ticker = yf.Ticker(ticker, session=httpclient.yf_session())
+
+    start = next_start(stored)
+    if start is None:
+        logger.info("Backfilling %s of history for %s", BACKFILL_PERIOD, ticker)
+        new = stock_ticker.history(period=BACKFILL_PERIOD)
+    else:
+        logger.debug("Syncing history for %s from %s", ticker, start)
+        new = stock_ticker.history(start=start)
+
+    return _apply(ticker, stored, new, stock_ticker)
+
+
+def _download(tickers, **kwargs):
+    """
+    One multi-symbol download, split back into a frame per ticker.
+
+    yfinance makes a request per ticker, they are paid for up front and run
+    at most a burst of the rate limit in parallel.
+    """
+    bucket = ratelimit.limiter("yfinance")
+    bucket.acquire(len(tickers))
+    frames = yf.download(
+        tickers,
+        group_by="ticker",
+        actions=True,
+        auto_adjust=True,
+        ignore_tz=False,
+        progress=False,
+        session=httpclient.yf_session(),
+        threads=max(1, int(bucket.capacity)),
+        **kwargs,
+    )
+    result = {}
+    for ticker in tickers:
+        if ticker in frames.columns.get_level_values(0):
+            result[ticker] = frames[ticker].dropna(how="all")
+    return result
+
+
+def sync_history_batch(tickers, chunk_size=BATCH_CHUNK_SIZE):
+    """
+    Bring the bar series of many tickers up to date with chunked downloads.
+
+    Tickers are grouped by the date their series needs bars from, so a daily
+    run over the universe is a handful of multi-symbol requests.
+
+    Parameters:
+        tickers (list): The stock tickers.
+        chunk_size (int): Max number of symbols per request.
+
+    Returns:
+        int: Number of tickers synced.
+    """
+    stored = {ticker: load_history(ticker) for ticker in tickers}
+
+    by_start = {}
+    for ticker, bars in stored.items():
+        by_start.setdefault(next_start(bars), []).append(ticker)
+
+    synced = 0
+    for start, group in sorted(by_start.items(), key=lambda item: item[0] or ""):
+        for pos in range(0, len(group), chunk_size):
+            chunk = group[pos : pos + chunk_size]
+            logger.info(
+                "Downloading history for %s tickers from %s",
+                len(chunk),
+                start or BACKFILL_PERIOD,
+            )
+            try:
+                if start is None:
+                    frames = _download(chunk, period=BACKFILL_PERIOD)
+                else:
+                    frames = _download(chunk, start=start)
+            except Exception as err:
+                logger.error("Error downloading history chunk: %s", err)
+                continue
+
+            for ticker in chunk:
+                if ticker not in frames:
+                    logger.warning("No history returned for %s", ticker)
+                    continue
+                try:
+                    _apply(ticker, stored[ticker], frames[ticker])
+                    synced += 1
+                except Exception as err:
+                    logger.error("Error merging history for %s: %s", ticker, err)
+    return synced
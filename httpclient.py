@@ -0,0 +1,177 @@
+"""Pooled HTTP sessions shared by all outbound fetchers.
+
+One keep-alive session per process with connection pooling, retries with
+backoff on throttling/server errors, gzip and a cap on concurrent requests per
+host, so a worker cycle doesn't pay a TCP+TLS handshake on every call.
+
+Provider responses can be recorded (``HTTP_RECORD_DIR``) and replayed offline
+from a stand-in (``HTTP_REPLAY_URL``, see ``standin.py``), ex. by ``bench.py``.
+"""
+
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import metrics
+import standin
+
+logger = logging.getLogger(__name__)
+
+HTTP_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
+    "AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/91.0.4472.101 Safari/537.3",
+    "Accept-Encoding": "gzip, deflate",
+}
+HTTP_TIMEOUT = 30
+# Pooled connections kept per host
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "32"))
+# Requests in flight per host at any time
+HTTP_PER_HOST = int(os.getenv("HTTP_PER_HOST", "8"))
+HTTP_RETRY = Retry(
+    total=3,
+    backoff_factor=1,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=("GET", "HEAD"),
+    respect_retry_after_header=True,
+)
+# Provider of a host, by domain suffix, for the latency metrics
+PROVIDER_HOSTS = {
+    "yahoo.com": "yfinance",
+    "alphavantage.co": "alphavantage",
+    "sec.gov": "sec",
+    "wikipedia.org": "wikipedia",
+    "stlouisfed.org": "fred",
+}
+# Stand-in (standin.py) provider requests are replayed from instead of the network
+HTTP_REPLAY_URL = os.getenv("HTTP_REPLAY_URL")
+# Directory provider responses are recorded into, for the stand-in to replay
+HTTP_RECORD_DIR = os.getenv("HTTP_RECORD_DIR")
+
+_LOCK = threading.Lock()
+_SESSION = None
+_YF_SESSION = None
+_HOSTS = {}
+
+
+def provider(url):
+    """The provider a URL belongs to, "other" when unknown."""
+    host = urlsplit(url).hostname or ""
+    for suffix, name in PROVIDER_HOSTS.items():
+        if host == suffix or host.endswith(f".{suffix}"):
+            return name
+    return "other"
+
+
+def replay(base_url=None, record_dir=None):
+    """
+    Replay provider requests from a stand-in, or record their responses.
+
+    Parameters:
+        base_url (str): Base URL of the stand-in, None goes to the network.
+        record_dir (str): Directory to record responses into, None to stop.
+    """
+    global HTTP_REPLAY_URL, HTTP_RECORD_DIR
+    HTTP_REPLAY_URL, HTTP_RECORD_DIR = base_url, record_dir
+
+
+def _full_url(url, params):
+    prepared = requests.models.PreparedRequest()
+    prepared.prepare_url(url, params)
+    return prepared.url
+
+
+class _Provider:
+    """
+    Session mixin for provider requests: records their latency by provider,
+    and replays or records them when configured.
+    """
+
+    def request(self, method, url, *args, **kwargs):
+        name = provider(url)
+        target = url
+        if HTTP_REPLAY_URL is not None:
+            target = standin.replay_url(HTTP_REPLAY_URL, url)
+        start = time.perf_counter()
+        try:
+            response = super().request(method, target, *args, **kwargs)
+        except Exception:
+            metrics.PROVIDER_ERRORS.inc(provider=name)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.PROVIDER_LATENCY.observe(elapsed, provider=name)
+        if response.status_code >= 400:
+            metrics.PROVIDER_ERRORS.inc(provider=name)
+        if HTTP_RECORD_DIR is not None:
+            standin.record(
+                HTTP_RECORD_DIR,
+                _full_url(url, kwargs.get("params")),
+                response.status_code,
+                response.headers.get("Content-Type"),
+                response.content,
+                elapsed,
+            )
+        return response
+
+
+class _ProviderSession(_Provider, requests.Session):
+    pass
+
+
+def session():
+    """The process-wide pooled `requests` session."""
+    global _SESSION
+    with _LOCK:
+        if _SESSION is None:
+            _SESSION = _ProviderSession()
+            adapter = HTTPAdapter(
+                pool_connections=HTTP_POOL_SIZE,
+                pool_maxsize=HTTP_POOL_SIZE,
+                max_retries=HTTP_RETRY,
+            )
+            _SESSION.mount("https://", adapter)
+            _SESSION.mount("http://", adapter)
+            _SESSION.headers.update(HTTP_HEADERS)
+        return _SESSION
+
+
+def _host_slot(url):
+    host = urlsplit(url).netloc
+    with _LOCK:
+        if host not in _HOSTS:
+            _HOSTS[host] = threading.BoundedSemaphore(HTTP_PER_HOST)
+        return _HOSTS[host]
+
+
+def get(url, **kwargs):
+    """GET through the pooled session, bounded per host."""
+    kwargs.setdefault("timeout", HTTP_TIMEOUT)
+    with _host_slot(url):
+        return session().get(url, **kwargs)
+
+
+def yf_session():
+    """
+    The process-wide session for yfinance.
+
+    Yahoo needs a browser impersonating `curl_cffi` session, passing the same
+    one to every `yf.Ticker`/`yf.download` keeps its connections alive across
+    a worker batch instead of yfinance creating a new one per download.
+    """
+    global _YF_SESSION
+    with _LOCK:
+        if _YF_SESSION is None:
+            from curl_cffi import requests as curl_requests
+
+            class _ProviderYfSession(_Provider, curl_requests.Session):
+                pass
+
+            _YF_SESSION = _ProviderYfSession(impersonate="chrome")
+        return _YF_SESSION
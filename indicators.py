@@ -0,0 +1,651 @@
+"""Vectorized technical indicators over a (date x ticker) price panel.
+
+Every indicator is computed for all tickers at once on 2-D NumPy arrays, rows
+are dates and columns tickers. Rolling windows use cumulative sums (or sliding
+window views for min/max) and the exponential averages walk the dates once with
+every ticker updated in the same vector operation, so the cost grows with the
+number of dates, not with dates x tickers Python steps.
+
+Results are cached per input-data version: a hash of the history files (path,
+mtime, size) and the parameters. The cache is kept in memory and as Parquet
+under ``{DATA_DIR}/MIDAS/indicators`` so the dashboard and the API share it.
+
+For the latest values only, ``IndicatorState`` keeps the running state of every
+indicator per ticker and advances it in constant time per new bar. The history
+sync saves it next to the series (``{ticker}.state.json``) so a restart resumes
+from it instead of recomputing the whole series.
+"""
+
+import copy
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict, deque
+from glob import glob
+
+import numpy as np
+import pandas as pd
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+import codec
+import store
+
+logger = logging.getLogger(__name__)
+
+# Same layout as history.HISTORY_DIR, history itself needs yfinance
+HISTORY_DIR = f"{store.MIDAS_DATA_DIR}/history"
+INDICATORS_DIR = f"{store.MIDAS_DATA_DIR}/indicators"
+# Cached results kept on disk and in memory
+INDICATOR_CACHE_FILES = int(os.getenv("INDICATOR_CACHE_FILES", "8"))
+INDICATOR_CACHE_ENTRIES = int(os.getenv("INDICATOR_CACHE_ENTRIES", "4"))
+FIELDS = ["Close", "High", "Low"]
+
+PARAMS = {
+    "sma": (20, 50, 200),
+    "ema": (12, 26),
+    "macd": (12, 26, 9),
+    "rsi": 14,
+    "bollinger": (20, 2.0),
+    "stochastic": (14, 3),
+}
+
+_LOCK = threading.Lock()
+_CACHE = OrderedDict()
+
+
+def _ffill(values):
+    """Forward fill the NaNs of every column, leading NaNs stay."""
+    valid = ~np.isnan(values)
+    rows = np.maximum.accumulate(
+        np.where(valid, np.arange(len(values))[:, None], 0), axis=0
+    )
+    return values[rows, np.arange(values.shape[1])]
+
+
+def sma(values, window):
+    """Simple moving average, NaN until a full window of values is available."""
+    valid = ~np.isnan(values)
+    sums = np.cumsum(np.where(valid, values, 0.0), axis=0)
+    counts = np.cumsum(valid, axis=0)
+    out = np.full(values.shape, np.nan)
+    if len(values) < window:
+        return out
+    window_sums = sums[window - 1 :].copy()
+    window_sums[1:] -= sums[:-window]
+    window_counts = counts[window - 1 :].copy()
+    window_counts[1:] -= counts[:-window]
+    out[window - 1 :] = np.where(window_counts == window, window_sums / window, np.nan)
+    return out
+
+
+def rolling_std(values, window):
+    """Rolling population standard deviation, like ``sma`` but of the spread."""
+    # Shift every column by its first value, the variance doesn't change and the
+    # cumulative sums of squares stay small enough to keep their precision
+    first = values[np.argmax(~np.isnan(values), axis=0), np.arange(values.shape[1])]
+    shifted = values - np.where(np.isnan(first), 0.0, first)
+    mean = sma(shifted, window)
+    mean_sq = sma(shifted * shifted, window)
+    return np.sqrt(np.maximum(mean_sq - mean * mean, 0.0))
+
+
+def ema(values, span=None, alpha=None, min_periods=None):
+    """
+    Exponential moving average (``adjust=False``), seeded by the first value.
+
+    Parameters:
+        values (ndarray): Dates x tickers.
+        span (int): Span of the average, sets ``alpha = 2 / (span + 1)``.
+        alpha (float): Smoothing factor, instead of `span`.
+        min_periods (int): Values needed before the average is reported,
+            defaults to `span`.
+
+    Returns:
+        ndarray: The averages, same shape as `values`.
+    """
+    alpha = alpha if alpha is not None else 2.0 / (span + 1)
+    min_periods = min_periods if min_periods is not None else (span or 1)
+    valid = ~np.isnan(values)
+    # Forward fill holes, then start every column at its first value so the
+    # loop below is a plain in-place update of all tickers per date
+    filled = _ffill(values)
+    first = values[np.argmax(valid, axis=0), np.arange(values.shape[1])]
+    filled = np.where(np.isnan(filled), first, filled)
+
+    out = np.empty(values.shape)
+    prev = filled[0].copy()
+    for row, current in enumerate(filled):
+        prev += alpha * (current - prev)
+        out[row] = prev
+    out[np.cumsum(valid, axis=0) < min_periods] = np.nan
+    return out
+
+
+def macd(close, fast=12, slow=26, signal=9):
+    """MACD line, signal line and histogram."""
+    line = ema(close, fast, min_periods=slow) - ema(close, slow)
+    signal_line = ema(line, signal)
+    return line, signal_line, line - signal_line
+
+
+def rsi(close, window=14):
+    """Relative Strength Index with Wilder's smoothing."""
+    change = np.full(close.shape, np.nan)
+    change[1:] = close[1:] - close[:-1]
+    # np.clip keeps the NaNs of the first bar
+    gain = ema(np.clip(change, 0.0, None), alpha=1.0 / window, min_periods=window)
+    loss = ema(np.clip(-change, 0.0, None), alpha=1.0 / window, min_periods=window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(loss == 0, 100.0, 100.0 - 100.0 / (1.0 + gain / loss))
+
+
+def bollinger(close, window=20, num_std=2.0):
+    """Middle, upper and lower Bollinger bands."""
+    middle = sma(close, window)
+    spread = num_std * rolling_std(close, window)
+    return middle, middle + spread, middle - spread
+
+
+def _rolling(values, window, reduce):
+    out = np.full(values.shape, np.nan)
+    if len(values) >= window:
+        view = np.lib.stride_tricks.sliding_window_view(values, window, axis=0)
+        out[window - 1 :] = reduce(view, axis=-1)
+    return out
+
+
+def stochastic(high, low, close, window=14, smooth=3):
+    """Stochastic oscillator %K and its moving average %D."""
+    lowest = _rolling(low, window, np.min)
+    highest = _rolling(high, window, np.max)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        k = 100.0 * (close - lowest) / (highest - lowest)
+    return k, sma(k, smooth)
+
+
+def compute(panel, params=None):
+    """
+    Every indicator for every ticker of a price panel.
+
+    Parameters:
+        panel (dict): Field (Close, High, Low) to a dates x tickers DataFrame.
+        params (dict): Indicator parameters, defaults to ``PARAMS``.
+
+    Returns:
+        DataFrame: Dates x (indicator, ticker) columns.
+    """
+    if panel["Close"].empty:
+        return pd.DataFrame()
+    params = {**PARAMS, **(params or {})}
+    close = panel["Close"].to_numpy(dtype=float)
+    high = panel["High"].to_numpy(dtype=float)
+    low = panel["Low"].to_numpy(dtype=float)
+
+    results = {}
+    for window in params["sma"]:
+        results[f"sma_{window}"] = sma(close, window)
+    for span in params["ema"]:
+        results[f"ema_{span}"] = ema(close, span)
+    (
+        results["macd"],
+        results["macd_signal"],
+        results["macd_hist"],
+    ) = macd(close, *params["macd"])
+    results["rsi"] = rsi(close, params["rsi"])
+    (
+        results["bb_middle"],
+        results["bb_upper"],
+        results["bb_lower"],
+    ) = bollinger(close, *params["bollinger"])
+    results["stoch_k"], results["stoch_d"] = stochastic(
+        high, low, close, *params["stochastic"]
+    )
+
+    columns = pd.MultiIndex.from_product(
+        [list(results), panel["Close"].columns], names=["indicator", "ticker"]
+    )
+    return pd.DataFrame(
+        np.concatenate(list(results.values()), axis=1),
+        index=panel["Close"].index,
+        columns=columns,
+    )
+
+
+class IndicatorState:
+    """
+    Running state of the indicators of one ticker, advanced in O(1) per bar.
+
+    Keeps the EMAs, RSI average gain/loss, rolling window sums (and the sum of
+    squares for Bollinger) and the last few bars instead of the whole series.
+    Advancing it over a series gives the last row of ``compute()``.
+    """
+
+    def __init__(self, params=None):
+        # lists, like the parameters read back from a saved state
+        self.params = json.loads(json.dumps({**PARAMS, **(params or {})}))
+        sma_windows, bb_window = self.params["sma"], self.params["bollinger"][0]
+        stoch_window, stoch_smooth = self.params["stochastic"]
+        self.count = 0
+        self.last = None
+        self.prev = None
+        self.offset = None
+        self.closes = deque(maxlen=max(*sma_windows, bb_window))
+        self.sums = {window: 0.0 for window in {*sma_windows, bb_window}}
+        self.sumsq = 0.0
+        self.emas = {
+            span: None for span in {*self.params["ema"], *self.params["macd"][:2]}
+        }
+        self.signal = None
+        self.lines = 0
+        self.gain = None
+        self.loss = None
+        self.changes = 0
+        self.highs = deque(maxlen=stoch_window)
+        self.lows = deque(maxlen=stoch_window)
+        self.ks = deque(maxlen=stoch_smooth)
+
+    def _resum(self):
+        """Recompute the window sums, running sums slowly lose precision."""
+        closes = list(self.closes)
+        for window in self.sums:
+            self.sums[window] = sum(value - self.offset for value in closes[-window:])
+        bb_window = self.params["bollinger"][0]
+        self.sumsq = sum((value - self.offset) ** 2 for value in closes[-bb_window:])
+
+    def update(self, high, low, close, when=None):
+        """Advance the state by one bar, missing prices repeat the last bar."""
+        if self.prev is not None:
+            high, low, close = (
+                old if np.isnan(new) else new
+                for new, old in zip((high, low, close), self.prev)
+            )
+        if np.isnan(close):
+            return
+        if self.offset is None:
+            # shifted like rolling_std() does
+            self.offset = close
+
+        # rolling sums, the value leaving each window is still in the deque
+        for window in self.sums:
+            if len(self.closes) >= window:
+                self.sums[window] -= self.closes[-window] - self.offset
+            self.sums[window] += close - self.offset
+        bb_window = self.params["bollinger"][0]
+        if len(self.closes) >= bb_window:
+            self.sumsq -= (self.closes[-bb_window] - self.offset) ** 2
+        self.sumsq += (close - self.offset) ** 2
+
+        for span, value in self.emas.items():
+            self.emas[span] = (
+                close if value is None else value + 2.0 / (span + 1) * (close - value)
+            )
+        fast, slow, signal = self.params["macd"]
+        if self.count + 1 >= slow:
+            line = self.emas[fast] - self.emas[slow]
+            self.signal = (
+                line
+                if self.signal is None
+                else self.signal + 2.0 / (signal + 1) * (line - self.signal)
+            )
+            self.lines += 1
+
+        if self.prev is not None:
+            change, alpha = close - self.prev[2], 1.0 / self.params["rsi"]
+            gain, loss = max(change, 0.0), max(-change, 0.0)
+            self.gain = (
+                gain if self.gain is None else self.gain + alpha * (gain - self.gain)
+            )
+            self.loss = (
+                loss if self.loss is None else self.loss + alpha * (loss - self.loss)
+            )
+            self.changes += 1
+
+        self.closes.append(close)
+        self.highs.append(high)
+        self.lows.append(low)
+        self.count += 1
+        self.prev = (high, low, close)
+        self.last = when
+        if self.count % self.closes.maxlen == 0:
+            self._resum()
+
+        k = np.nan
+        if len(self.highs) == self.highs.maxlen:
+            lowest, highest = min(self.lows), max(self.highs)
+            if highest != lowest:
+                k = 100.0 * (close - lowest) / (highest - lowest)
+        self.ks.append(k)
+
+    def values(self):
+        """Current value of every indicator, NaN until enough bars were seen."""
+        nan = float("nan")
+        out = {}
+        for window in self.params["sma"]:
+            out[f"sma_{window}"] = (
+                self.sums[window] / window + self.offset
+                if self.count >= window
+                else nan
+            )
+        for span in self.params["ema"]:
+            out[f"ema_{span}"] = self.emas[span] if self.count >= span else nan
+
+        fast, slow, signal = self.params["macd"]
+        line = self.emas[fast] - self.emas[slow] if self.count >= slow else nan
+        signal_line = self.signal if self.lines >= signal else nan
+        out["macd"], out["macd_signal"] = line, signal_line
+        out["macd_hist"] = line - signal_line
+
+        if self.changes < self.params["rsi"]:
+            out["rsi"] = nan
+        elif self.loss == 0:
+            out["rsi"] = 100.0
+        else:
+            out["rsi"] = 100.0 - 100.0 / (1.0 + self.gain / self.loss)
+
+        window, num_std = self.params["bollinger"]
+        if self.count >= window:
+            mean = self.sums[window] / window
+            spread = num_std * np.sqrt(max(self.sumsq / window - mean * mean, 0.0))
+            middle = mean + self.offset
+        else:
+            middle = spread = nan
+        out["bb_middle"], out["bb_upper"], out["bb_lower"] = (
+            middle,
+            middle + spread,
+            middle - spread,
+        )
+
+        out["stoch_k"] = self.ks[-1] if self.ks else nan
+        out["stoch_d"] = (
+            sum(self.ks) / len(self.ks)
+            if len(self.ks) == self.ks.maxlen and not np.isnan(list(self.ks)).any()
+            else nan
+        )
+        return out
+
+    def to_dict(self):
+        """JSON friendly state."""
+        return {
+            "params": self.params,
+            "count": self.count,
+            "last": self.last,
+            "prev": self.prev,
+            "offset": self.offset,
+            "closes": list(self.closes),
+            "sums": list(self.sums.items()),
+            "sumsq": self.sumsq,
+            "emas": list(self.emas.items()),
+            "signal": self.signal,
+            "lines": self.lines,
+            "gain": self.gain,
+            "loss": self.loss,
+            "changes": self.changes,
+            "highs": list(self.highs),
+            "lows": list(self.lows),
+            "ks": list(self.ks),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Restore a state saved with ``to_dict()``."""
+        state = cls(data["params"])
+        for key in ("count", "last", "offset", "sumsq", "signal", "lines"):
+            setattr(state, key, data[key])
+        for key in ("gain", "loss", "changes"):
+            setattr(state, key, data[key])
+        state.prev = tuple(data["prev"]) if data["prev"] is not None else None
+        state.sums = dict(data["sums"])
+        state.emas = dict(data["emas"])
+        state.closes.extend(data["closes"])
+        state.highs.extend(data["highs"])
+        state.lows.extend(data["lows"])
+        state.ks.extend(data["ks"])
+        return state
+
+
+def state_path(ticker):
+    """Indicator state saved next to the bar series of a ticker."""
+    return f"{HISTORY_DIR}/{ticker}.state.json"
+
+
+def load_state(ticker):
+    """Saved indicator state and latest values of a ticker, or None."""
+    try:
+        return codec.read_json(state_path(ticker))
+    except FileNotFoundError:
+        return None
+
+
+def _fingerprint(bars, count):
+    """
+    First and last of the `count` bars a state was built from.
+
+    A dividend or split re-adjusts every earlier bar without changing the
+    dates, the closes tell the series apart.
+    """
+    if not count:
+        return None
+    closes = bars["Close"]
+    return [
+        [when.isoformat(), None if np.isnan(close) else float(close)]
+        for when, close in (
+            (bars.index[0], closes.iloc[0]),
+            (bars.index[count - 1], closes.iloc[count - 1]),
+        )
+    ]
+
+
+def sync_state(ticker, bars, params=None):
+    """
+    Bring the saved indicator state of a ticker up to date with its series.
+
+    The state is kept as of the second to last bar, the last one is re-fetched
+    (and may change) on every sync. Only the bars after the saved state are
+    applied, the state is rebuilt when older bars changed (gap fills, prices
+    re-adjusted for a dividend or split) or the parameters did.
+
+    Returns:
+        dict: The latest value of every indicator.
+    """
+    if bars.empty:
+        return {}
+    saved = load_state(ticker)
+    state, done = None, 0
+    if saved is not None:
+        state = IndicatorState.from_dict(saved["state"])
+        done = bars.index.searchsorted(pd.Timestamp(state.last), side="right")
+        expected = IndicatorState(params).params
+        if (
+            done != state.count
+            or done >= len(bars)
+            or state.params != expected
+            or saved.get("bars") != _fingerprint(bars, done)
+        ):
+            state, done = None, 0
+    if state is None:
+        state = IndicatorState(params)
+
+    rows = bars[["High", "Low", "Close"]].to_numpy(dtype=float)
+    for when, (high, low, close) in zip(bars.index[done:-1], rows[done:-1]):
+        state.update(high, low, close, when.isoformat())
+
+    current = copy.deepcopy(state)
+    current.update(*rows[-1], bars.index[-1].isoformat())
+    values = current.values()
+    data = {
+        "date": current.last,
+        "values": values,
+        "state": state.to_dict(),
+        "bars": _fingerprint(bars, len(bars) - 1),
+    }
+    os.makedirs(HISTORY_DIR, exist_ok=True)
+    store.write_json(state_path(ticker), data)
+    return values
+
+
+def latest(tickers=None):
+    """
+    Latest indicator values from the saved states, no series is read.
+
+    Returns:
+        DataFrame: Tickers x indicators, with the date of the last bar.
+    """
+    tickers = tickers if tickers is not None else history_tickers()
+    rows = {}
+    for ticker in tickers:
+        saved = load_state(ticker)
+        if saved is not None:
+            rows[ticker] = {"date": saved["date"], **saved["values"]}
+    return pd.DataFrame.from_dict(rows, orient="index")
+
+
+def history_tickers():
+    """Tickers with a stored bar series."""
+    return sorted(
+        os.path.basename(path)[: -len(".parquet")]
+        for path in glob(f"{HISTORY_DIR}/*.parquet")
+    )
+
+
+def _history_file(ticker):
+    return f"{HISTORY_DIR}/{ticker}.parquet"
+
+
+def data_version(tickers, params=None):
+    """Hash of the history files and parameters the indicators depend on."""
+    stamps = []
+    for ticker in tickers:
+        try:
+            stat = os.stat(_history_file(ticker))
+            stamps.append((ticker, stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            stamps.append((ticker, None, None))
+    key = repr((stamps, sorted({**PARAMS, **(params or {})}.items())))
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _read_bars(path):
+    """Calendar dates and Close/High/Low columns of a stored bar series."""
+    pfile = pq.ParquetFile(path)
+    index = pfile.schema_arrow.pandas_metadata["index_columns"][0]
+    table = pfile.read(columns=[index] + FIELDS)
+    dates = table.column(index)
+    if getattr(dates.type, "tz", None) is not None:
+        # daily bars, keep the exchange's calendar date
+        dates = pc.local_timestamp(dates)
+    dates = dates.to_numpy().astype("datetime64[ns]")
+    return dates, np.column_stack([table.column(f).to_numpy() for f in FIELDS])
+
+
+def load_panel(tickers):
+    """Close/High/Low of the stored series of `tickers` as aligned panels."""
+    found, bars = [], []
+    for ticker in tickers:
+        try:
+            bars.append(_read_bars(_history_file(ticker)))
+        except FileNotFoundError:
+            continue
+        found.append(ticker)
+
+    dates = np.unique(np.concatenate([day for day, _ in bars] or [[]]))
+    dates = dates.astype("datetime64[ns]")
+    values = np.full((len(FIELDS), len(dates), len(found)), np.nan)
+    for column, (days, fields) in enumerate(bars):
+        values[:, np.searchsorted(dates, days), column] = fields.T.astype(float)
+
+    index = pd.DatetimeIndex(dates, name="Date")
+    # fill holes (halts, missing bars), not the dates before a listing
+    return {
+        field: pd.DataFrame(_ffill(values[pos]), index=index, columns=found)
+        for pos, field in enumerate(FIELDS)
+    }
+
+
+def _to_long(result):
+    """(date, ticker) rows x indicator columns, compact to store."""
+    names = result.columns.unique("indicator")
+    tickers = result.columns.unique("ticker")
+    values = result.to_numpy().reshape(len(result), len(names), len(tickers))
+    index = pd.MultiIndex.from_product(
+        [result.index, tickers], names=[result.index.name, "ticker"]
+    )
+    return pd.DataFrame(
+        values.transpose(0, 2, 1).reshape(-1, len(names)),
+        index=index,
+        columns=names,
+    )
+
+
+def _from_long(frame):
+    """Inverse of ``_to_long``."""
+    dates = frame.index.unique(0)
+    tickers = frame.index.unique("ticker")
+    values = frame.to_numpy().reshape(len(dates), len(tickers), len(frame.columns))
+    columns = pd.MultiIndex.from_product(
+        [frame.columns, tickers], names=["indicator", "ticker"]
+    )
+    return pd.DataFrame(
+        values.transpose(0, 2, 1).reshape(len(dates), -1),
+        index=dates,
+        columns=columns,
+    )
+
+
+def _remember(version, result):
+    with _LOCK:
+        _CACHE[version] = result
+        _CACHE.move_to_end(version)
+        while len(_CACHE) > INDICATOR_CACHE_ENTRIES:
+            _CACHE.popitem(last=False)
+
+
+def _prune():
+    """Keep the most recent cached results on disk."""
+    files = sorted(glob(f"{INDICATORS_DIR}/*.parquet"), key=os.path.getmtime)
+    for path in files[:-INDICATOR_CACHE_FILES]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def indicators(tickers=None, params=None):
+    """
+    Indicators of the stored series, computed once per data version.
+
+    Parameters:
+        tickers (list): Tickers to include, all stored series by default.
+        params (dict): Indicator parameters, defaults to ``PARAMS``.
+
+    Returns:
+        DataFrame: Dates x (indicator, ticker) columns.
+    """
+    tickers = sorted(set(tickers)) if tickers is not None else history_tickers()
+    version = data_version(tickers, params)
+    with _LOCK:
+        if version in _CACHE:
+            _CACHE.move_to_end(version)
+            return _CACHE[version]
+
+    path = f"{INDICATORS_DIR}/{version}.parquet"
+    try:
+        result = _from_long(pd.read_parquet(path))
+    except FileNotFoundError:
+        result = compute(load_panel(tickers), params)
+        if not result.empty:
+            os.makedirs(INDICATORS_DIR, exist_ok=True)
+            store.write_table(_to_long(result), path)
+            _prune()
+    _remember(version, result)
+    return result
+
+
+def for_ticker(ticker, params=None):
+    """Indicators of one ticker, dates x indicator."""
+    result = indicators([ticker], params)
+    if result.empty:
+        return pd.DataFrame()
+    return result.xs(ticker, axis=1, level="ticker")
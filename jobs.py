@@ -0,0 +1,159 @@
+"""Background jobs for the dashboard.
+
+A job runs a function over a list of items (ex. tickers) on a process-wide
+thread pool, outside the Streamlit script thread, so the page stays responsive
+and the job keeps going when the browser disconnects. Jobs are deduplicated by
+name and items already queued by another job are skipped, a second click on a
+refresh button attaches to the running job instead of starting another crawl.
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "8"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+SKIPPED = "skipped"
+FINISHED = (DONE, FAILED, CANCELLED, SKIPPED)
+
+
+class Job:
+    """Status of every item of a job, updated by the pool threads."""
+
+    def __init__(self, name, items):
+        self.name = name
+        self.status = {item: QUEUED for item in items}
+        self.errors = {}
+        self.started = time.time()
+        self.finished = None
+        self.cancelled = threading.Event()
+        self.lock = threading.Lock()
+        if not self.status:
+            self.finished = self.started
+
+    def set(self, item, status, err=None):
+        """Record the status of an item, the job finishes with its last item."""
+        with self.lock:
+            self.status[item] = status
+            if err is not None:
+                self.errors[item] = str(err)
+            if self.finished is None and all(
+                value in FINISHED for value in self.status.values()
+            ):
+                self.finished = time.time()
+
+    def cancel(self):
+        """Skip the items that haven't started yet."""
+        self.cancelled.set()
+
+    @property
+    def running(self):
+        return self.finished is None
+
+    def snapshot(self):
+        """Counts, progress and throughput of the job, safe to render."""
+        with self.lock:
+            status = dict(self.status)
+            errors = dict(self.errors)
+            finished = self.finished
+        counts = {value: 0 for value in (QUEUED, RUNNING, *FINISHED)}
+        for value in status.values():
+            counts[value] += 1
+        completed = counts[DONE] + counts[FAILED]
+        elapsed = (finished or time.time()) - self.started
+        return {
+            "name": self.name,
+            "total": len(status),
+            "counts": counts,
+            "progress": sum(counts[value] for value in FINISHED) / max(len(status), 1),
+            "per_sec": completed / elapsed if elapsed > 0 else 0.0,
+            "elapsed": elapsed,
+            "running": finished is None,
+            "cancelled": self.cancelled.is_set(),
+            "status": status,
+            "errors": errors,
+        }
+
+
+class JobRunner:
+    """Thread pool running jobs, at most one running job per name."""
+
+    def __init__(self, workers=JOB_WORKERS):
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="job")
+        self.jobs = {}
+        self.in_flight = set()
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        """The last job submitted under `name`, or None."""
+        with self.lock:
+            return self.jobs.get(name)
+
+    def submit(self, name, func, items):
+        """
+        Run `func(item)` for every item in the background.
+
+        Parameters:
+            name (str): Job name, a running job with the same name is reused.
+            func (callable): Called once per item.
+            items (list): Items to process, duplicates are dropped.
+
+        Returns:
+            tuple: (job, True if it was started by this call).
+        """
+        with self.lock:
+            job = self.jobs.get(name)
+            if job is not None and job.running:
+                return job, False
+            job = Job(name, list(dict.fromkeys(items)))
+            self.jobs[name] = job
+            queued = [item for item in job.status if item not in self.in_flight]
+            self.in_flight.update(queued)
+
+        skipped = set(job.status) - set(queued)
+        for item in skipped:
+            # queued by another job already
+            job.set(item, SKIPPED)
+        for item in queued:
+            self.executor.submit(self._run, job, func, item)
+        logger.info("Started job %s for %s items", name, len(queued))
+        return job, True
+
+    def _run(self, job, func, item):
+        try:
+            if job.cancelled.is_set():
+                job.set(item, CANCELLED)
+                return
+            job.set(item, RUNNING)
+            try:
+                func(item)
+            except Exception as err:  # isolate failures per item
+                logger.error("Job %s failed for %s - %s", job.name, item, err)
+                job.set(item, FAILED, err)
+                return
+            job.set(item, DONE)
+        finally:
+            with self.lock:
+                self.in_flight.discard(item)
+
+
+_RUNNER = None
+_RUNNER_LOCK = threading.Lock()
+
+
+def runner():
+    """The process-wide job runner."""
+    global _RUNNER
+    with _RUNNER_LOCK:
+        if _RUNNER is None:
+            _RUNNER = JobRunner()
+        return _RUNNER
@@ -0,0 +1,162 @@
+"""Local store of FRED macro-economic series.
+
+Every series is kept in ``{DATA_DIR}/MIDAS/macro/{series}.parquet``. A refresh
+fetches the stale series concurrently and only asks FRED for the observations
+from the last stored date on, the dashboard then reads an aligned panel from
+local disk.
+"""
+
+import argparse
+import logging
+import os
+import time
+from datetime import datetime
+
+import pandas as pd
+
+import engine
+import httpclient
+import ratelimit
+import store
+
+logger = logging.getLogger(__name__)
+
+MACRO_DIR = f"{store.MIDAS_DATA_DIR}/macro"
+MACRO_START = os.getenv("MACRO_START", "1960-01-01")
+# Series synced in the last MACRO_MAX_AGE seconds aren't fetched again
+MACRO_MAX_AGE = int(os.getenv("MACRO_MAX_AGE", str(12 * 60 * 60)))
+MACRO_CONCURRENCY = int(os.getenv("MACRO_CONCURRENCY", "8"))
+
+# Panel column to FRED series id
+SERIES = {
+    "data_gdp": "GDP",
+    "data_cpi": "CPIAUCSL",
+    "data_stock": "SPASTT01USM661N",
+    "data_pce": "PCE",
+    "data_govs": "FGEXPND",
+    "data_binv": "W987RC1Q027SBEA",
+    "data_em": "PAYEMS",
+    "data_unem": "ICSA",
+}
+
+
+def series_path(series_id):
+    """Parquet file of a FRED series."""
+    return f"{MACRO_DIR}/{series_id}.parquet"
+
+
+def load_series(series_id):
+    """Stored observations of a series, empty if it was never synced."""
+    try:
+        return pd.read_parquet(series_path(series_id))[series_id]
+    except FileNotFoundError:
+        return pd.Series(name=series_id, dtype=float)
+
+
+def is_fresh(series_id, max_age=MACRO_MAX_AGE):
+    """Check if a series was synced in the last `max_age` secs."""
+    try:
+        return time.time() - os.path.getmtime(series_path(series_id)) < max_age
+    except FileNotFoundError:
+        return False
+
+
+def fetch_series(series_id, start, end=None):
+    """Observations of a FRED series between two dates."""
+    # Imported here, only the refresh needs pandas_datareader
+    import pandas_datareader as pdr  # pylint: disable=import-outside-toplevel
+
+    ratelimit.limiter("fred").acquire()
+    data = pdr.DataReader(
+        series_id, "fred", start, end or datetime.now(), session=httpclient.session()
+    )[series_id]
+    data.index = pd.to_datetime(data.index)
+    return data
+
+
+def sync_series(series_id, max_age=MACRO_MAX_AGE):
+    """
+    Bring one stored series up to date.
+
+    Only the observations from the last stored date on are requested, the last
+    one again since FRED revises recent values.
+
+    Returns:
+        int: Number of stored observations.
+    """
+    stored = load_series(series_id)
+    if not stored.empty and is_fresh(series_id, max_age):
+        return len(stored)
+
+    start = stored.index[-1] if not stored.empty else MACRO_START
+    new = fetch_series(series_id, start)
+    merged = pd.concat([stored, new]) if not stored.empty else new
+    merged = merged[~merged.index.duplicated(keep="last")].sort_index()
+
+    os.makedirs(MACRO_DIR, exist_ok=True)
+    if merged.equals(stored):
+        # nothing new, only mark the series as synced
+        os.utime(series_path(series_id))
+    else:
+        store.write_table(merged.to_frame(series_id), series_path(series_id))
+    logger.debug("Synced %s, %s new observations", series_id, len(merged) - len(stored))
+    return len(merged)
+
+
+def refresh(series=None, max_age=MACRO_MAX_AGE, concurrency=MACRO_CONCURRENCY):
+    """
+    Sync the stale series concurrently.
+
+    Parameters:
+        series (list): FRED series ids, all of ``SERIES`` by default.
+        max_age (int): Secs a synced series stays fresh, 0 forces a fetch.
+        concurrency (int): Series fetched at once.
+
+    Returns:
+        dict: Series id to number of stored observations, None on failure.
+    """
+    series = series if series is not None else list(SERIES.values())
+    results = engine.run(
+        lambda series_id: sync_series(series_id, max_age),
+        [(series_id,) for series_id in series],
+        concurrency,
+    )
+    return {series_id: results[(series_id,)] for series_id in series}
+
+
+def load_panel(columns=None, how="inner"):
+    """
+    Stored series aligned on their dates, read from local disk only.
+
+    Parameters:
+        columns (dict): Panel column to FRED series id, defaults to ``SERIES``.
+        how (str): ``inner`` keeps the dates every series has, ``outer`` all.
+
+    Returns:
+        DataFrame: One column per series.
+    """
+    columns = columns or SERIES
+    panel = pd.concat(
+        {name: load_series(series_id) for name, series_id in columns.items()},
+        axis=1,
+        join=how,
+    )
+    return panel.sort_index()
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--force",
+        help="Fetch every series, even the fresh ones.",
+        action="store_true",
+        default=False,
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    logger.info(refresh(max_age=0 if args.force else MACRO_MAX_AGE))
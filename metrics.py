@@ -0,0 +1,267 @@
+"""Process metrics in the Prometheus text format.
+
+Counters, gauges and histograms with labels, kept in memory per process. The
+API serves them on ``/metrics``, the workers on a small HTTP listener started
+with `serve` (``METRICS_PORT``). Collectors registered with `collector` are
+called before every scrape to refresh gauges read from elsewhere, ex. the
+scheduler queue.
+"""
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BYTES = tuple(1024 * 4**power for power in range(10))
+
+_REGISTRY = []
+_COLLECTORS = []
+_LOCK = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+        with _LOCK:
+            _REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """(suffix, label values, extra labels, value) of every sample."""
+        with self.lock:
+            return [(("", key, (), value)) for key, value in self.values.items()]
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for suffix, key, extra, value in self.samples():
+            lines.append(
+                f"{self.name}{suffix}{_labels(self.labelnames, key, extra)}"
+                f" {_number(value)}"
+            )
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """A value that only goes up."""
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def set_total(self, value, **labels):
+        """Set the total of a counter counted elsewhere, ex. by a cache."""
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+
+class Gauge(_Metric):
+    """A value that goes up and down."""
+
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, with their sum."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=SECONDS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0.0))
+            for pos, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[pos] += 1
+                    break
+            self.values[key] = (counts, total + value)
+
+    def totals(self, **labels):
+        """(count, sum) of the observations of one label set."""
+        with self.lock:
+            counts, total = self.values.get(self._key(labels), ((), 0.0))
+            return sum(counts), total
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the secs spent in the block, also when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self.lock:
+            values = [
+                (key, list(counts), total)
+                for key, (counts, total) in self.values.items()
+            ]
+        samples = []
+        for key, counts, total in values:
+            running = 0
+            for bound, count in zip(self.buckets, counts):
+                running += count
+                samples.append(("_bucket", key, (("le", _number(bound)),), running))
+            samples.append(("_sum", key, (), total))
+            samples.append(("_count", key, (), running))
+        return samples
+
+
+def collector(func):
+    """Call `func()` before every scrape, to refresh gauges."""
+    with _LOCK:
+        _COLLECTORS.append(func)
+    return func
+
+
+def render():
+    """Every metric of the process in the Prometheus text format."""
+    with _LOCK:
+        collectors = list(_COLLECTORS)
+        registry = list(_REGISTRY)
+    for func in collectors:
+        try:
+            func()
+        except Exception as err:  # a broken collector mustn't break the scrape
+            logger.error("Metrics collector %s failed - %s", func.__name__, err)
+    return "\n".join(metric.render() for metric in registry) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serve `render()` on every GET."""
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        logger.debug(format, *args)
+
+
+def serve(port=METRICS_PORT):
+    """
+    Serve the metrics over HTTP from a background thread.
+
+    Parameters:
+        port (int): Port to listen on, 0 disables the listener.
+
+    Returns:
+        The server, or None when disabled or the port is taken.
+    """
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer(("", port), MetricsHandler)
+    except OSError as err:
+        logger.error("Metrics listener not started on port %s - %s", port, err)
+        return None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info("Serving metrics on port %s", port)
+    return server
+
+
+# Shared by the workers and the API
+PROVIDER_LATENCY = Histogram(
+    "midas_provider_request_seconds",
+    "Latency of requests to the data providers.",
+    ["provider"],
+)
+PROVIDER_ERRORS = Counter(
+    "midas_provider_errors_total",
+    "Requests to the data providers that failed or returned an error status.",
+    ["provider"],
+)
+LIMITER_WAIT = Histogram(
+    "midas_ratelimit_wait_seconds",
+    "Time spent waiting for a rate limit token.",
+    ["provider"],
+)
+SECTION_SECONDS = Histogram(
+    "midas_section_fetch_seconds",
+    "Time to fetch one snapshot section in fetch_stock_data.",
+    ["section"],
+)
+SECTION_ERRORS = Counter(
+    "midas_section_errors_total",
+    "Snapshot sections that failed to fetch.",
+    ["section"],
+)
+SNAPSHOT_BYTES = Histogram(
+    "midas_snapshot_write_bytes",
+    "Bytes written by one snapshot write, objects and manifest.",
+    buckets=BYTES,
+)
+STORE_BYTES = Counter(
+    "midas_store_bytes_written_total",
+    "Bytes written to the snapshot store.",
+    ["kind"],
+)
+STORE_OBJECTS = Counter(
+    "midas_store_objects_total",
+    "Section objects stored, or found already stored.",
+    ["kind", "result"],
+)
+QUEUE_ITEMS = Gauge(
+    "midas_queue_items",
+    "Items of a scheduler queue by state.",
+    ["queue", "state"],
+)
+CACHE_REQUESTS = Counter(
+    "midas_api_cache_requests_total",
+    "Lookups in the API snapshot cache.",
+    ["result"],
+)
+CACHE_BYTES = Gauge(
+    "midas_api_cache_bytes",
+    "Bytes held by the API snapshot cache.",
+)
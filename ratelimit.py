@@ -0,0 +1,84 @@
+"""Token-bucket rate limiting shared by every fetcher of a provider.
+
+All threads that talk to the same provider draw from one bucket, so requests go
+out as fast as the provider allows instead of being paced by fixed sleeps. Rates
+(requests per second) are configured per provider with ``RATE_LIMIT_<PROVIDER>``
+environment variables.
+"""
+
+import logging
+import os
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Requests per second and burst size per provider
+LIMITS = {
+    "yfinance": (float(os.getenv("RATE_LIMIT_YFINANCE", "2")), 5),
+    "alphavantage": (float(os.getenv("RATE_LIMIT_ALPHAVANTAGE", str(5 / 60))), 1),
+    "sec": (float(os.getenv("RATE_LIMIT_SEC", "8")), 8),
+    "wikipedia": (float(os.getenv("RATE_LIMIT_WIKIPEDIA", "1")), 1),
+    "fred": (float(os.getenv("RATE_LIMIT_FRED", "2")), 8),
+}
+
+
+class TokenBucket:
+    """Thread-safe token bucket usable from threads and coroutines."""
+
+    def __init__(self, rate, capacity=1, name=None):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        """Take tokens now and return how long the caller has to wait for them."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            # going negative queues callers in order instead of letting them race
+            self.tokens -= tokens
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / self.rate
+
+    def pending(self):
+        """Secs a request made now would wait, without taking a token."""
+        with self.lock:
+            now = time.monotonic()
+            tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            return max(1 - tokens, 0) / self.rate
+
+    def acquire(self, tokens=1):
+        """Block the calling thread until the tokens are available."""
+        wait = self.reserve(tokens)
+        if wait:
+            time.sleep(wait)
+        self._observe(wait)
+        return wait
+
+    def _observe(self, wait):
+        if self.name is not None:
+            metrics.LIMITER_WAIT.observe(wait, provider=self.name)
+
+
+_BUCKETS = {}
+_BUCKETS_LOCK = threading.Lock()
+
+
+def limiter(provider):
+    """The process-wide bucket of a provider."""
+    with _BUCKETS_LOCK:
+        if provider not in _BUCKETS:
+            rate, capacity = LIMITS[provider]
+            logger.debug("Rate limit for %s: %s req/s", provider, rate)
+            _BUCKETS[provider] = TokenBucket(rate, capacity, provider)
+        return _BUCKETS[provider]
@@ -0,0 +1,417 @@
+"""Persistent priority scheduler for the workers.
+
+Work items (a ticker, a (form, ticker) pair, ...) are kept per queue in a SQLite
+table under DATA_DIR with the time each one is next due. The scheduler runs
+continuously: whenever a worker slot is free it starts the most urgent due item,
+lowest priority first and then the most overdue relative to its interval, as
+long as the provider of its queue isn't already backed up. It only sleeps until
+the next item is due.
+
+Workers on several hosts can share the queues: an item is claimed with a lease
+owned by one node (``NODE_ID``) and renewed by heartbeats while it runs, so no
+two replicas work on the same item. A crashed replica stops renewing and its
+items are claimed by the others once the lease expires.
+"""
+
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import metrics
+import ratelimit
+from universe import OTHER_STOCKS
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.getenv("DATA_DIR", "/data")
+SCHEDULER_DB = os.getenv("SCHEDULER_DB", f"{DATA_DIR}/scheduler.db")
+WORKERS = int(os.getenv("WORKERS", "16"))
+# A failed item is retried after RETRY_DELAY secs, doubling up to its interval
+RETRY_DELAY = int(os.getenv("SCHEDULER_RETRY_DELAY", str(5 * 60)))
+# No new work is started for a provider whose requests already wait this long
+MAX_PROVIDER_WAIT = float(os.getenv("SCHEDULER_MAX_PROVIDER_WAIT", "30"))
+# Longest sleep when nothing is due, so a universe refresh isn't missed
+IDLE_WAIT = 60
+# Owner of the leases taken by this process, unique per replica
+NODE_ID = os.getenv("NODE_ID", f"{socket.gethostname()}:{os.getpid()}")
+# Secs a claimed item stays leased without a heartbeat
+LEASE_TTL = float(os.getenv("SCHEDULER_LEASE_TTL", "120"))
+HEARTBEAT = LEASE_TTL / 4
+
+# Priorities, lower runs first
+HELD = 0
+INDEX = 1
+TAIL = 2
+# Comma separated, our own picks by default
+HELD_TICKERS = [
+    ticker.strip()
+    for ticker in os.getenv("HELD_TICKERS", ",".join(OTHER_STOCKS)).split(",")
+    if ticker.strip()
+]
+
+_LOCK = threading.Lock()
+_CONN = None
+
+
+def connect():
+    """The process-wide queue connection, creating the schema on first use."""
+    global _CONN
+    with _LOCK:
+        if _CONN is None:
+            os.makedirs(os.path.dirname(SCHEDULER_DB), exist_ok=True)
+            _CONN = sqlite3.connect(SCHEDULER_DB, timeout=30, check_same_thread=False)
+            _CONN.executescript(
+                "CREATE TABLE IF NOT EXISTS work ("
+                " queue TEXT NOT NULL,"
+                " item TEXT NOT NULL,"
+                " priority INTEGER NOT NULL,"
+                " interval REAL NOT NULL,"
+                " due REAL NOT NULL,"
+                " started REAL,"
+                " finished REAL,"
+                " failures INTEGER NOT NULL DEFAULT 0,"
+                " error TEXT,"
+                " owner TEXT,"
+                " lease_until REAL,"
+                " PRIMARY KEY (queue, item));"
+                "CREATE INDEX IF NOT EXISTS work_due ON work (queue, due);"
+            )
+            columns = {row[1] for row in _CONN.execute("PRAGMA table_info(work)")}
+            for column, kind in (("owner", "TEXT"), ("lease_until", "REAL")):
+                # queues created before leases
+                if column not in columns:
+                    _CONN.execute(f"ALTER TABLE work ADD COLUMN {column} {kind}")
+            _CONN.commit()
+        return _CONN
+
+
+def _execute(sql, params=()):
+    conn = connect()
+    with _LOCK:
+        rows = conn.execute(sql, params).fetchall()
+        conn.commit()
+    return rows
+
+
+def _encode(item):
+    return json.dumps(list(item))
+
+
+def _decode(item):
+    return tuple(json.loads(item))
+
+
+def ticker_priority(ticker, index=()):
+    """Held positions first, then the index members, then the long tail."""
+    if ticker in HELD_TICKERS:
+        return HELD
+    if ticker in index:
+        return INDEX
+    return TAIL
+
+
+def sync(queue, items, interval):
+    """
+    Make the items of a queue match `items`.
+
+    New items are due right away, known items keep their due time (moved up
+    when the interval got shorter), items no longer listed are dropped.
+
+    Parameters:
+        queue (str): Queue name.
+        items (dict): Item tuple to priority.
+        interval (float): Secs between two runs of an item.
+    """
+    now = time.time()
+    conn = connect()
+    with _LOCK:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS listed (item TEXT)")
+        conn.execute("DELETE FROM listed")
+        conn.executemany(
+            "INSERT INTO listed VALUES (?)", [(_encode(item),) for item in items]
+        )
+        conn.execute(
+            "DELETE FROM work WHERE queue = ? AND item NOT IN (SELECT item FROM listed)",
+            (queue,),
+        )
+        conn.executemany(
+            "INSERT INTO work (queue, item, priority, interval, due)"
+            " VALUES (?, ?, ?, ?, ?)"
+            " ON CONFLICT (queue, item) DO UPDATE SET"
+            " priority = excluded.priority,"
+            " interval = excluded.interval,"
+            " due = MIN(due, COALESCE(finished, 0) + excluded.interval)",
+            [
+                (queue, _encode(item), priority, interval, now)
+                for item, priority in items.items()
+            ],
+        )
+        conn.commit()
+    logger.info("Queue %s has %s items", queue, len(items))
+
+
+# An item is free when nobody holds a live lease on it
+_FREE = "(started IS NULL OR lease_until < ?)"
+
+
+def claim(queues, limit, now=None):
+    """
+    Lease the most urgent due items of `queues` to this node.
+
+    Every lease is taken with a conditional update, an item another replica
+    leased in the meantime is skipped.
+
+    Returns:
+        list: (queue, item) of the claimed items.
+    """
+    if not queues or limit <= 0:
+        return []
+    now = now or time.time()
+    marks = ",".join("?" * len(queues))
+    conn = connect()
+    claimed = []
+    with _LOCK:
+        rows = conn.execute(
+            f"SELECT queue, item FROM work WHERE queue IN ({marks})"
+            f" AND {_FREE} AND due <= ?"
+            " ORDER BY priority, (? - due) / interval DESC LIMIT ?",
+            # a few extra candidates for the ones other replicas take first
+            (*queues, now, now, now, 2 * limit),
+        ).fetchall()
+        for queue, item in rows:
+            if len(claimed) >= limit:
+                break
+            cursor = conn.execute(
+                "UPDATE work SET started = ?, owner = ?, lease_until = ?"
+                f" WHERE queue = ? AND item = ? AND {_FREE} AND due <= ?",
+                (now, NODE_ID, now + LEASE_TTL, queue, item, now, now),
+            )
+            conn.commit()
+            if cursor.rowcount:
+                claimed.append((queue, _decode(item)))
+    return claimed
+
+
+def renew(items):
+    """
+    Extend the leases this node holds on `items`.
+
+    Returns:
+        list: (queue, item) of the items whose lease was lost.
+    """
+    until = time.time() + LEASE_TTL
+    conn = connect()
+    lost = []
+    with _LOCK:
+        for queue, item in items:
+            cursor = conn.execute(
+                "UPDATE work SET lease_until = ?"
+                " WHERE queue = ? AND item = ? AND owner = ?",
+                (until, queue, _encode(item), NODE_ID),
+            )
+            if not cursor.rowcount:
+                lost.append((queue, item))
+        conn.commit()
+    return lost
+
+
+def done(queue, item, err=None):
+    """Record the outcome of an item leased by this node and when it is due next."""
+    now = time.time()
+    if err is None:
+        rows = _execute(
+            "UPDATE work SET started = NULL, owner = NULL, lease_until = NULL,"
+            " finished = ?, due = ? + interval, failures = 0, error = NULL"
+            " WHERE queue = ? AND item = ? AND owner = ? RETURNING item",
+            (now, now, queue, _encode(item), NODE_ID),
+        )
+    else:
+        rows = _execute(
+            "UPDATE work SET started = NULL, owner = NULL, lease_until = NULL,"
+            " due = ? + MIN(? * (1 << MIN(failures, 16)), interval),"
+            " failures = failures + 1, error = ?"
+            " WHERE queue = ? AND item = ? AND owner = ? RETURNING item",
+            (now, RETRY_DELAY, str(err), queue, _encode(item), NODE_ID),
+        )
+    if not rows:
+        logger.warning("Lease on %s %r was lost before it was done", queue, item)
+
+
+def release(queues):
+    """Give up the leases this node still holds, ex. after a restart."""
+    if queues:
+        marks = ",".join("?" * len(queues))
+        _execute(
+            "UPDATE work SET started = NULL, owner = NULL, lease_until = NULL"
+            f" WHERE queue IN ({marks}) AND owner = ?",
+            (*queues, NODE_ID),
+        )
+
+
+def next_due(queues):
+    """
+    Epoch time the next item of `queues` can be claimed, when it is due and
+    its lease (if any) has run out. None when the queues are empty.
+    """
+    marks = ",".join("?" * len(queues))
+    return _execute(
+        f"SELECT MIN(MAX(due, COALESCE(lease_until, 0))) FROM work"
+        f" WHERE queue IN ({marks})",
+        tuple(queues),
+    )[0][0]
+
+
+def status(queue, now=None):
+    """Number of items, due items, leased items and failing items of a queue."""
+    now = now or time.time()
+    total, due, running, failing = _execute(
+        f"SELECT COUNT(*), SUM(due <= ? AND {_FREE}),"
+        f" SUM(NOT {_FREE}), SUM(failures > 0) FROM work WHERE queue = ?",
+        (now, now, now, queue),
+    )[0]
+    return {
+        "total": total,
+        "due": due or 0,
+        "running": running or 0,
+        "failing": failing or 0,
+    }
+
+
+class Scheduler:
+    """Runs the due items of its queues on a thread pool, forever."""
+
+    def __init__(self, workers=WORKERS):
+        self.workers = workers
+        self.tasks = {}
+        self.stop = threading.Event()
+        self.leased = set()
+        self.lock = threading.Lock()
+        metrics.collector(self.collect)
+
+    def add(self, queue, func, items, interval, provider=None, after=None):
+        """
+        Register a queue and sync its items.
+
+        Parameters:
+            queue (str): Queue name.
+            func (callable): Called with the item tuple as arguments.
+            items (dict): Item tuple to priority.
+            interval (float): Secs between two runs of an item, at most this
+                stale once the queue keeps up.
+            provider (str): Rate limited provider the items draw from.
+            after (str): Queue whose due items have to be done first.
+        """
+        self.tasks[queue] = {"func": func, "provider": provider, "after": after}
+        sync(queue, items, interval)
+
+    def collect(self):
+        """Set the queue depth gauges, called on every metrics scrape."""
+        for queue in list(self.tasks):
+            for state, count in status(queue).items():
+                metrics.QUEUE_ITEMS.set(count, queue=queue, state=state)
+
+    def _ready(self):
+        """Queues whose provider has room for more requests and aren't held back."""
+        ready = []
+        for queue, task in self.tasks.items():
+            if task["after"] in self.tasks:
+                before = status(task["after"])
+                if before["due"] or before["running"]:
+                    continue
+            provider = task["provider"]
+            if (
+                provider is None
+                or ratelimit.limiter(provider).pending() < MAX_PROVIDER_WAIT
+            ):
+                ready.append(queue)
+        return ready
+
+    def _run(self, queue, item):
+        try:
+            self.tasks[queue]["func"](*item)
+        except Exception as err:  # isolate failures per item
+            logger.error("%s %r failed - %s", queue, item, err)
+            done(queue, item, err)
+            return
+        finally:
+            with self.lock:
+                self.leased.discard((queue, item))
+        done(queue, item)
+
+    def _heartbeat(self):
+        """Renew the leases of the items in flight until stopped."""
+        while not self.stop.wait(HEARTBEAT):
+            with self.lock:
+                leased = list(self.leased)
+            try:
+                for queue, item in renew(leased):
+                    logger.warning("Lost the lease on %s %r", queue, item)
+            except sqlite3.Error as err:
+                logger.error("Heartbeat failed - %s", err)
+
+    def run(self, refresh=None, refresh_every=24 * 60 * 60, once=False):
+        """
+        Run due items until stopped.
+
+        Parameters:
+            refresh (callable): Called with the scheduler every `refresh_every`
+                secs, to sync the queues with a new universe.
+            refresh_every (float): Secs between two refreshes.
+            once (bool): Return once nothing is due or running.
+        """
+        release(list(self.tasks))
+        heartbeat = threading.Thread(target=self._heartbeat, daemon=True)
+        heartbeat.start()
+        try:
+            self._loop(refresh, refresh_every, once)
+        finally:
+            self.stop.set()
+            heartbeat.join()
+            self.stop.clear()
+
+    def _loop(self, refresh, refresh_every, once):
+        next_refresh = time.time() + refresh_every
+        running = set()
+        with ThreadPoolExecutor(self.workers, thread_name_prefix="sched") as pool:
+            while not self.stop.is_set():
+                if refresh is not None and time.time() >= next_refresh:
+                    refresh(self)
+                    next_refresh = time.time() + refresh_every
+
+                queues = list(self.tasks)
+                ready = self._ready()
+                for queue, item in claim(ready, self.workers - len(running)):
+                    with self.lock:
+                        self.leased.add((queue, item))
+                    running.add(pool.submit(self._run, queue, item))
+
+                if len(running) >= self.workers:
+                    timeout = IDLE_WAIT
+                elif len(ready) < len(queues):
+                    # a provider is backed up or a queue waits on another
+                    timeout = 1
+                else:
+                    if (
+                        once
+                        and not running
+                        and not any(
+                            # leases of other replicas may still run out
+                            state["due"] or state["running"]
+                            for state in map(status, queues)
+                        )
+                    ):
+                        return
+                    upcoming = next_due(queues)
+                    timeout = IDLE_WAIT if upcoming is None else upcoming - time.time()
+                    timeout = min(max(timeout, 0.1), IDLE_WAIT)
+                if running:
+                    _, running = wait(
+                        running, timeout=timeout, return_when=FIRST_COMPLETED
+                    )
+                else:
+                    self.stop.wait(timeout)
@@ -1,21 +1,33 @@
 import sys
-import json
 import logging
-from time import sleep
-from datetime import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from time import time
 import pandas as pd
 import requests
 import yfinance as yf
 import os
 
-logger = logging.getLogger(__name__)
+import catalog
+import codec
+import history
+import httpclient
+import metrics
+import ratelimit
+import store
 
-TODAY = datetime.now().strftime("%Y-%m-%d")
+logger = logging.getLogger(__name__)
 
 DATA_DIR = os.getenv("DATA_DIR", "/data")
 MIDAS_DATA_DIR = f"{DATA_DIR}/MIDAS"
 yf.set_tz_cache_location(f"{DATA_DIR}/tz_cache_location")
-RATE_LIMIT_ALPHA_SLEEP = 15
+ALPHA_DATA_DIR = f"{MIDAS_DATA_DIR}/alphavantage"
+ALPHA_INDEX = f"{ALPHA_DATA_DIR}/_index.json"
+ALPHA_QUOTA = f"{ALPHA_DATA_DIR}/_quota.json"
+ALPHA_QUOTA_DAY = int(os.getenv("ALPHA_VANTAGE_PER_DAY", "25"))
+ALPHA_LOCK = threading.Lock()
+# Pseudo tickers of the calls not bound to a symbol
+ALPHA_GLOBAL_TICKERS = ["EconomicIndicator", "COMOD"]
 ALPHA_VANTAGE_API_KEY = os.getenv("ALPHA_VANTAGE_API_KEY")
 if ALPHA_VANTAGE_API_KEY is None:
     logger.error(
@@ -30,235 +42,249 @@ HTTP_HEADERS = {
     "Chrome/91.0.4472.101 Safari/537.3"
 }
 
-OTHER_STOCKS = [
-    "RXT",
-    "FXAIX",
-    "VGT",
-    "VIG",
-    "VOO",
-    "VTI",
-    "VFAIX",
-    "VEA",
-    "GLD",
-    "VNQ",
-    "MUB",
-    "ADT",
-]
-OTHER_STOCKS = [
-    "RXT",
-]
-
-
-def refresh_sp500():
-    """Refresh the sp500 from Wikipedia"""
-    url = "https://en.wikipedia.org/wiki/List_of_S%26P_500_companies"
-
-    # Set a User-Agent to mimic a web browser
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
-        "AppleWebKit/537.36 (KHTML, like Gecko) "
-        "Chrome/91.0.4472.101 Safari/537.3"
-    }
-    fname = f"{DATA_DIR}/500.csv"
-
-    if os.path.exists(fname):
-        logger.info("File exists %s", fname)
-        return
-
-    # Fetch the page content
-    response = requests.get(url, headers=headers, timeout=30)
-
-    # Use pandas to read the HTML tables
-    tables = pd.read_html(response.text)
-    sp500_table = tables[0]
-
-    # Save the table to a CSV file
-
-    sp500_table.to_csv(fname, index=False)
-    logger.info("Wrote %s", fname)
-
+# Groups of sections of one ticker fetched at once
+SECTION_CONCURRENCY = int(os.getenv("SECTION_CONCURRENCY", "4"))
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+WEEK = 7 * DAY
+
+
+def _frame(attr):
+    """Section fetcher returning a Ticker property as a DataFrame."""
+    return lambda stock_ticker: pd.DataFrame(getattr(stock_ticker, attr))
+
+
+def _value(attr):
+    """Section fetcher returning a Ticker property as is."""
+    return lambda stock_ticker: getattr(stock_ticker, attr)
+
+
+def _fetch_history(stock_ticker):
+    # only the bars we don't have yet are downloaded, and none at all when the
+    # batch price lane of the worker already synced the ticker
+    bars = history.sync_history(stock_ticker.ticker, stock_ticker, max_age=12 * HOUR)
+    return history.recent_bars(bars, months=1)
+
+
+def _fetch_shares_full(stock_ticker):
+    df = pd.DataFrame(stock_ticker.get_shares_full(start="2022-01-01", end=None))
+    df.reset_index(inplace=True)
+    return df
+
+
+# Section name -> fetcher, how long (secs) a fetched section stays fresh,
+# whether a new earnings release makes it stale before that and the group it is
+# fetched in. Sections of a group share one lazily loaded yfinance object (the
+# price history, the holders) and are fetched one after the other, groups run
+# concurrently. Sections without a group are a group of their own.
+SECTIONS = {
+    "info": {"fetch": _value("info"), "ttl": DAY},
+    "1mo_hist": {"fetch": _fetch_history, "ttl": DAY, "group": "price"},
+    # meta information about the history
+    "history_metadata": {
+        "fetch": _value("history_metadata"),
+        "ttl": DAY,
+        "group": "price",
+    },
+    # actions (dividends, splits, capital gains)
+    "actions": {"fetch": _frame("actions"), "ttl": DAY, "group": "price"},
+    "dividends": {"fetch": _frame("dividends"), "ttl": WEEK, "group": "price"},
+    "splits": {"fetch": _frame("splits"), "ttl": WEEK, "group": "price"},
+    # only for mutual funds & etfs
+    "capital_gains": {"fetch": _frame("capital_gains"), "ttl": WEEK, "group": "price"},
+    # share count
+    "get_shares_full": {"fetch": _fetch_shares_full, "ttl": WEEK},
+    # financials, see `Ticker.get_income_stmt()` for more options
+    "income_stmt": {"fetch": _frame("income_stmt"), "ttl": WEEK, "earnings": True},
+    "quarterly_income_stmt": {
+        "fetch": _frame("quarterly_income_stmt"),
+        "ttl": WEEK,
+        "earnings": True,
+    },
+    "balance_sheet": {
+        "fetch": _frame("balance_sheet"),
+        "ttl": WEEK,
+        "earnings": True,
+    },
+    "quarterly_balance_sheet": {
+        "fetch": _frame("quarterly_balance_sheet"),
+        "ttl": WEEK,
+        "earnings": True,
+    },
+    "cashflow": {"fetch": _frame("cashflow"), "ttl": WEEK, "earnings": True},
+    "quarterly_cashflow": {
+        "fetch": _frame("quarterly_cashflow"),
+        "ttl": WEEK,
+        "earnings": True,
+    },
+    # holders
+    "major_holders": {
+        "fetch": _frame("major_holders"),
+        "ttl": WEEK,
+        "group": "holders",
+    },
+    "institutional_holders": {
+        "fetch": _frame("institutional_holders"),
+        "ttl": WEEK,
+        "group": "holders",
+    },
+    "mutualfund_holders": {
+        "fetch": _frame("mutualfund_holders"),
+        "ttl": WEEK,
+        "group": "holders",
+    },
+    "insider_transactions": {
+        "fetch": _frame("insider_transactions"),
+        "ttl": WEEK,
+        "group": "holders",
+    },
+    "insider_purchases": {
+        "fetch": _frame("insider_purchases"),
+        "ttl": WEEK,
+        "group": "holders",
+    },
+    "insider_roster_holders": {
+        "fetch": _frame("insider_roster_holders"),
+        "ttl": WEEK,
+        "group": "holders",
+    },
+    # recommendations
+    "recommendations": {"fetch": _frame("recommendations"), "ttl": DAY},
+    "recommendations_summary": {
+        "fetch": _frame("recommendations_summary"),
+        "ttl": DAY,
+    },
+    "upgrades_downgrades": {"fetch": _frame("upgrades_downgrades"), "ttl": DAY},
+    # ISIN = International Securities Identification Number - *experimental*
+    "isin": {"fetch": _value("isin"), "ttl": 4 * WEEK},
+    # options expirations
+    # FIXME: Get the options data (`stock_ticker.option_chain(opt)`) in as well
+    "options": {"fetch": _value("options"), "ttl": DAY},
+    "news": {"fetch": _value("news"), "ttl": HOUR},
+}
 
-def get_sp500_tickers():
-    """get the sp500 tickers"""
-    refresh_sp500()
-    try:
-        csv_data = pd.read_csv(f"{DATA_DIR}/500.csv", index_col="Symbol")
-        return [symbol[0] for symbol in csv_data.iterrows()]
-    except FileNotFoundError as e:
-        logger.error("Error reading 500.csv, exiting %s", e)
-        csv_data = None
 
+def expired_sections(fetched_at, info=None, now=None):
+    """
+    Sections of a snapshot that need to be fetched again.
 
-def fetch_stock_data(ticker, force=False):
-    """doc str."""
-    # cleanup bad data
-    if os.path.exists(f"{DATA_DIR}/MIDAS/{ticker}.json"):
-        os.remove(f"{DATA_DIR}/MIDAS/{ticker}.json")
+    Parameters:
+        fetched_at (dict): Section name to epoch fetch time.
+        info (dict): The `info` section, used for the last earnings date.
+        now (float): Epoch time to compare against, defaults to now.
 
-    fname = f"{DATA_DIR}/MIDAS/{TODAY}-{ticker}.json"
-    if os.path.exists(fname):
+    Returns:
+        list: Names of the expired (or missing) sections.
+    """
+    now = now or time()
+    earnings = None
+    if isinstance(info, dict):
+        earnings = info.get("earningsTimestamp")
+
+    expired = []
+    for name, section in SECTIONS.items():
+        fetched = fetched_at.get(name)
+        if fetched is None or now - fetched >= section["ttl"]:
+            expired.append(name)
+        elif section.get("earnings") and earnings and fetched < earnings <= now:
+            expired.append(name)
+    return expired
+
+
+def _fetch_group(stock_ticker, names):
+    """Fetch the sections of one group in order, a failure only loses its section."""
+    fetched = {}
+    for name in names:
         try:
-            with open(fname, "r", encoding="utf-8") as src_file:
-                data = json.load(src_file)
-                logger.info("Found data for ticker... %s - %s", ticker, fname)
-                if force:
-                    pass
-                return data
-        except FileNotFoundError as err:
-            logger.error(err)
+            ratelimit.limiter("yfinance").acquire()
+            with metrics.SECTION_SECONDS.time(section=name):
+                fetched[name] = SECTIONS[name]["fetch"](stock_ticker)
+        except Exception as err:
+            # keep the stale value, the section is retried on the next run
+            logger.error("Error %s %s: %s", stock_ticker.ticker, name, err)
+            metrics.SECTION_ERRORS.inc(section=name)
+    return fetched
 
-    print(f"Getting updated stock data for {ticker}")
-    data = {}
-    try:
-        stock_ticker = yf.Ticker(ticker)
-    except Exception as err:
-        logger.error("Error: %s", err)
 
-    # get all stock info
-    try:
-        data["info"] = stock_ticker.info
-    except Exception as err:
-        logger.error("Error: %s", err)
-        data["info"] = err
+def fetch_sections(stock_ticker, names, concurrency=SECTION_CONCURRENCY):
+    """
+    Fetch sections of a ticker, independent groups of sections concurrently.
 
-    try:
-        # get historical market data
-        mo1 = stock_ticker.history(period="1mo")
-        data["1mo_hist"] = pd.DataFrame(mo1).to_json()
-    except Exception as err:
-        logger.error("Error history_metadata: %s", err)
+    Every request still draws from the yfinance rate limit, so concurrency only
+    overlaps the latency of the requests.
 
-    try:
-        # show meta information about the history (requires history() to be called first)
-        data["history_metadata"] = stock_ticker.history_metadata
-    except Exception as err:
-        logger.error("Error history_metadata: %s", err)
+    Parameters:
+        stock_ticker (yf.Ticker): The ticker to fetch from.
+        names (list): Names of the sections to fetch.
+        concurrency (int): Groups fetched at once.
 
-    try:
-        # show actions (dividends, splits, capital gains)
-        data["actions"] = pd.DataFrame(stock_ticker.actions).to_json()
-        data["dividends"] = pd.DataFrame(stock_ticker.dividends).to_json()
-        data["splits"] = pd.DataFrame(stock_ticker.splits).to_json()
-    except Exception as err:
-        logger.error("Error actions: %s", err)
+    Returns:
+        dict: Section name to value, failed sections are left out.
+    """
+    groups = {}
+    for name in names:
+        groups.setdefault(SECTIONS[name].get("group", name), []).append(name)
 
-    try:
-        data["capital_gains"] = pd.DataFrame(
-            stock_ticker.capital_gains
-        ).to_json()  # only for mutual funds & etfs
-    except Exception as err:
-        logger.error("Error capital_gains: %s", err)
+    fetched = {}
+    with ThreadPoolExecutor(max(1, min(concurrency, len(groups)))) as pool:
+        futures = [
+            pool.submit(_fetch_group, stock_ticker, group) for group in groups.values()
+        ]
+        for future in as_completed(futures):
+            fetched.update(future.result())
+    # keep the SECTIONS order
+    return {name: fetched[name] for name in names if name in fetched}
 
-    try:
-        # show share count
-        get_shares_full = stock_ticker.get_shares_full(start="2022-01-01", end=None)
-        df = pd.DataFrame(get_shares_full)
-        df.reset_index(inplace=True)
-        data["get_shares_full"] = pd.DataFrame(df).to_json()
-    except Exception as err:
-        logger.error("Error get_shares_full: %s", err)
 
-    try:
-        income_stmt = stock_ticker.income_stmt
-        data["income_stmt"] = pd.DataFrame(income_stmt).to_json()
-
-        data["quarterly_income_stmt"] = pd.DataFrame(
-            stock_ticker.quarterly_income_stmt
-        ).to_json()
-        # - balance sheet
-        data["balance_sheet"] = pd.DataFrame(stock_ticker.balance_sheet).to_json()
-        data["quarterly_balance_sheet"] = pd.DataFrame(
-            stock_ticker.quarterly_balance_sheet
-        ).to_json()
-        # - cash flow statement
-        data["cashflow"] = pd.DataFrame(stock_ticker.cashflow).to_json()
-        data["quarterly_cashflow"] = pd.DataFrame(
-            stock_ticker.quarterly_cashflow
-        ).to_json()
-        # see `Ticker.get_income_stmt()` for more options
-    except Exception as err:
-        logger.error("Error income_stmt more: %s", err)
+def fetch_stock_data(ticker, force=False):
+    """
+    Refresh the snapshot of a ticker, only fetching the expired sections.
 
-    try:
-        # show holders
-        data["major_holders"] = pd.DataFrame(stock_ticker.major_holders).to_json()
-        data["institutional_holders"] = pd.DataFrame(
-            stock_ticker.institutional_holders
-        ).to_json()
-        data["mutualfund_holders"] = pd.DataFrame(
-            stock_ticker.mutualfund_holders
-        ).to_json()
-        data["insider_transactions"] = pd.DataFrame(
-            stock_ticker.insider_transactions
-        ).to_json()
-        data["insider_purchases"] = pd.DataFrame(
-            stock_ticker.insider_purchases
-        ).to_json()
-        data["insider_roster_holders"] = pd.DataFrame(
-            stock_ticker.insider_roster_holders
-        ).to_json()
-    except Exception as err:
-        logger.error("Error other: %s", err)
+    Parameters:
+        ticker (str): The stock ticker.
+        force (bool): Fetch every section, fresh or not.
 
-    try:
-        # show recommendations
-        data["recommendations"] = pd.DataFrame(stock_ticker.recommendations).to_json()
-        data["recommendations_summary"] = pd.DataFrame(
-            stock_ticker.recommendations_summary
-        ).to_json()
-        data["upgrades_downgrades"] = pd.DataFrame(
-            stock_ticker.upgrades_downgrades
-        ).to_json()
-    except Exception as err:
-        logger.error("Error: %s", err)
-        data["recommendations"] = err
+    Returns:
+        dict: Section name to DataFrame or value.
+    """
+    # cleanup bad data
+    if os.path.exists(f"{DATA_DIR}/MIDAS/{ticker}.json"):
+        os.remove(f"{DATA_DIR}/MIDAS/{ticker}.json")
 
-    # Show future and historic earnings dates, returns at most next 4 quarters and last 8 quarters by default.
-    # Note: If more are needed use stock_ticker.get_earnings_dates(limit=XX) with increased limit argument.
-    # data['earnings_dates'] = pd.DataFrame(stock_ticker.earnings_dates).to_json()
+    data, fetched_at = {}, {}
+    date = store.latest_date(ticker)
+    if date is not None:
+        try:
+            data = store.read_snapshot(ticker, date)
+            fetched_at = store.read_fetched(ticker, date)
+        except FileNotFoundError as err:
+            logger.error(err)
 
-    # show ISIN code - *experimental*
-    # ISIN = International Securities Identification Number
-    try:
-        data["isin"] = stock_ticker.isin
-    except Exception as err:
-        logger.error("Error recommendations: %s", err)
-        data["isin"] = err
+    expired = (
+        list(SECTIONS) if force else expired_sections(fetched_at, data.get("info"))
+    )
+    if not expired:
+        logger.info("Found data for ticker... %s - %s", ticker, date)
+        return data
 
+    logger.info("Getting %s/%s sections for %s", len(expired), len(SECTIONS), ticker)
     try:
-        # show options expirations
-        data["options"] = stock_ticker.options
-
-        # FIXME: Get the options data into the json dict so we can publish to mongo
-        # data['options_data'] = {}
-        # for opt in data['options']:
-        #     print(f'Getting options for {opt}')
-        #     # data['options_data'][opt] = stock_ticker.option_chain(opt)
-        # #     data['options_data'][opt] = stock_ticker.option_chain(opt)
-        #     data['options_data'][f'{opt}_calls'] = pd.DataFrame(stock_ticker.option_chain(opt)).to_json()
-        #     data['options_data'][f'{opt}_puts'] = pd.DataFrame(stock_ticker.option_chain(opt)).to_json()
+        stock_ticker = yf.Ticker(ticker, session=httpclient.yf_session())
     except Exception as err:
-        logger.error("Error options: %s", err)
-        data["options"] = err
+        logger.error("Error: %s", err)
+        return data
+
+    refreshed = fetch_sections(stock_ticker, expired)
+    data.update(refreshed)
+    today = store.today()
+    if refreshed and date == today:
+        store.write_snapshot(ticker, refreshed, today)
+    elif refreshed:
+        # carry the still fresh sections over into today's snapshot
+        fetched_at.update({name: time() for name in refreshed})
+        store.write_snapshot(ticker, data, today, fetched_at)
 
-    try:
-        # show news
-        data["news"] = stock_ticker.news
-    except yf.Exception as err:
-        logger.error("Error news: %s", err)
-        data["news"] = err
-
-    with open(f"{DATA_DIR}/MIDAS/latest-{ticker}.json", "w", encoding="utf-8") as file:
-        file.write(json.dumps(data, default=str))
-        logger.info("Wrote %s", f"{DATA_DIR}/MIDAS/latest-{ticker}.json")
-
-    with open(fname, "w", encoding="utf-8") as file:
-        file.write(json.dumps(data, default=str))
-        logger.info("Wrote %s", fname)
-
-    wait = 0.1
-    logger.info("Sleeping for %sm %s", wait, ticker)
-    sleep(60 * wait)
     return data
 
 
@@ -280,7 +306,8 @@ def fetch_alpha_vantage_data(reqparams, apicall):
     if apicall == "TIME_SERIES_INTRADAY":
         reqparams["interval"] = "5min"
 
-    response = requests.get(base_url, params=reqparams, timeout=30)
+    ratelimit.limiter("alphavantage").acquire()
+    response = httpclient.get(base_url, params=reqparams)
     response.raise_for_status()
 
     return response.json()
@@ -295,10 +322,16 @@ def alpha_save_to_json(jsondata, ticker, apicall):
         ticker (str): The stock ticker to be used in the filename.
         apicall (str): The API function name to be used in the filename.
     """
-    filename = f"{MIDAS_DATA_DIR}/alphavantage/{TODAY}-{ticker}-{apicall}.json"
+    today = store.today()
+    filename = f"{ALPHA_DATA_DIR}/{today}-{ticker}-{apicall}.json"
+
+    codec.write_json(filename, jsondata)
 
-    with open(filename, "w", encoding="utf-8") as f:
-        json.dump(jsondata, f, indent=4)
+    catalog.record(today, ticker, apicall, "alphavantage", filename)
+    with ALPHA_LOCK:
+        index = _read_alpha_json(ALPHA_INDEX)
+        index[f"{ticker}-{apicall}"] = {"fetched": time(), "file": filename}
+        _write_alpha_json(ALPHA_INDEX, index)
 
     print(f"Data saved to {filename}")
 
@@ -370,104 +403,202 @@ ALPHA_OPTS = {
 }
 
 
-def get_alpha_vantage_data():
-    data = {}
-    # Loop through all available functions to fetch and save data
-    for function in ALPHA_OPTS["economic_indicators"]:
-        try:
-            ticker = "EconomicIndicator"
-            params = {"function": function, "apikey": ALPHA_VANTAGE_API_KEY}
-            data = fetch_alpha_vantage_data(params, function)
-            alpha_save_to_json(data, ticker, function)
-            sleep(RATE_LIMIT_ALPHA_SLEEP)
-            data[function] = data
-        except requests.RequestException as e:
-            logger.error(
-                "An error occurred while fetching data from function %s: %s",
-                function,
-                e,
-            )
+# Alpha Vantage function -> how long (secs) a stored result stays fresh
+ALPHA_TTL = {
+    "TIME_SERIES_INTRADAY": HOUR,
+    "TIME_SERIES_WEEKLY": WEEK,
+    "TIME_SERIES_MONTHLY": 4 * WEEK,
+    "INCOME_STATEMENT": WEEK,
+    "BALANCE_SHEET": WEEK,
+    "CASH_FLOW": WEEK,
+    "EARNINGS": WEEK,
+}
+ALPHA_TTL.update({function: WEEK for function in ALPHA_OPTS["economic_indicators"]})
 
-    # Loop through all available functions to fetch and save data
-    for function in ALPHA_OPTS["commodities"]:
-        try:
-            ticker = "COMOD"
-            params = {"function": function, "apikey": ALPHA_VANTAGE_API_KEY}
-            # Fetch the data from the Alpha Vantage API
-            data = fetch_alpha_vantage_data(params, function)
-            # Save the data to a JSON file
-            alpha_save_to_json(data, ticker, function)
-            # To avoid hitting rate limits, wait before the next API call
-            sleep(RATE_LIMIT_ALPHA_SLEEP)  # Adjust this based on your API rate limits
-            data[function] = data
-        except requests.RequestException as e:
-            logger.error(
-                "An error occurred while fetching data from function %s: %s",
-                function,
-                e,
-            )
+# Alpha Vantage function -> priority, lower runs first when the quota is short
+ALPHA_PRIORITY = {function: 2 for function in ALPHA_OPTS["available_functions"]}
+ALPHA_PRIORITY.update({function: 3 for function in ALPHA_OPTS["economic_indicators"]})
+ALPHA_PRIORITY.update({function: 4 for function in ALPHA_OPTS["commodities"]})
+ALPHA_PRIORITY.update({function: 5 for function in ALPHA_OPTS["tech_indicators"]})
+ALPHA_PRIORITY.update({"GLOBAL_QUOTE": 0, "TIME_SERIES_DAILY": 0, "EARNINGS": 1})
 
-    return data
 
+def _read_alpha_json(fname):
+    try:
+        return codec.read_json(fname)
+    except (FileNotFoundError, ValueError):
+        return {}
 
-def get_alpha_vantage_ticker_data(ticker):
 
+def _write_alpha_json(fname, data):
+    os.makedirs(ALPHA_DATA_DIR, exist_ok=True)
+    store.write_json(fname, data)
+
+
+def alpha_quota_left():
+    """Alpha Vantage calls left for today."""
+    with ALPHA_LOCK:
+        quota = _read_alpha_json(ALPHA_QUOTA)
+    used = quota.get("used", 0) if quota.get("date") == store.today() else 0
+    return max(ALPHA_QUOTA_DAY - used, 0)
+
+
+def _use_alpha_quota(exhausted=False):
+    with ALPHA_LOCK:
+        quota = _read_alpha_json(ALPHA_QUOTA)
+        today = store.today()
+        if quota.get("date") != today:
+            quota = {"date": today, "used": 0}
+        quota["used"] = ALPHA_QUOTA_DAY if exhausted else quota["used"] + 1
+        _write_alpha_json(ALPHA_QUOTA, quota)
+
+
+def alpha_call(function, ticker, **params):
+    """An Alpha Vantage call for `run_alpha_schedule`."""
+    params.update({"function": function, "apikey": ALPHA_VANTAGE_API_KEY})
+    if ticker not in ALPHA_GLOBAL_TICKERS:
+        params["symbol"] = ticker
+    return {"function": function, "ticker": ticker, "params": params}
+
+
+def plan_alpha_calls(calls, now=None):
+    """
+    Order Alpha Vantage calls and split off the ones still fresh on disk.
+
+    Parameters:
+        calls (list): Calls built with `alpha_call`.
+        now (float): Epoch time to compare against, defaults to now.
+
+    Returns:
+        tuple: (calls to make ordered by priority then staleness, fresh calls)
+    """
+    now = now or time()
+    index = _read_alpha_json(ALPHA_INDEX)
+
+    due, fresh, seen = [], [], set()
+    for call in calls:
+        key = f"{call['ticker']}-{call['function']}"
+        if key in seen:
+            continue
+        seen.add(key)
+        ttl = ALPHA_TTL.get(call["function"], DAY)
+        stored = index.get(key)
+        age = now - stored["fetched"] if stored else None
+        if age is not None and age < ttl:
+            fresh.append(dict(call, file=stored["file"]))
+        else:
+            # never fetched sorts as the stalest
+            staleness = float("inf") if age is None else age / ttl
+            due.append((ALPHA_PRIORITY.get(call["function"], 9), -staleness, call))
+
+    due.sort(key=lambda item: item[:2])
+    return [call for _, _, call in due], fresh
+
+
+def run_alpha_schedule(calls):
+    """
+    Make the due Alpha Vantage calls within the per-minute and daily quota.
+
+    Parameters:
+        calls (list): Calls built with `alpha_call`.
+
+    Returns:
+        dict: {ticker: {function: result}} with fresh results read from disk.
+    """
+    due, fresh = plan_alpha_calls(calls)
     data = {}
 
-    # Loop through all available functions to fetch and save data
-    for function in ALPHA_OPTS["available_functions"]:
-        try:
-            params = {
-                "function": function,
-                "symbol": ticker,
-                "apikey": ALPHA_VANTAGE_API_KEY,
-            }
-            # Fetch the data from the Alpha Vantage API
-            data = fetch_alpha_vantage_data(params, function)
-            # Save the data to a JSON file
-            alpha_save_to_json(data, ticker, function)
-            # To avoid hitting rate limits, wait before the next API call
-            sleep(RATE_LIMIT_ALPHA_SLEEP)  # Adjust this based on your API rate limits
-            data[function] = data
-        except requests.RequestException as e:
-            logger.error(
-                "An error occurred while fetching data from function %s: %s",
-                function,
-                e,
+    for call in fresh:
+        stored = _read_alpha_json(call["file"])
+        if stored:
+            data.setdefault(call["ticker"], {})[call["function"]] = stored
+
+    left = alpha_quota_left()
+    logger.info(
+        "Alpha Vantage: %s due, %s fresh, %s calls left today",
+        len(due),
+        len(fresh),
+        left,
+    )
+    for made, call in enumerate(due):
+        if made >= left:
+            logger.warning(
+                "Alpha Vantage daily quota used, skipping %s calls", len(due) - made
             )
-
-    # Loop through all available functions to fetch and save data
-    for function in ALPHA_OPTS["tech_indicators"]:
+            break
+        function, ticker = call["function"], call["ticker"]
         try:
-            params = {
-                "function": function,
-                "symbol": ticker,
-                "apikey": ALPHA_VANTAGE_API_KEY,
-                "interval": "daily",
-            }
-            # Fetch the data from the Alpha Vantage API
-            data = fetch_alpha_vantage_data(params, function)
-            # Save the data to a JSON file
-            alpha_save_to_json(data, ticker, function)
-            # To avoid hitting rate limits, wait before the next API call
-            sleep(RATE_LIMIT_ALPHA_SLEEP)  # Adjust this based on your API rate limits
-            data[function] = data
+            result = fetch_alpha_vantage_data(call["params"], function)
         except requests.RequestException as e:
             logger.error(
                 "An error occurred while fetching data from function %s: %s",
                 function,
                 e,
             )
+            continue
+
+        # Quota errors come back as a 200 with only a note in the body
+        notes = {"Note", "Information"}
+        if notes & set(result) and set(result) <= notes:
+            logger.warning("Alpha Vantage quota hit: %s", result)
+            _use_alpha_quota(exhausted=True)
+            break
+        _use_alpha_quota()
+        alpha_save_to_json(result, ticker, function)
+        data.setdefault(ticker, {})[function] = result
 
     return data
 
 
+def get_alpha_vantage_data():
+    """Economic indicators and commodities from Alpha Vantage."""
+    calls = [
+        alpha_call(function, "EconomicIndicator")
+        for function in ALPHA_OPTS["economic_indicators"]
+    ]
+    calls += [alpha_call(function, "COMOD") for function in ALPHA_OPTS["commodities"]]
+    data = {}
+    for results in run_alpha_schedule(calls).values():
+        data.update(results)
+    return data
+
+
+def _alpha_ticker_calls(ticker):
+    calls = [
+        alpha_call(function, ticker) for function in ALPHA_OPTS["available_functions"]
+    ]
+    calls += [
+        alpha_call(function, ticker, interval="daily")
+        for function in ALPHA_OPTS["tech_indicators"]
+    ]
+    return calls
+
+
+def get_alpha_vantage_ticker_data(ticker):
+    """All Alpha Vantage functions and indicators of a ticker."""
+    return run_alpha_schedule(_alpha_ticker_calls(ticker)).get(ticker, {})
+
+
+def get_alpha_vantage_universe_data(tickers):
+    """
+    Spend the Alpha Vantage quota across many tickers.
+
+    High priority calls (quotes, daily series) for every ticker are made
+    before the lower priority ones of any ticker.
+    """
+    calls = []
+    for ticker in tickers:
+        calls += _alpha_ticker_calls(ticker)
+    return run_alpha_schedule(calls)
+
+
 def refresh_world_market_cap():
     """Refresh the ndxt from Wikipedia"""
     url = (
         "https://en.wikipedia.org/wiki/List_of_countries_by_stock_market_capitalization"
     )
-    response = requests.get(url, headers=HTTP_HEADERS, timeout=30)
+    ratelimit.limiter("wikipedia").acquire()
+    response = httpclient.get(url, headers=HTTP_HEADERS)
     tables = pd.read_html(response.text)
     tables[0].to_csv(f"{MIDAS_DATA_DIR}/world-market-cap-ranking.csv", index=False)
     tables[1].to_csv(f"{MIDAS_DATA_DIR}/world-market-cap.csv", index=False)
@@ -476,6 +607,7 @@ def refresh_world_market_cap():
 def refresh_ndxt():
     """Refresh the ndxt from Wikipedia"""
     url = "https://en.wikipedia.org/wiki/Nasdaq-100"
-    response = requests.get(url, headers=HTTP_HEADERS, timeout=30)
+    ratelimit.limiter("wikipedia").acquire()
+    response = httpclient.get(url, headers=HTTP_HEADERS)
     tables = pd.read_html(response.text)
     tables[4].to_csv(f"{MIDAS_DATA_DIR}/ndxt.csv", index=False)
@@ -0,0 +1,203 @@
+"""Local stand-in for remote data providers.
+
+Serves a directory of recorded responses over HTTP, the request path maps to a
+file under the directory. For EDGAR the layout mirrors sec.gov:
+
+    {root}/files/company_tickers.json
+    {root}/submissions/CIK0000320193.json
+    {root}/Archives/edgar/data/320193/000032019323000106/0000320193-23-000106.txt
+
+Run it and point ``EDGAR_WWW_URL`` and ``EDGAR_DATA_URL`` at it:
+
+    python standin.py --root fixtures/edgar --port 8900
+
+It also replays responses captured by `httpclient` from any provider
+(``HTTP_RECORD_DIR``), one JSON file per response under the host and path of
+the request:
+
+    {root}/query2.finance.yahoo.com/v10/finance/quoteSummary/AAPL/@{key}.json
+
+Requests come in as ``{base url}/{host}{path}?{query}`` (``HTTP_REPLAY_URL``),
+the key is a hash of the query without the parameters that change between
+runs. When the exact query wasn't recorded any recording of the path is served.
+"""
+
+import argparse
+import base64
+import functools
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from functools import lru_cache
+from glob import escape, glob
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, quote, unquote, urlencode, urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Query parameters that change between runs (auth, time windows), left out of
+# the key a recording is matched on
+VOLATILE_PARAMS = {"crumb", "apikey", "period1", "period2", "_"}
+RECORDING = "@{key}.json"
+
+
+def _key(query):
+    params = sorted(
+        (name, value)
+        for name, value in parse_qsl(query, keep_blank_values=True)
+        if name not in VOLATILE_PARAMS
+    )
+    return hashlib.blake2b(urlencode(params).encode(), digest_size=8).hexdigest()
+
+
+def _folder(root, host, path):
+    return os.path.join(root, host, quote(unquote(path), safe="/").strip("/"))
+
+
+def replay_url(base_url, url):
+    """Address of `url` on a stand-in serving recorded responses."""
+    parts = urlsplit(url)
+    query = f"?{parts.query}" if parts.query else ""
+    return f"{base_url}/{parts.netloc}{parts.path or '/'}{query}"
+
+
+def record(root, url, status, content_type, body, elapsed=0.0):
+    """
+    Save a response for the stand-in to replay.
+
+    Parameters:
+        root (str): Directory of recorded responses.
+        url (str): Requested URL, with its query.
+        status (int): HTTP status of the response.
+        content_type (str): Content-Type of the response.
+        body (bytes): Decoded body of the response.
+        elapsed (float): Secs the provider took, replayed with ``--delay``.
+    """
+    parts = urlsplit(url)
+    folder = _folder(root, parts.netloc, parts.path)
+    try:
+        text, encoding = body.decode("utf-8"), "utf-8"
+    except UnicodeDecodeError:
+        text, encoding = base64.b64encode(body).decode("ascii"), "base64"
+    os.makedirs(folder, exist_ok=True)
+    fname = f"{folder}/{RECORDING.format(key=_key(parts.query))}"
+    tmp_path = f"{fname}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(
+            {
+                "url": url,
+                "status": status,
+                "content_type": content_type,
+                "elapsed": elapsed,
+                "encoding": encoding,
+                "body": text,
+            },
+            file,
+        )
+    os.replace(tmp_path, fname)
+
+
+def find_recording(root, host, path, query):
+    """File of the recorded response to a request, or None."""
+    folder = _folder(root, host, path)
+    fname = f"{folder}/{RECORDING.format(key=_key(query))}"
+    if os.path.exists(fname):
+        return fname
+    recorded = sorted(glob(f"{escape(folder)}/{RECORDING.format(key='*')}"))
+    return recorded[0] if recorded else None
+
+
+@lru_cache(maxsize=None)
+def _load(fname):
+    """Status, Content-Type, body and provider latency of a recording."""
+    with open(fname, "r", encoding="utf-8") as src_file:
+        recorded = json.load(src_file)
+    body = recorded["body"]
+    body = base64.b64decode(body) if recorded["encoding"] == "base64" else body
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    return (
+        recorded["status"],
+        recorded["content_type"] or "application/octet-stream",
+        body,
+        recorded.get("elapsed", 0.0),
+    )
+
+
+class StandinHandler(SimpleHTTPRequestHandler):
+    """Serve recorded responses and files, quietly."""
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        host, _, rest = self.path.lstrip("/").partition("/")
+        path, _, query = f"/{rest}".partition("?")
+        fname = find_recording(self.directory, host, path, query) if host else None
+        if fname is None:
+            super().do_GET()
+            return
+        status, content_type, body, elapsed = _load(fname)
+        if self.server.delay:
+            time.sleep(elapsed * self.server.delay)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self.do_GET()
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        logger.debug(format, *args)
+
+
+def serve(root, port=0, delay=0.0):
+    """
+    Start a stand-in server in a background thread.
+
+    Parameters:
+        root (str): Directory of recorded responses.
+        port (int): Port to listen on, 0 picks a free one.
+        delay (float): Share of the recorded provider latency to wait before
+            answering, 0 answers right away.
+
+    Returns:
+        tuple: (server, base url), call `server.shutdown()` when done.
+    """
+    handler = functools.partial(StandinHandler, directory=root)
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    server.delay = delay
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    logger.info("Serving %s on %s", root, url)
+    return server, url
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--root", help="Directory of recorded responses.", required=True
+    )
+    parser.add_argument("--port", help="Port to listen on.", type=int, default=8900)
+    parser.add_argument(
+        "--delay",
+        help="Share of the recorded provider latency to wait before answering.",
+        type=float,
+        default=0.0,
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    server, _ = serve(args.root, args.port, args.delay)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
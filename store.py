@@ -0,0 +1,695 @@
+"""Columnar snapshot store for MIDAS ticker data.
+
+Sections are content addressed: every distinct section value is stored once as
+an object named by the hash of its content, and a snapshot only references the
+objects of its sections:
+
+    {DATA_DIR}/MIDAS/store/objects/{ab}/{hash}.parquet        tabular section
+    {DATA_DIR}/MIDAS/store/objects/{ab}/{hash}.delta.parquet  changes over a base
+    {DATA_DIR}/MIDAS/store/objects/{ab}/{hash}.json           other values (zstd)
+    {DATA_DIR}/MIDAS/store/date={YYYY-MM-DD}/ticker={TICKER}/_manifest.json
+    {DATA_DIR}/MIDAS/store/latest/{TICKER}                    newest snapshot date
+
+The manifest maps each section to its object and records when it was fetched.
+A section that didn't change since the previous snapshot costs one manifest
+entry. A table that did change is stored as the rows that differ from the
+previous version when that is much smaller than the whole table, so any day can
+still be rebuilt by replaying at most ``DELTA_CHAIN`` deltas.
+
+Snapshots written before objects existed keep one Parquet file per tabular
+section and a ``_meta.json`` file for the other sections in the partition, they
+are still read as is and ``--compact`` moves them into the object store.
+"""
+
+import argparse
+import json
+import logging
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime
+from glob import glob
+from io import BytesIO, StringIO
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import catalog
+import codec
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.getenv("DATA_DIR", "/data")
+MIDAS_DATA_DIR = f"{DATA_DIR}/MIDAS"
+STORE_DIR = f"{MIDAS_DATA_DIR}/store"
+META_FILE = "_meta.json"
+MANIFEST_FILE = "_manifest.json"
+OBJECTS_DIR = f"{STORE_DIR}/objects"
+LATEST_DIR = f"{STORE_DIR}/latest"
+PARQUET_COMPRESSION = "zstd"
+# Longest chain of deltas before a table is stored whole again
+DELTA_CHAIN = int(os.getenv("STORE_DELTA_CHAIN", "7"))
+# A delta is only kept when smaller than this share of the whole table
+DELTA_RATIO = float(os.getenv("STORE_DELTA_RATIO", "0.5"))
+DELTA_KEY = b"midas.delta"
+TABLE = ".parquet"
+DELTA = ".delta.parquet"
+VALUE = ".json"
+KINDS = {DELTA: "delta", TABLE: "table", VALUE: "value"}
+
+# Bytes written by the snapshot write running on this thread
+_WRITTEN = threading.local()
+
+
+def today():
+    """Today's partition date, read on every call since the workers run for days."""
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+def snapshot_path(ticker, date=None):
+    """Partition directory of a ticker snapshot for a given date, today by default."""
+    return f"{STORE_DIR}/date={date or today()}/ticker={ticker}"
+
+
+def section_path(ticker, section, date=None):
+    """Parquet file of a tabular section."""
+    return f"{snapshot_path(ticker, date)}/{section}.parquet"
+
+
+def _atomic_write(path, write):
+    """Write through a temp file so readers never see a partial file."""
+    # unique per writer, two writers may store the same object at once
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _to_frame(value):
+    """Normalise a section value into a DataFrame Parquet can store."""
+    if isinstance(value, pd.Series):
+        value = value.to_frame()
+    frame = value.copy()
+    # Parquet only supports string column names, statements use Timestamps
+    frame.columns = [str(col) for col in frame.columns]
+    return frame
+
+
+def _parquet_bytes(frame):
+    """Serialize a DataFrame to Parquet, stringifying columns Arrow can't type."""
+    buf = BytesIO()
+    try:
+        frame.to_parquet(buf, compression=PARQUET_COMPRESSION)
+    except (pa.ArrowException, ValueError) as err:
+        logger.debug("Falling back to string columns - %s", err)
+        frame = frame.copy()
+        for col in frame.columns[frame.dtypes == object]:
+            frame[col] = frame[col].astype(str)
+        buf = BytesIO()
+        frame.to_parquet(buf, compression=PARQUET_COMPRESSION)
+    return buf.getvalue()
+
+
+def _write_bytes(path, data):
+    with open(path, "wb") as file:
+        file.write(data)
+
+
+def write_table(frame, path):
+    """Write a DataFrame to Parquet, stringifying columns Arrow can't type."""
+    data = _parquet_bytes(frame)
+    _atomic_write(path, lambda tmp: _write_bytes(tmp, data))
+
+
+def write_json(path, data):
+    """Write data to a (compressed) JSON file, readers never see a partial file."""
+    _atomic_write(path, lambda tmp: codec.write_json(tmp, data))
+
+
+def _read_json(fname):
+    try:
+        return codec.read_json(fname)
+    except FileNotFoundError:
+        return {}
+
+
+def _read_meta(ticker, date):
+    return _read_json(f"{snapshot_path(ticker, date)}/{META_FILE}")
+
+
+def _read_manifest(ticker, date):
+    return _read_json(f"{snapshot_path(ticker, date)}/{MANIFEST_FILE}")
+
+
+def read_fetched(ticker, date=None):
+    """Epoch timestamp each section of a snapshot was fetched at."""
+    date = date or today()
+    return _read_manifest(ticker, date).get("fetched", {})
+
+
+def object_path(ref):
+    """File of an object, `ref` is its hash with the object extension."""
+    return f"{OBJECTS_DIR}/{ref[:2]}/{ref}"
+
+
+def _digest(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _kind(ref):
+    return next(kind for ext, kind in KINDS.items() if ref.endswith(ext))
+
+
+def _stored(digest, *exts):
+    """Ref of an object already stored under `digest`, or None."""
+    for ext in exts:
+        if os.path.exists(object_path(digest + ext)):
+            metrics.STORE_OBJECTS.inc(kind=_kind(ext), result="reused")
+            return digest + ext
+    return None
+
+
+def _count_written(kind, size):
+    metrics.STORE_BYTES.inc(size, kind=kind)
+    _WRITTEN.bytes = getattr(_WRITTEN, "bytes", 0) + size
+
+
+def _put(ref, data):
+    """Store the bytes of an object, returns its ref."""
+    path = object_path(ref)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    _atomic_write(path, lambda tmp: _write_bytes(tmp, data))
+    metrics.STORE_OBJECTS.inc(kind=_kind(ref), result="written")
+    _count_written(_kind(ref), len(data))
+    return ref
+
+
+def _delta_meta(ref):
+    """Base ref, chain depth and removed base rows of a delta object."""
+    metadata = pq.read_schema(object_path(ref)).metadata or {}
+    return json.loads(metadata[DELTA_KEY])
+
+
+def _apply_delta(base, rows, removed):
+    """Rebuild a table from its base, the rows that changed and the rows removed."""
+    kept = base.drop(base.index[removed])
+    order = kept.index.append(rows.index.difference(kept.index, sort=False))
+    merged = pd.concat([kept.drop(rows.index, errors="ignore"), rows])
+    return merged.loc[order]
+
+
+def _load_table(ref):
+    """A tabular object as a DataFrame, replaying deltas onto their base."""
+    if not ref.endswith(DELTA):
+        return pd.read_parquet(object_path(ref))
+    meta = _delta_meta(ref)
+    rows = pd.read_parquet(object_path(ref))
+    return _apply_delta(_load_table(meta["base"]), rows, meta["removed"])
+
+
+def _load_object(ref):
+    if ref.endswith(VALUE):
+        return codec.read_json(object_path(ref))
+    return _load_table(ref)
+
+
+def _delta(frame, base):
+    """
+    Rows of `frame` that differ from `base`, and positions of the base rows it
+    dropped. None when the tables can't be diffed by rows.
+    """
+    if not (
+        frame.columns.equals(base.columns)
+        and frame.dtypes.equals(base.dtypes)
+        and frame.index.is_unique
+        and base.index.is_unique
+    ):
+        return None
+    common = frame.index.intersection(base.index)
+    old, new = base.loc[common], frame.loc[common]
+    try:
+        same = ((old == new) | (old.isna() & new.isna())).all(axis=1)
+    except (TypeError, ValueError):
+        return None
+    changed = common[~same.to_numpy()]
+    rows = frame[~frame.index.isin(base.index) | frame.index.isin(changed)]
+    removed = [
+        int(pos) for pos in base.index.get_indexer(base.index.difference(frame.index))
+    ]
+    return rows, sorted(removed)
+
+
+def _put_table(value, base_ref):
+    """
+    Store a tabular section, returns its ref.
+
+    Unchanged tables are found by hash and not written again. A changed table
+    is written as a delta over `base_ref` when the delta rebuilds exactly the
+    same table and is much smaller than it.
+    """
+    data = _parquet_bytes(_to_frame(value))
+    digest = _digest(data)
+    ref = _stored(digest, TABLE, DELTA)
+    if ref is not None:
+        return ref
+
+    if base_ref is not None and base_ref.endswith((TABLE, DELTA)):
+        try:
+            depth = _delta_meta(base_ref)["depth"] if base_ref.endswith(DELTA) else 0
+            if depth < DELTA_CHAIN:
+                ref = _put_delta(digest, data, base_ref, depth + 1)
+        except (OSError, KeyError, ValueError, pa.ArrowException) as err:
+            logger.debug("No delta over %s - %s", base_ref, err)
+        if ref is not None:
+            return ref
+    return _put(digest + TABLE, data)
+
+
+def _put_delta(digest, data, base_ref, depth):
+    """Store `data` as a delta over `base_ref` if it pays off, returns its ref."""
+    frame = pd.read_parquet(BytesIO(data))
+    base = _load_table(base_ref)
+    diff = _delta(frame, base)
+    if diff is None:
+        return None
+    rows, removed = diff
+    table = pa.Table.from_pandas(rows)
+    meta = {"base": base_ref, "depth": depth, "removed": removed}
+    table = table.replace_schema_metadata(
+        {**(table.schema.metadata or {}), DELTA_KEY: json.dumps(meta).encode()}
+    )
+    buf = BytesIO()
+    pq.write_table(table, buf, compression=PARQUET_COMPRESSION)
+    delta = buf.getvalue()
+    if len(delta) >= DELTA_RATIO * len(data):
+        return None
+    rebuilt = _apply_delta(base, pd.read_parquet(BytesIO(delta)), removed)
+    if not rebuilt.equals(frame) or not rebuilt.index.equals(frame.index):
+        return None
+    return _put(digest + DELTA, delta)
+
+
+def _put_value(value):
+    """Store a non-tabular section, returns its ref."""
+    data = json.dumps(value, default=str, sort_keys=True).encode("utf-8")
+    digest = _digest(data)
+    # hashed before compression, the ref doesn't depend on the dictionary
+    return _stored(digest, VALUE) or _put(digest + VALUE, codec.compress(data))
+
+
+def read_latest(ticker):
+    """Date the latest pointer of a ticker refers to, or None."""
+    try:
+        with open(f"{LATEST_DIR}/{ticker}", "r", encoding="utf-8") as src_file:
+            return src_file.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _write_latest(ticker, date):
+    os.makedirs(LATEST_DIR, exist_ok=True)
+    _atomic_write(
+        f"{LATEST_DIR}/{ticker}",
+        lambda tmp: _write_bytes(tmp, date.encode("utf-8")),
+    )
+
+
+def _sections(ticker, date):
+    """Section to object ref of a snapshot, None for a legacy snapshot."""
+    return _read_manifest(ticker, date).get("sections")
+
+
+def write_snapshot(ticker, data, date=None, fetched_at=None):
+    """
+    Write (or update) the snapshot of a ticker.
+
+    Sections already in the snapshot but not in ``data`` are left untouched.
+    Sections equal to a stored object only reference it, changed tables are
+    stored as deltas over the previous snapshot when that is smaller. A legacy
+    partition is moved into the object store on its first update.
+
+    Parameters:
+        ticker (str): The stock ticker.
+        data (dict): Section name to DataFrame/Series or JSON serializable value.
+        date (str): Partition date, defaults to today.
+        fetched_at (dict): Section name to epoch fetch time, defaults to now.
+
+    Returns:
+        str: The snapshot partition directory.
+    """
+    date = date or today()
+    path = snapshot_path(ticker, date)
+    os.makedirs(path, exist_ok=True)
+    _WRITTEN.bytes = 0
+
+    manifest = _read_manifest(ticker, date)
+    sections = manifest.get("sections")
+    fetched = manifest.get("fetched", {})
+    fetched_at = fetched_at or {}
+    legacy = set()
+    if sections is None:
+        legacy = {fname for _, _, fname in section_files(ticker, date)}
+        if legacy:
+            # fold the files of a legacy partition into the object store
+            data = {**read_snapshot(ticker, date), **data}
+            fetched_at = {**fetched, **fetched_at}
+        # deltas are taken over the latest snapshot
+        sections = {}
+        latest = read_latest(ticker)
+        bases = (_sections(ticker, latest) if latest else None) or {}
+    else:
+        bases = sections
+
+    entries = []
+    for section, value in data.items():
+        written = _WRITTEN.bytes
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            ref = _put_table(value, bases.get(section))
+            kind = "table"
+        else:
+            ref = _put_value(value)
+            kind = "value"
+        sections[section] = ref
+        # reused objects add nothing to the store
+        entries.append(
+            (date, ticker, section, kind, object_path(ref), _WRITTEN.bytes - written)
+        )
+
+    now = time.time()
+    fetched.update({section: fetched_at.get(section, now) for section in data})
+    write_json(f"{path}/{MANIFEST_FILE}", {"fetched": fetched, "sections": sections})
+    _count_written("manifest", os.path.getsize(f"{path}/{MANIFEST_FILE}"))
+    metrics.SNAPSHOT_BYTES.observe(_WRITTEN.bytes)
+    catalog.record_many(entries)
+    for fname in legacy:
+        os.remove(fname)
+
+    latest = read_latest(ticker)
+    if latest is None or date >= latest:
+        _write_latest(ticker, date)
+
+    logger.info("Wrote %s", path)
+    return path
+
+
+def snapshot_dates(ticker):
+    """Sorted list of dates a snapshot exists for."""
+    dirs = glob(f"{STORE_DIR}/date=*/ticker={ticker}")
+    return sorted(os.path.basename(os.path.dirname(d))[len("date=") :] for d in dirs)
+
+
+def latest_date(ticker):
+    """Most recent snapshot date of a ticker, or None."""
+    latest = read_latest(ticker)
+    if latest is not None:
+        return latest
+    # written before the latest pointers existed
+    dates = snapshot_dates(ticker)
+    return dates[-1] if dates else None
+
+
+def latest_dates(tickers):
+    """Most recent snapshot date of many tickers, listing the dates only once."""
+    latest = {ticker: read_latest(ticker) for ticker in tickers}
+    missing = [ticker for ticker, date in latest.items() if date is None]
+    if not missing:
+        return latest
+    dates = sorted(
+        (
+            os.path.basename(path)[len("date=") :]
+            for path in glob(f"{STORE_DIR}/date=*")
+        ),
+        reverse=True,
+    )
+    for ticker in missing:
+        latest[ticker] = next(
+            (date for date in dates if os.path.isdir(snapshot_path(ticker, date))),
+            None,
+        )
+    return latest
+
+
+def has_snapshot(ticker, date=None):
+    """Check whether a snapshot exists for the ticker and date."""
+    return os.path.isdir(snapshot_path(ticker, date))
+
+
+def list_sections(ticker, date=None):
+    """Names of all sections stored in a snapshot."""
+    return sorted(section for section, _, _ in section_files(ticker, date))
+
+
+def section_files(ticker, date=None):
+    """(section, kind, path) of every section stored in a snapshot."""
+    date = date or today()
+    sections = _sections(ticker, date)
+    if sections is not None:
+        return [
+            (section, "value" if ref.endswith(VALUE) else "table", object_path(ref))
+            for section, ref in sections.items()
+        ]
+    path = snapshot_path(ticker, date)
+    files = [
+        (os.path.basename(fname)[: -len(".parquet")], "table", fname)
+        for fname in glob(f"{path}/*.parquet")
+    ]
+    files += [
+        (section, "value", f"{path}/{META_FILE}")
+        for section in _read_meta(ticker, date)
+    ]
+    return files
+
+
+def section_file(ticker, section, date=None):
+    """File a section is read from, its object for content addressed snapshots."""
+    date = date or today()
+    sections = _sections(ticker, date)
+    if sections is not None:
+        if section not in sections:
+            raise KeyError(f"No section {section} for {ticker} on {date}")
+        return object_path(sections[section])
+    fname = section_path(ticker, section, date)
+    if os.path.exists(fname):
+        return fname
+    return f"{snapshot_path(ticker, date)}/{META_FILE}"
+
+
+def _as_date(name):
+    """A column name as a Timestamp, or None when it isn't a date."""
+    try:
+        return pd.Timestamp(name)
+    except ValueError:
+        return None
+
+
+def _in_range(names, start, end):
+    """Names that aren't dates, or dates between `start` and `end`."""
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) + pd.Timedelta(days=1) if end is not None else None
+    picked = []
+    for name in names:
+        when = _as_date(name)
+        if when is not None:
+            when = when.tz_localize(None)
+            if (start is not None and when < start) or (
+                end is not None and when >= end
+            ):
+                continue
+        picked.append(name)
+    return picked
+
+
+def _read_range(fname, columns, start, end):
+    """
+    Read the rows (or date columns) of a Parquet section between two dates.
+
+    Time series keep their dates in the index, the range is pushed down to
+    Parquet as a filter so only the matching row groups are read. Statements
+    have one column per period instead, only those columns are read.
+    """
+    schema = pq.read_schema(fname)
+    index = (schema.pandas_metadata or {}).get("index_columns") or []
+    index = index[0] if len(index) == 1 and isinstance(index[0], str) else None
+
+    if index is not None and pa.types.is_timestamp(schema.field(index).type):
+        tz = schema.field(index).type.tz
+        filters = []
+        if start is not None:
+            filters.append((index, ">=", pd.Timestamp(start).tz_localize(tz)))
+        if end is not None:
+            stop = pd.Timestamp(end).tz_localize(tz) + pd.Timedelta(days=1)
+            filters.append((index, "<", stop))
+        return pd.read_parquet(fname, columns=columns, filters=filters or None)
+
+    names = columns or [name for name in schema.names if name != index]
+    return pd.read_parquet(fname, columns=_in_range(names, start, end))
+
+
+def _frame_range(frame, columns, start, end):
+    """Same selection as `_read_range`, on a table already in memory."""
+    if columns is not None:
+        frame = frame[columns]
+    if start is None and end is None:
+        return frame
+    if isinstance(frame.index, pd.DatetimeIndex):
+        tz = frame.index.tz
+        if start is not None:
+            frame = frame[frame.index >= pd.Timestamp(start).tz_localize(tz)]
+        if end is not None:
+            stop = pd.Timestamp(end).tz_localize(tz) + pd.Timedelta(days=1)
+            frame = frame[frame.index < stop]
+        return frame
+    return frame[_in_range(list(frame.columns), start, end)]
+
+
+def _read_legacy_section(ticker, section, date, columns, start, end):
+    fname = section_path(ticker, section, date)
+    if os.path.exists(fname):
+        if start is None and end is None:
+            return pd.read_parquet(fname, columns=columns)
+        return _read_range(fname, columns, start, end)
+
+    meta = _read_meta(ticker, date)
+    if section not in meta:
+        raise KeyError(f"No section {section} for {ticker} on {date}")
+    return meta[section]
+
+
+def read_section(ticker, section, date=None, columns=None, start=None, end=None):
+    """
+    Read one section of a ticker snapshot, only the requested part of it.
+
+    Parameters:
+        ticker (str): The stock ticker.
+        section (str): Section name, ex. ``1mo_hist`` or ``info``.
+        date (str): Snapshot date, defaults to the latest available.
+        columns (list): Only read these columns of a tabular section, or these
+            keys of a dict section.
+        start (str): Only rows (or period columns) on or after this date.
+        end (str): Only rows (or period columns) on or before this date.
+
+    Returns:
+        DataFrame for tabular sections, the stored value otherwise.
+    """
+    date = date or latest_date(ticker)
+    if date is None:
+        raise FileNotFoundError(f"No snapshot for {ticker}")
+
+    sections = _sections(ticker, date)
+    if sections is None:
+        value = _read_legacy_section(ticker, section, date, columns, start, end)
+    elif section not in sections:
+        raise KeyError(f"No section {section} for {ticker} on {date}")
+    else:
+        ref = sections[section]
+        if ref.endswith(TABLE) and not ref.endswith(DELTA):
+            if start is None and end is None:
+                return pd.read_parquet(object_path(ref), columns=columns)
+            return _read_range(object_path(ref), columns, start, end)
+        value = _load_object(ref)
+        if isinstance(value, pd.DataFrame):
+            return _frame_range(value, columns, start, end)
+
+    if columns and isinstance(value, dict):
+        value = {key: value[key] for key in columns if key in value}
+    return value
+
+
+def read_snapshot(ticker, date=None):
+    """Read every section of a ticker snapshot into a dict."""
+    date = date or latest_date(ticker)
+    if date is None or not has_snapshot(ticker, date):
+        raise FileNotFoundError(f"No snapshot for {ticker} on {date}")
+
+    sections = _sections(ticker, date)
+    if sections is not None:
+        return {section: _load_object(ref) for section, ref in sections.items()}
+
+    data = _read_meta(ticker, date)
+    for fname in glob(f"{snapshot_path(ticker, date)}/*.parquet"):
+        section = os.path.basename(fname)[: -len(".parquet")]
+        data[section] = pd.read_parquet(fname)
+    return data
+
+
+def list_snapshots():
+    """All stored (date, ticker) snapshots."""
+    snapshots = []
+    for path in glob(f"{STORE_DIR}/date=*/ticker=*"):
+        date = os.path.basename(os.path.dirname(path))[len("date=") :]
+        ticker = os.path.basename(path)[len("ticker=") :]
+        snapshots.append({"date": date, "ticker": ticker})
+    return sorted(snapshots, key=lambda snap: (snap["date"], snap["ticker"]))
+
+
+def import_legacy_json(fname):
+    """Import a legacy ``{date}-{ticker}.json`` snapshot into the store."""
+    base = os.path.basename(fname)[: -len(".json")]
+    date, ticker = base[:10], base[11:]
+    legacy = codec.read_json(fname)
+
+    data = {}
+    for section, value in legacy.items():
+        # Tables were stored as nested `DataFrame.to_json()` strings
+        if isinstance(value, str) and value.startswith("{"):
+            try:
+                value = pd.read_json(StringIO(value))
+            except ValueError:
+                pass
+        data[section] = value
+    return write_snapshot(ticker, data, date)
+
+
+def migrate_legacy():
+    """Import every legacy JSON snapshot under MIDAS_DATA_DIR."""
+    for fname in sorted(glob(f"{MIDAS_DATA_DIR}/????-??-??-*.json")):
+        try:
+            import_legacy_json(fname)
+        except (ValueError, OSError) as err:
+            logger.error("Error importing %s - %s", fname, err)
+
+
+def compact_legacy():
+    """
+    Move the legacy snapshots (one file per section) into the object store.
+
+    Snapshots are moved oldest first so changed tables become deltas over the
+    previous day.
+    """
+    for snap in list_snapshots():
+        ticker, date = snap["ticker"], snap["date"]
+        if _sections(ticker, date) is not None:
+            continue
+        try:
+            write_snapshot(ticker, {}, date)
+        except (ValueError, OSError, pa.ArrowException) as err:
+            logger.error("Error compacting %s %s - %s", ticker, date, err)
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--migrate",
+        help="Import the legacy JSON snapshots into the store.",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--compact",
+        help="Move the legacy snapshots into the content addressed object store.",
+        action="store_true",
+        default=False,
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    if args.migrate:
+        migrate_legacy()
+    if args.compact:
+        compact_legacy()
@@ -0,0 +1,37 @@
+"""Test setup: the modules read their settings at import, point them at scratch data."""
+
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+import pytest
+
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="midas-tests-")
+os.environ.setdefault("ALPHA_VANTAGE_API_KEY", "test")
+os.makedirs(f"{os.environ['DATA_DIR']}/MIDAS", exist_ok=True)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class Clock:
+    """A `datetime` stand-in whose `now()` is moved by the test."""
+
+    current = datetime(2025, 3, 3, 23, 59)
+
+    @classmethod
+    def now(cls, tz=None):  # pylint: disable=unused-argument
+        return cls.current
+
+    @classmethod
+    def set(cls, value):
+        cls.current = value
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Freeze the date `store.today()` returns, the test moves it with `set`."""
+    import store  # pylint: disable=import-outside-toplevel
+
+    Clock.set(datetime(2025, 3, 3, 23, 59))
+    monkeypatch.setattr(store, "datetime", Clock)
+    return Clock
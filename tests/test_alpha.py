@@ -0,0 +1,29 @@
+"""Alpha Vantage quota notes are told apart from empty results."""
+
+import os
+
+import shared
+
+
+def run(monkeypatch, prefix, result):
+    monkeypatch.setattr(shared, "fetch_alpha_vantage_data", lambda params, f: result)
+    calls = [shared.alpha_call("OVERVIEW", f"{prefix}{pos}") for pos in range(2)]
+    return shared.run_alpha_schedule(calls)
+
+
+def test_empty_result_is_not_the_quota(clock, monkeypatch):
+    data = run(monkeypatch, "EMPTY", {})
+
+    assert set(data) == {"EMPTY0", "EMPTY1"}
+    assert shared.alpha_quota_left() == shared.ALPHA_QUOTA_DAY - 2
+
+
+def test_note_exhausts_the_quota(clock, monkeypatch):
+    clock.set(clock.current.replace(day=10))
+    data = run(monkeypatch, "NOTE", {"Note": "Thank you for using Alpha Vantage!"})
+
+    assert not data
+    assert shared.alpha_quota_left() == 0
+    assert not [
+        name for name in os.listdir(shared.ALPHA_DATA_DIR) if name.endswith(".tmp")
+    ]
@@ -0,0 +1,92 @@
+"""Snapshot responses are cached by mtime and answered with 304 when unchanged."""
+
+import os
+
+from fastapi.testclient import TestClient
+
+import store
+from api import api
+from api.cache import SnapshotCache
+
+client = TestClient(api.app)
+
+
+def bump(path, secs=10):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + secs * 10**9))
+
+
+def test_cache_hits_until_the_file_changes(tmp_path):
+    path = tmp_path / "snapshot"
+    path.write_text("v1")
+    cache = SnapshotCache(1024)
+    loads = []
+
+    def load():
+        loads.append(1)
+        return path.read_bytes()
+
+    assert cache.get(str(path), load) == b"v1"
+    assert cache.get(str(path), load) == b"v1"
+    assert (cache.hits, cache.misses, len(loads)) == (1, 1, 1)
+
+    path.write_text("v2")
+    bump(path)
+    assert cache.get(str(path), load) == b"v2"
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert cache.size == 2
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    paths = []
+    for name in "abc":
+        paths.append(tmp_path / name)
+        paths[-1].write_text(name)
+    cache = SnapshotCache(20)
+
+    cache.get(str(paths[0]), lambda: b"x" * 8)
+    cache.get(str(paths[1]), lambda: b"y" * 8)
+    cache.get(str(paths[0]), lambda: b"unused")
+    cache.get(str(paths[2]), lambda: b"z" * 8)
+
+    assert list(cache.entries) == [str(paths[0]), str(paths[2])]
+    assert cache.size == 16
+
+
+def test_symbol_etag_and_not_modified():
+    store.write_snapshot("APIE", {"info": {"price": 1}})
+
+    first = client.get("/symbol/APIE")
+    assert first.status_code == 200
+    assert first.json()["info"] == {"price": 1}
+    etag = first.headers["etag"]
+
+    cached = client.get("/symbol/APIE", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["etag"] == etag
+    since = client.get(
+        "/symbol/APIE", headers={"If-Modified-Since": first.headers["last-modified"]}
+    )
+    assert since.status_code == 304
+
+    store.write_snapshot("APIE", {"info": {"price": 2}})
+    bump(store.snapshot_path("APIE"))
+    changed = client.get("/symbol/APIE", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert changed.json()["info"] == {"price": 2}
+
+
+def test_section_etag_depends_on_the_parameters():
+    store.write_snapshot("APIS", {"info": {"price": 1, "name": "S"}})
+
+    full = client.get("/symbol/APIS/info")
+    some = client.get("/symbol/APIS/info?columns=price")
+
+    assert some.json() == {"price": 1}
+    assert full.headers["etag"] != some.headers["etag"]
+    unchanged = client.get(
+        "/symbol/APIS/info?columns=price",
+        headers={"If-None-Match": some.headers["etag"]},
+    )
+    assert unchanged.status_code == 304
@@ -0,0 +1,76 @@
+"""The benchmark harness runs offline against the stand-in."""
+
+import glob
+import json
+import os
+import subprocess
+import sys
+
+import standin
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_bench(bench_dir, *args):
+    env = dict(os.environ, BENCH_DIR=str(bench_dir))
+    env.pop("BENCH_FIXTURES", None)
+    env.pop("BENCH_RESULTS", None)
+    return subprocess.run(
+        [sys.executable, "bench.py", *args],
+        cwd=REPO_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=600,
+        check=False,
+    )
+
+
+def test_missing_recordings_exit_cleanly(tmp_path):
+    result = run_bench(tmp_path)
+
+    assert result.returncode == 0
+    assert "record them first" in result.stderr
+    assert not os.path.exists(tmp_path / "results.jsonl")
+
+
+def test_missing_recordings_fail_the_check(tmp_path):
+    result = run_bench(tmp_path, "--check")
+
+    assert result.returncode == 1
+    assert "record them first" in result.stderr
+    assert "Traceback" not in result.stderr
+
+
+def test_replay_against_the_standin(tmp_path):
+    fixtures = tmp_path / "fixtures"
+    fixtures.mkdir()
+    (fixtures / "tickers.json").write_text(json.dumps(["AAPL"]))
+    quote = {"Global Quote": {"01. symbol": "AAPL", "05. price": "227.5"}}
+    standin.record(
+        str(fixtures),
+        "https://www.alphavantage.co/query?function=GLOBAL_QUOTE&symbol=AAPL",
+        200,
+        "application/json",
+        json.dumps(quote).encode(),
+    )
+
+    result = run_bench(
+        tmp_path,
+        "--skip-dashboard",
+        "--delay",
+        "0",
+        "--requests",
+        "20",
+        "--concurrency",
+        "2",
+    )
+
+    assert result.returncode == 0, result.stderr
+    with open(tmp_path / "results.jsonl", "r", encoding="utf-8") as src_file:
+        entry = json.loads(src_file.readline())
+    assert entry["tickers"] == ["AAPL"]
+    for name in ("stocks_per_min", "alpha_calls_per_min", "api_p50_ms"):
+        assert name in entry["results"]
+    alpha_dir = tmp_path / "data" / "MIDAS" / "alphavantage"
+    assert glob.glob(f"{alpha_dir}/*-AAPL-GLOBAL_QUOTE.json*")
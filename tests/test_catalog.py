@@ -0,0 +1,64 @@
+"""The catalog indexes stored data: entries, latest-only series, pages and sizes."""
+
+import pandas as pd
+
+import catalog
+import store
+
+
+def test_record_and_filter(tmp_path):
+    path = tmp_path / "result.json"
+    path.write_text("{}")
+    catalog.record("2025-01-02", "CATR", "OVERVIEW", "alphavantage", str(path))
+    catalog.record("2025-01-03", "CATR", "OVERVIEW", "alphavantage", str(path))
+    catalog.record("2025-01-03", "CATR", "EARNINGS", "alphavantage", str(path))
+
+    page = catalog.query(ticker="CATR", section="OVERVIEW")
+    assert page["total"] == 2
+    assert [item["date"] for item in page["items"]] == ["2025-01-03", "2025-01-02"]
+    assert page["items"][0]["size"] == 2
+    assert catalog.query(ticker="CATR", start="2025-01-03")["total"] == 2
+    assert catalog.query(ticker="CATR", end="2025-01-02")["total"] == 1
+
+
+def test_latest_only_keeps_one_date(tmp_path):
+    path = tmp_path / "CATL.parquet"
+    path.write_bytes(b"bars")
+    for day in ("2025-01-02", "2025-01-03", "2025-01-06"):
+        catalog.record(day, "CATL", "history", "history", str(path), latest_only=True)
+
+    items = catalog.query(ticker="CATL", kind="history")["items"]
+    assert [item["date"] for item in items] == ["2025-01-06"]
+
+
+def test_snapshots_are_paginated_newest_first():
+    days = [f"2025-02-0{day}" for day in range(1, 6)]
+    for pos, day in enumerate(days):
+        store.write_snapshot("CATP", {"info": {"price": pos}}, day)
+
+    pages = [
+        catalog.snapshots(limit=2, offset=offset, ticker="CATP") for offset in (0, 2, 4)
+    ]
+
+    assert {page["total"] for page in pages} == {5}
+    listed = [item["date"] for page in pages for item in page["items"]]
+    assert listed == days[::-1]
+
+
+def test_sizes_count_deduplicated_objects_once():
+    frame = pd.DataFrame({"Close": range(100)}, dtype=float)
+    for day in ("2025-03-03", "2025-03-04"):
+        store.write_snapshot("CATS", {"hist": frame, "info": {"name": "S"}}, day)
+
+    def sizes():
+        return {
+            item["date"]: item["size"]
+            for item in catalog.snapshots(ticker="CATS")["items"]
+        }
+
+    written = sizes()
+    assert written["2025-03-03"] > 0
+    assert written["2025-03-04"] == 0
+
+    catalog.rebuild()
+    assert sizes() == written
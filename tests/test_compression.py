@@ -0,0 +1,39 @@
+"""Responses the middleware could have compressed always vary on Accept-Encoding."""
+
+from fastapi import FastAPI, Response
+from fastapi.testclient import TestClient
+
+from api.compression import CompressionMiddleware
+
+app = FastAPI()
+app.add_middleware(CompressionMiddleware)
+
+
+@app.get("/large")
+def large():
+    return Response(b"x" * 4096, media_type="text/plain")
+
+
+@app.get("/small")
+def small():
+    return Response(b"x", media_type="text/plain", headers={"Vary": "Origin"})
+
+
+client = TestClient(app)
+
+
+def test_compressed_response_varies():
+    response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+
+
+def test_uncompressed_responses_vary():
+    response = client.get("/large", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert len(response.content) == 4096
+
+    response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Origin, Accept-Encoding"
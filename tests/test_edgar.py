@@ -0,0 +1,66 @@
+"""Per-form SEC jobs share one filing list per company and skip what's on disk."""
+
+import edgar
+import filings
+import worker_sec
+
+CIK = "0000000042"
+SUBMISSIONS = {
+    "filings": {
+        "recent": {
+            "accessionNumber": ["0042-25-000003", "0042-25-000002", "0042-25-000001"],
+            "form": ["8-K", "10-Q", "8-K"],
+            "primaryDocument": ["", "", ""],
+            "filingDate": ["2025-03-03", "2025-02-03", "2025-01-03"],
+        }
+    }
+}
+
+
+class Response:
+    def __init__(self, data=None, content=b""):
+        self.data, self.content = data, content
+
+    def json(self):
+        return self.data
+
+
+def fake_sec(monkeypatch):
+    requested = []
+
+    def get(url):
+        requested.append(url)
+        if url.endswith("company_tickers.json"):
+            return Response({"0": {"ticker": "LIST", "cik_str": 42}})
+        if "/submissions/" in url:
+            return Response(SUBMISSIONS)
+        return Response(content=b"FILED AS OF DATE: 20250303\n")
+
+    monkeypatch.setattr(edgar, "_get", get)
+    monkeypatch.setattr(edgar, "_CIKS", {})
+    monkeypatch.setattr(edgar, "_LISTINGS", edgar.OrderedDict())
+    return requested
+
+
+def test_form_jobs_share_the_listing_and_skip_known_filings(monkeypatch):
+    requested = fake_sec(monkeypatch)
+    filings.record("LIST", "8-K", "0042-25-000001")
+
+    assert worker_sec.get_sec_filing("LIST", "8-K", limit=2) == ["0042-25-000003"]
+    assert worker_sec.get_sec_filing("LIST", "10-Q", limit=2) == ["0042-25-000002"]
+    assert worker_sec.get_sec_filing("LIST", "8-K", limit=2) == []
+
+    assert len([url for url in requested if "/submissions/" in url]) == 1
+    archives = [url for url in requested if "/Archives/" in url]
+    assert len(archives) == 2
+    assert not any("0042-25-000001" in url for url in archives)
+
+
+def test_listing_is_fetched_again_when_stale(monkeypatch):
+    requested = fake_sec(monkeypatch)
+
+    edgar.recent_filings(CIK)
+    edgar.recent_filings(CIK)
+    edgar.recent_filings(CIK, max_age=0)
+
+    assert len([url for url in requested if "/submissions/" in url]) == 2
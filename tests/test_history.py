@@ -0,0 +1,111 @@
+"""Incremental history syncs stay consistent across corporate actions."""
+
+import pandas as pd
+
+import history
+import ratelimit
+
+
+def bars(days, close, splits=None):
+    index = pd.DatetimeIndex(days, tz="America/New_York")
+    return pd.DataFrame(
+        {
+            "Open": close,
+            "High": close,
+            "Low": close,
+            "Close": close,
+            "Volume": [1000] * len(days),
+            "Dividends": [0.0] * len(days),
+            "Stock Splits": splits or [0.0] * len(days),
+        },
+        index=index,
+    )
+
+
+class FakeTicker:
+    """A `yf.Ticker` stand-in returning canned bars per `start`."""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.calls = []
+
+    def history(self, start=None, end=None, period=None):
+        self.calls.append(start)
+        return self.responses[start]
+
+
+class NoLimit:
+    def acquire(self, tokens=1):
+        pass
+
+
+def test_split_refetches_the_adjusted_series(monkeypatch):
+    monkeypatch.setattr(ratelimit, "limiter", lambda name: NoLimit())
+    days = ["2025-03-03", "2025-03-04", "2025-03-05"]
+    history.save_history("SPLT", bars(days, [100.0, 102.0, 104.0]))
+
+    # 2:1 split on the 6th, the provider now serves every earlier bar halved
+    new = bars(["2025-03-05", "2025-03-06"], [52.0, 53.0], splits=[0.0, 2.0])
+    refetched = bars(
+        days + ["2025-03-06"], [50.0, 51.0, 52.0, 53.0], [0.0, 0.0, 0.0, 2.0]
+    )
+    stock_ticker = FakeTicker({"2025-03-05": new, "2025-03-03": refetched})
+
+    result = history.sync_history("SPLT", stock_ticker=stock_ticker)
+
+    assert stock_ticker.calls == ["2025-03-05", "2025-03-03"]
+    assert result["Close"].tolist() == [50.0, 51.0, 52.0, 53.0]
+    assert history.load_history("SPLT")["Close"].tolist() == [50.0, 51.0, 52.0, 53.0]
+
+
+def test_refetch_only_fills_gaps_after_the_stored_bars(monkeypatch):
+    monkeypatch.setattr(ratelimit, "limiter", lambda name: NoLimit())
+    # the provider has no bars for the week of the 10th, an old known hole
+    days = ["2025-03-03", "2025-03-04", "2025-03-17"]
+    history.save_history("SPGP", bars(days, [100.0, 102.0, 104.0]))
+
+    new = bars(["2025-03-17", "2025-03-18"], [52.0, 53.0], splits=[0.0, 2.0])
+    refetched = bars(
+        days + ["2025-03-18"], [50.0, 51.0, 52.0, 53.0], [0.0, 0.0, 0.0, 2.0]
+    )
+    stock_ticker = FakeTicker({"2025-03-17": new, "2025-03-03": refetched})
+
+    result = history.sync_history("SPGP", stock_ticker=stock_ticker)
+
+    assert stock_ticker.calls == ["2025-03-17", "2025-03-03"]
+    assert result["Close"].tolist() == [50.0, 51.0, 52.0, 53.0]
+
+
+def test_known_split_does_not_refetch(monkeypatch):
+    monkeypatch.setattr(ratelimit, "limiter", lambda name: NoLimit())
+    days = ["2025-03-03", "2025-03-04"]
+    history.save_history("KNWN", bars(days, [50.0, 51.0], splits=[0.0, 2.0]))
+
+    new = bars(["2025-03-04", "2025-03-05"], [51.0, 52.0], splits=[2.0, 0.0])
+    stock_ticker = FakeTicker({"2025-03-04": new})
+
+    result = history.sync_history("KNWN", stock_ticker=stock_ticker)
+
+    assert stock_ticker.calls == ["2025-03-04"]
+    assert result["Close"].tolist() == [50.0, 51.0, 52.0]
+
+
+def test_batch_download_pays_a_token_per_ticker(monkeypatch):
+    class Bucket(NoLimit):
+        capacity = 5
+        taken = 0
+
+        def acquire(self, tokens=1):
+            Bucket.taken += tokens
+
+    def download(tickers, **kwargs):
+        assert kwargs["threads"] <= Bucket.capacity
+        frames = {ticker: bars(["2025-03-03"], [1.0]) for ticker in tickers}
+        return pd.concat(frames, axis=1)
+
+    monkeypatch.setattr(ratelimit, "limiter", lambda name: Bucket())
+    monkeypatch.setattr(history.yf, "download", download)
+    tickers = [f"BAT{pos}" for pos in range(7)]
+
+    assert history.sync_history_batch(tickers, chunk_size=4) == 7
+    assert Bucket.taken == 7
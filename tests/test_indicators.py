@@ -0,0 +1,76 @@
+"""The saved indicator state gives the same latest values as ``compute()``."""
+
+import numpy as np
+import pandas as pd
+
+import indicators
+
+
+def series(closes, start="2025-01-01"):
+    closes = np.asarray(closes, dtype=float)
+    index = pd.bdate_range(start, periods=len(closes), tz="America/New_York")
+    return pd.DataFrame(
+        {"Open": closes, "High": closes * 1.01, "Low": closes * 0.99, "Close": closes},
+        index=index,
+    )
+
+
+def computed(bars):
+    """Last row of the vectorized indicators of one series."""
+    # holes forward filled, like load_panel() does
+    panel = {
+        field: bars[[field]].rename(columns={field: "T"}).tz_localize(None).ffill()
+        for field in indicators.FIELDS
+    }
+    return indicators.compute(panel).xs("T", axis=1, level="ticker").iloc[-1]
+
+
+def assert_matches(values, bars):
+    expected = computed(bars)
+    for name, value in values.items():
+        np.testing.assert_allclose(value, expected[name], rtol=1e-9, err_msg=name)
+
+
+def test_split_rebuilds_the_state():
+    rng = np.random.default_rng(7)
+    closes = 100 + np.cumsum(rng.normal(0, 1, 60))
+    indicators.sync_state("STSPLT", series(closes))
+
+    # 10:1 split: the provider re-adjusts every earlier bar, same dates
+    adjusted = series(np.append(closes / 10, closes[-1] / 10 + 0.2))
+    values = indicators.sync_state("STSPLT", adjusted)
+
+    assert_matches(values, adjusted)
+    assert values["sma_20"] < 20
+
+
+def test_incremental_appends_match_compute():
+    rng = np.random.default_rng(3)
+    bars = series(50 + np.cumsum(rng.normal(0, 1, 260)))
+
+    # the daily sync: the last bar is re-fetched and may change, then one more
+    values = indicators.sync_state("STEQ", bars.iloc[:30])
+    for end in range(31, len(bars) + 1):
+        revised = bars.iloc[:end].copy()
+        revised.iloc[-2, revised.columns.get_loc("Close")] *= 1.001
+        indicators.sync_state("STEQ", revised.iloc[:-1])
+        values = indicators.sync_state("STEQ", bars.iloc[:end])
+        if end % 50 == 0:
+            assert_matches(values, bars.iloc[:end])
+    assert_matches(values, bars)
+
+
+def test_state_survives_a_restart_with_missing_prices():
+    rng = np.random.default_rng(5)
+    closes = 20 + np.cumsum(rng.normal(0, 0.5, 120))
+    closes[[40, 41, 90]] = np.nan
+    bars = series(closes)
+
+    state = indicators.IndicatorState()
+    for when, row in zip(bars.index[:70], bars[["High", "Low", "Close"]].values):
+        state.update(*row, when.isoformat())
+    restored = indicators.IndicatorState.from_dict(state.to_dict())
+    for when, row in zip(bars.index[70:], bars[["High", "Low", "Close"]].values[70:]):
+        restored.update(*row, when.isoformat())
+
+    assert_matches(restored.values(), bars)
@@ -0,0 +1,88 @@
+"""Replicas share queues through leases: claim, heartbeat, expiry and reclaim."""
+
+import time
+
+import scheduler
+
+
+def as_node(monkeypatch, node):
+    monkeypatch.setattr(scheduler, "NODE_ID", node)
+
+
+def lease(queue, item):
+    return scheduler._execute(  # pylint: disable=protected-access
+        "SELECT owner, lease_until FROM work WHERE queue = ? AND item = ?",
+        (queue, scheduler._encode(item)),  # pylint: disable=protected-access
+    )[0]
+
+
+def test_replicas_claim_disjoint_items_by_priority(monkeypatch):
+    items = {("HELD",): scheduler.HELD, ("IDX",): scheduler.INDEX}
+    items.update({(f"T{pos}",): scheduler.TAIL for pos in range(3)})
+    scheduler.sync("claims", items, 3600)
+
+    as_node(monkeypatch, "node-a")
+    first = scheduler.claim(["claims"], 2)
+    as_node(monkeypatch, "node-b")
+    second = scheduler.claim(["claims"], 10)
+
+    assert first == [("claims", ("HELD",)), ("claims", ("IDX",))]
+    assert sorted(item for _, item in second) == [("T0",), ("T1",), ("T2",)]
+    assert scheduler.claim(["claims"], 10) == []
+    assert scheduler.status("claims")["running"] == 5
+
+
+def test_heartbeat_extends_only_own_leases(monkeypatch):
+    scheduler.sync("beats", {("A",): scheduler.TAIL}, 3600)
+    as_node(monkeypatch, "node-a")
+    [(queue, item)] = scheduler.claim(["beats"], 1)
+    _, until = lease(queue, item)
+
+    time.sleep(0.01)
+    assert scheduler.renew([(queue, item)]) == []
+    assert lease(queue, item)[1] > until
+
+    as_node(monkeypatch, "node-b")
+    assert scheduler.renew([(queue, item)]) == [(queue, item)]
+    assert lease(queue, item)[0] == "node-a"
+
+
+def test_expired_lease_is_reclaimed(monkeypatch):
+    scheduler.sync("expiry", {("A",): scheduler.TAIL}, 3600)
+    as_node(monkeypatch, "node-a")
+    [(queue, item)] = scheduler.claim(["expiry"], 1)
+
+    # node-a stops heartbeating, node-b takes the item once the lease ran out
+    as_node(monkeypatch, "node-b")
+    assert scheduler.claim(["expiry"], 1) == []
+    later = time.time() + scheduler.LEASE_TTL + 1
+    assert scheduler.claim(["expiry"], 1, now=later) == [(queue, item)]
+    assert lease(queue, item)[0] == "node-b"
+
+    # the late result of node-a doesn't touch node-b's lease
+    as_node(monkeypatch, "node-a")
+    scheduler.done(queue, item)
+    assert lease(queue, item)[0] == "node-b"
+
+    as_node(monkeypatch, "node-b")
+    scheduler.done(queue, item)
+    assert lease(queue, item) == (None, None)
+    assert scheduler.status("expiry") == {
+        "total": 1,
+        "due": 0,
+        "running": 0,
+        "failing": 0,
+    }
+
+
+def test_failed_item_is_retried_with_backoff(monkeypatch):
+    scheduler.sync("retry", {("A",): scheduler.TAIL}, 3600)
+    as_node(monkeypatch, "node-a")
+    [(queue, item)] = scheduler.claim(["retry"], 1)
+
+    start = time.time()
+    scheduler.done(queue, item, err=ValueError("boom"))
+
+    due = scheduler.next_due(["retry"])
+    assert start + scheduler.RETRY_DELAY <= due <= time.time() + scheduler.RETRY_DELAY
+    assert scheduler.status("retry")["failing"] == 1
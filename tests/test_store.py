@@ -0,0 +1,155 @@
+"""Content addressed snapshots: dedup, deltas, range reads and legacy layouts."""
+
+import os
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import codec
+import store
+
+
+def prices(days, start="2024-01-01"):
+    index = pd.date_range(start, periods=days, freq="D", tz="America/New_York")
+    index.name = "Date"
+    values = np.arange(days * 4, dtype=float).reshape(days, 4)
+    return pd.DataFrame(values, index=index, columns=["Open", "High", "Low", "Close"])
+
+
+def dates(count):
+    first = date(2024, 6, 3)
+    return [(first + timedelta(days=day)).isoformat() for day in range(count)]
+
+
+def refs(ticker, day):
+    return store._sections(ticker, day)  # pylint: disable=protected-access
+
+
+def test_delta_round_trip():
+    frame = prices(400)
+    expected = {}
+    for pos, day in enumerate(dates(10)):
+        # one new bar a day and an older bar rewritten (late correction)
+        frame = pd.concat([frame, prices(1, frame.index[-1] + pd.Timedelta(days=1))])
+        frame.iloc[pos * 7, 3] = -float(pos)
+        store.write_snapshot("DELTA", {"hist": frame}, day)
+        expected[day] = frame.copy()
+
+    kinds = [refs("DELTA", day)["hist"].endswith(store.DELTA) for day in dates(10)]
+    assert kinds[0] is False and any(kinds)
+    # a chain never grows past DELTA_CHAIN, the next write starts over
+    assert not all(kinds[1 : store.DELTA_CHAIN + 2])
+    for day, frame in expected.items():
+        pd.testing.assert_frame_equal(
+            store.read_snapshot("DELTA", day)["hist"], frame, check_freq=False
+        )
+        pd.testing.assert_frame_equal(
+            store.read_section("DELTA", "hist", day), frame, check_freq=False
+        )
+
+
+def test_unchanged_sections_are_stored_once():
+    data = {"hist": prices(30), "info": {"price": 10, "name": "Dedup"}}
+    first, second = dates(2)
+    store.write_snapshot("DEDUP", data, first)
+    objects = sorted(os.listdir(store.OBJECTS_DIR))
+    count = sum(len(os.listdir(f"{store.OBJECTS_DIR}/{d}")) for d in objects)
+
+    store.write_snapshot("DEDUP", data, second)
+
+    assert refs("DEDUP", first) == refs("DEDUP", second)
+    after = sum(
+        len(os.listdir(f"{store.OBJECTS_DIR}/{d}"))
+        for d in os.listdir(store.OBJECTS_DIR)
+    )
+    assert after == count
+    assert store.read_section("DEDUP", "info", second) == data["info"]
+
+
+def test_read_section_range_of_rows():
+    frame = prices(1000)
+    first, second = dates(2)
+    store.write_snapshot("RANGE", {"hist": frame}, first)
+    changed = frame.copy()
+    changed.iloc[-1, 0] = 0.0
+    store.write_snapshot("RANGE", {"hist": changed}, second)
+    # the second day is a delta, read in memory instead of pushed down
+    assert refs("RANGE", second)["hist"].endswith(store.DELTA)
+
+    for day, source in ((first, frame), (second, changed)):
+        rows = store.read_section(
+            "RANGE",
+            "hist",
+            day,
+            columns=["Close"],
+            start="2024-01-10",
+            end="2024-01-19",
+        )
+        assert list(rows.columns) == ["Close"]
+        assert len(rows) == 10
+        assert rows.index[0] == source.index[9]
+        assert rows.index[-1] == source.index[18]
+
+
+def test_read_section_range_of_period_columns():
+    periods = pd.to_datetime(["2023-03-31", "2023-06-30", "2023-09-30", "2023-12-31"])
+    statement = pd.DataFrame(
+        np.ones((2, 4)), index=["Revenue", "Net Income"], columns=periods
+    )
+    store.write_snapshot("STMT", {"income": statement}, dates(1)[0])
+
+    picked = store.read_section("STMT", "income", start="2023-06-01", end="2023-09-30")
+
+    assert [pd.Timestamp(col) for col in picked.columns] == list(periods[1:3])
+    assert list(picked.index) == ["Revenue", "Net Income"]
+
+
+def write_legacy(ticker, day, frame, meta):
+    path = store.snapshot_path(ticker, day)
+    os.makedirs(path, exist_ok=True)
+    store.write_table(frame, store.section_path(ticker, "hist", day))
+    codec.write_json(f"{path}/{store.META_FILE}", meta)
+
+
+def test_legacy_partitions_are_read_and_compacted():
+    first, second = dates(2)
+    frame = prices(1000)
+    changed = frame.copy()
+    changed.iloc[5, 1] = -1.0
+    write_legacy("LEGC", first, frame, {"info": {"price": 1}})
+    write_legacy("LEGC", second, changed, {"info": {"price": 2}})
+
+    assert refs("LEGC", first) is None
+    assert store.read_section("LEGC", "info", second) == {"price": 2}
+    pd.testing.assert_frame_equal(
+        store.read_snapshot("LEGC", first)["hist"], frame, check_freq=False
+    )
+
+    store.compact_legacy()
+
+    assert refs("LEGC", second)["hist"].endswith(store.DELTA)
+    assert not os.path.exists(store.section_path("LEGC", "hist", first))
+    for day, source, price in ((first, frame, 1), (second, changed, 2)):
+        snapshot = store.read_snapshot("LEGC", day)
+        pd.testing.assert_frame_equal(snapshot["hist"], source, check_freq=False)
+        assert snapshot["info"] == {"price": price}
+
+
+def test_migrate_legacy_json():
+    frame = pd.DataFrame({"Close": [1.0, 2.0]}, index=[0, 1])
+    legacy = {"info": {"price": 3}, "hist": frame.to_json()}
+    codec.write_json(f"{store.MIDAS_DATA_DIR}/2024-05-02-LEGJ.json", legacy)
+
+    store.migrate_legacy()
+
+    snapshot = store.read_snapshot("LEGJ", "2024-05-02")
+    assert snapshot["info"] == {"price": 3}
+    assert snapshot["hist"]["Close"].tolist() == [1.0, 2.0]
+
+
+def test_missing_section():
+    store.write_snapshot("MISS", {"info": {}}, dates(1)[0])
+    with pytest.raises(KeyError):
+        store.read_section("MISS", "hist")
@@ -0,0 +1,43 @@
+"""Long running workers roll over to a new day without a restart."""
+
+from datetime import datetime
+
+import pandas as pd
+
+import shared
+import store
+
+
+def test_snapshots_roll_over_at_midnight(clock):
+    store.write_snapshot("ROLL", {"info": {"price": 1}})
+    assert store.latest_date("ROLL") == "2025-03-03"
+
+    clock.set(datetime(2025, 3, 4, 0, 1))
+    store.write_snapshot("ROLL", {"info": {"price": 2}})
+    assert store.has_snapshot("ROLL", "2025-03-04")
+    assert store.latest_date("ROLL") == "2025-03-04"
+    assert store.read_snapshot("ROLL")["info"] == {"price": 2}
+    assert store.read_snapshot("ROLL", "2025-03-03")["info"] == {"price": 1}
+
+
+def test_fetch_stock_data_writes_the_new_day(clock, monkeypatch):
+    def fetch_sections(stock_ticker, names):
+        return {name: pd.DataFrame({"x": [1]}) for name in names}
+
+    monkeypatch.setattr(shared, "fetch_sections", fetch_sections)
+    shared.fetch_stock_data("ROLLF", force=True)
+    assert store.latest_date("ROLLF") == "2025-03-03"
+
+    clock.set(datetime(2025, 3, 4, 0, 1))
+    shared.fetch_stock_data("ROLLF", force=True)
+    assert store.latest_date("ROLLF") == "2025-03-04"
+
+
+def test_alpha_quota_resets_the_next_day(clock):
+    shared._use_alpha_quota(exhausted=True)
+    assert shared.alpha_quota_left() == 0
+
+    clock.set(datetime(2025, 3, 4, 0, 1))
+    assert shared.alpha_quota_left() == shared.ALPHA_QUOTA_DAY
+    shared._use_alpha_quota()
+    assert shared.alpha_quota_left() == shared.ALPHA_QUOTA_DAY - 1
@@ -0,0 +1,83 @@
+"""The ticker universe: our own picks plus the S&P 500 list.
+
+Kept apart from ``shared`` so the dashboard can read it without importing the
+data providers.
+"""
+
+import logging
+import os
+
+import pandas as pd
+
+import httpclient
+import ratelimit
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.getenv("DATA_DIR", "/data")
+
+OTHER_STOCKS = [
+    "RXT",
+    "FXAIX",
+    "VGT",
+    "VIG",
+    "VOO",
+    "VTI",
+    "VFAIX",
+    "VEA",
+    "GLD",
+    "VNQ",
+    "MUB",
+    "ADT",
+]
+OTHER_STOCKS = [
+    "RXT",
+]
+
+
+def refresh_sp500():
+    """Refresh the sp500 from Wikipedia"""
+    url = "https://en.wikipedia.org/wiki/List_of_S%26P_500_companies"
+
+    # Set a User-Agent to mimic a web browser
+    headers = {
+        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
+        "AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/91.0.4472.101 Safari/537.3"
+    }
+    fname = f"{DATA_DIR}/500.csv"
+
+    if os.path.exists(fname):
+        logger.info("File exists %s", fname)
+        return
+
+    # Fetch the page content
+    ratelimit.limiter("wikipedia").acquire()
+    response = httpclient.get(url, headers=headers)
+
+    # Use pandas to read the HTML tables
+    tables = pd.read_html(response.text)
+    sp500_table = tables[0]
+
+    # Save the table to a CSV file
+
+    sp500_table.to_csv(fname, index=False)
+    logger.info("Wrote %s", fname)
+
+
+def get_sp500_tickers(refresh=True):
+    """
+    get the sp500 tickers
+
+    With `refresh` False only the local 500.csv is read, never Wikipedia, and
+    an empty list is returned when it doesn't exist yet.
+    """
+    if refresh:
+        refresh_sp500()
+    try:
+        csv_data = pd.read_csv(f"{DATA_DIR}/500.csv", index_col="Symbol")
+        return [symbol[0] for symbol in csv_data.iterrows()]
+    except FileNotFoundError as e:
+        logger.error("Error reading 500.csv, exiting %s", e)
+        csv_data = None
+        return []
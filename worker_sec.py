@@ -1,38 +1,23 @@
 """SEC Data Downloader."""
 
 import argparse
-import concurrent.futures
 import logging
 import os
-import sys
-import time
-from glob import glob
-from random import shuffle
 
-import pandas as pd
-from sec_edgar_downloader import Downloader
-
-from shared import OTHER_STOCKS, fetch_stock_data, get_sp500_tickers, refresh_sp500
+import edgar
+import filings
+import metrics
+import scheduler
+from universe import OTHER_STOCKS, get_sp500_tickers, refresh_sp500
 
+# Every (form, ticker) is synced at least this often once the queue keeps up
 WORKER_POLL_FREQ = (6) * (60 * 60)  # hrs * mins * secs
-DATA_DIR = os.getenv("DATA_DIR", "/data")
 
-WORKERS = int(os.getenv("WORKERS", "1"))
-WORKER_START_WAIT = 1  # force a 1s wait before we start
-WORKER_END_WAIT = 5
+WORKERS = int(os.getenv("WORKERS", "16"))
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
-# Download filings to the current working directory
-dl = Downloader("Personal", "fixme@example.com", DATA_DIR)
-
-refresh_sp500()
-
-# CSV_DATA = pd.read_csv(f"{DATA_DIR}/500.csv", index_col="Symbol")
-# SP500_LIST = [symbol[0] for symbol in CSV_DATA.iterrows()]
-SP500_LIST = get_sp500_tickers()
-
 # Trimming the list as we are grabbing too much data right now.
 FORMS = ["13F-HR", "13F-NT", "10-K", "10-Q", "8-K", "3", "4", "5", "144"]
 # FORMS = ["13F-HR", "10-K", "10-Q"]
@@ -63,23 +48,33 @@ for f in get_available_forms():
 
 
 def get_sec_filing(ticker, form, limit=4):
-    """Get SEC data."""
-    base = f"{DATA_DIR}/sec-edgar-filings/{ticker}/{form}/*"
-    files = glob(base)
-    # print(files)
-    if len(files) >= limit:
-        logger.debug("Form(s) %s already present for %s", form, ticker)
-        return "OK"
-    else:
-        logger.debug("Downloading %s for %s", form, ticker)
+    """
+    Download the latest filings of a form that aren't in the inventory yet.
 
+    The company's filing list is shared by the jobs of all its forms, only the
+    missing accessions are downloaded.
+
+    Returns:
+        list: The newly downloaded accession numbers.
+    """
+    logger.debug("Syncing %s for %s", form, ticker)
     try:
-        time.sleep(WORKER_START_WAIT)
-        dl.get(form, ticker, download_details=True, include_amends=True, limit=limit)
-        logger.debug("Got data for %s for %s", form, ticker)
-        time.sleep(WORKER_END_WAIT)
+        new = edgar.sync_ticker(ticker, [form], limit=limit).get(form, [])
     except Exception as e:
         logger.error("Error downloading %s for %s - %s", form, ticker, e)
+        return []
+    logger.debug("Got %s new %s filings for %s", len(new), form, ticker)
+    return new
+
+
+def get_form_job(form, ticker):
+    """Download one (form, ticker) job of the batch."""
+    return get_sec_filing(ticker, form, limit=4 * 2)
+
+
+def sync_sec_filings(ticker):
+    """Sync all forms of a ticker at the accession level."""
+    return edgar.sync_ticker(ticker, get_available_forms(), limit=4 * 2)
 
 
 def generate_list(tickers):
@@ -92,12 +87,39 @@ def generate_list(tickers):
     return data
 
 
+def add_queues(sched, args):
+    """Register (or re-sync) the SEC queue with the current universe."""
+    refresh_sp500()
+    sp500 = get_sp500_tickers()
+    index = set(sp500)
+    tickers = list(dict.fromkeys(OTHER_STOCKS + sp500))
+    if args.sync:
+        # one item per ticker, the filing list covers all forms of a company
+        items = {
+            (ticker,): scheduler.ticker_priority(ticker, index) for ticker in tickers
+        }
+        job_func = sync_sec_filings
+    else:
+        items = {
+            (form, ticker): scheduler.ticker_priority(ticker, index)
+            for form, ticker in generate_list(tickers)
+        }
+        job_func = get_form_job
+    sched.add("sec", job_func, items, WORKER_POLL_FREQ, provider="sec")
+
+
 def parse_args():
     """Parse command line arguments."""
     parser = argparse.ArgumentParser()
     parser.add_argument(
-        "--shuffle",
-        help="Shuffle the list of tickers and SEC forms.",
+        "--sync",
+        help="Sync per ticker, only downloading accessions not on disk yet.",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--once",
+        help="Exit once nothing is due instead of running continuously.",
         action="store_true",
         default=False,
     )
@@ -116,35 +138,8 @@ def parse_args():
 if __name__ == "__main__":
     # TICKERS = ['AAPL','RXT', 'ADBE', 'AMZN']
     args = parse_args()
-    TICKERS = OTHER_STOCKS + SP500_LIST
-    batch = generate_list(TICKERS)
-    logger.debug("Batch count: %s", len(batch))
-    batch_count = len(batch)
-    if args.shuffle:
-        logger.info("Shuffling the batch to randomize things....")
-        shuffle(batch)
-    if len(batch) > 0:
-        with concurrent.futures.ThreadPoolExecutor(max_workers=WORKERS) as executor:
-            future_to_url = {
-                executor.submit(get_sec_filing, job[1], job[0], limit=4 * 2): job
-                for job in batch
-            }
-            for future in concurrent.futures.as_completed(future_to_url):
-                url = future_to_url[future]
-                try:
-                    data = future.result()
-                    logger.debug(data)
-                    batch_count -= 1
-                    logger.warning(
-                        "Jobs left in batch - %s/%s", batch_count, len(batch)
-                    )
-
-                except RuntimeWarning as exc:
-                    logger.error("%r generated an exception: %s", url, exc)
-
-    logger.info(
-        "Worker jobs done - sleeping for %s (%s h)",
-        WORKER_POLL_FREQ,
-        ((WORKER_POLL_FREQ) / 60 / 60),
-    )
-    time.sleep(WORKER_POLL_FREQ)
+    filings.build_inventory()
+    metrics.serve()
+    sched = scheduler.Scheduler(WORKERS)
+    add_queues(sched, args)
+    sched.run(refresh=lambda sched: add_queues(sched, args), once=args.once)
@@ -1,72 +1,100 @@
-"""SEC Data Downloader."""
+"""Stock data worker.
 
-import concurrent.futures
+Runs continuously: the scheduler refreshes every ticker of the universe (held
+positions first) as soon as it is due again, at the rate yfinance allows.
+"""
+
+import argparse
 import logging
-import sys
-import time
-import pandas as pd
-from sec_edgar_downloader import Downloader
 import os
 
-from shared import OTHER_STOCKS, fetch_stock_data, refresh_sp500, get_sp500_tickers
+import history
+import macro
+import metrics
+import scheduler
+from shared import fetch_stock_data
+from universe import OTHER_STOCKS, get_sp500_tickers, refresh_sp500
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
-WORKERS = int(os.getenv("WORKERS", "1"))
-WORKER_WAIT = 60
+WORKERS = int(os.getenv("WORKERS", "16"))
 POLL_HOURS = 12
+# Every ticker is refreshed at least this often once the queue keeps up
 WORKER_POLL_FREQ = POLL_HOURS * (60 * 60)
 
-refresh_sp500()
-
 # NAS Location as we have TBs of data over time....
 DATA_DIR = os.getenv("DATA_DIR", "/data")
-SP500_LIST = get_sp500_tickers()
 
 
-def generate_batch(tickers):
-    """Generate list of tickers to download."""
-    data = []
-    for ticker in tickers:
-        data.append(("form", ticker))
+def universe_tickers():
+    """Our own picks plus the S&P 500, and the S&P 500 members."""
+    refresh_sp500()
+    sp500 = get_sp500_tickers()
+    return list(dict.fromkeys(OTHER_STOCKS + sp500)), set(sp500)
 
-    return data
 
+def add_queues(sched, args):
+    """Register (or re-sync) the queues of the worker with the current universe."""
+    tickers, index = universe_tickers()
+    logger.info("%s tickers in the universe", len(tickers))
 
-if __name__ == "__main__":
-    TICKERS = OTHER_STOCKS + SP500_LIST
-    batch = generate_batch(TICKERS)
-    logger.info(len(batch))
-
-    batch_count = len(TICKERS)
-    if len(TICKERS) > 0:
-        with concurrent.futures.ThreadPoolExecutor(max_workers=WORKERS) as executor:
-            future_to_url = {
-                executor.submit(
-                    fetch_stock_data,
-                    ticker,
-                ): ticker
-                for ticker in TICKERS
-            }
-            for future in concurrent.futures.as_completed(future_to_url):
-                url = future_to_url[future]
-                try:
-                    data = future.result()
-                    logger.debug(data)
-                    batch_count -= 1
-                    logger.info(
-                        "Stock Grab Jobs left in batch - %s/%s",
-                        batch_count,
-                        len(TICKERS),
-                    )
+    if args.batch or args.prices_only:
+        sched.add(
+            "prices",
+            lambda _: history.sync_history_batch(tickers),
+            {("universe",): scheduler.HELD},
+            WORKER_POLL_FREQ,
+            provider="yfinance",
+        )
+    if args.prices_only:
+        return
+    sched.add(
+        "macro",
+        lambda _: macro.refresh(),
+        {("fred",): scheduler.INDEX},
+        macro.MACRO_MAX_AGE,
+        provider="fred",
+    )
+    sched.add(
+        "stocks",
+        fetch_stock_data,
+        {(ticker,): scheduler.ticker_priority(ticker, index) for ticker in tickers},
+        WORKER_POLL_FREQ,
+        provider="yfinance",
+        # the batched download leaves only the fundamentals to fetch per ticker
+        after="prices",
+    )
 
-                except RuntimeWarning as exc:
-                    logger.error("%r generated an exception: %s", url, exc)
 
-    logger.info(
-        "Worker jobs done - sleeping for %s (%s h)",
-        WORKER_POLL_FREQ,
-        ((WORKER_POLL_FREQ) / 60 / 60),
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--batch",
+        help="Sync price history for all tickers with chunked multi-symbol "
+        "downloads before the per-ticker fundamentals lane.",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--prices-only",
+        help="Only run the batched price history lane.",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--once",
+        help="Exit once nothing is due instead of running continuously.",
+        action="store_true",
+        default=False,
     )
-    time.sleep(WORKER_POLL_FREQ)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    metrics.serve()
+    sched = scheduler.Scheduler(WORKERS)
+    add_queues(sched, args)
+    sched.run(refresh=lambda sched: add_queues(sched, args), once=args.once)